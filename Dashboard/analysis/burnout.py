@@ -1,44 +1,40 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from utils.data import DB_PATH,cache_on_db,compact_frame,load_employees,load_time_entries as load_entries
 
-def load_time_entries(db_path="timekeeping.db"):
-    # load time entries from db
-    conn=sqlite3.connect(db_path)
-    query="""
-    SELECT T.employee_id,E.name,T.date,T.hours_worked
-    FROM time_entries T
-    JOIN employees E ON T.employee_id=E.employee_id
-    """
-    df=pd.read_sql_query(query,conn)
-    conn.close()
-    df['date']=pd.to_datetime(df['date'])
-    df['day_of_week']=df['date'].dt.dayofweek
-    return df
+def load_time_entries(db_path=DB_PATH):
+    # time entries with employee names, compact dtypes from the shared loader (parquet snapshot
+    # if there is one, else the db, cached), names as a categorical
+    df=load_entries(db_path)[['employee_id','date','hours_worked']]
+    names=load_employees(db_path)[['employee_id','name']].astype({'employee_id':'int32'})
+    df=df.merge(names,on='employee_id')[['employee_id','name','date','hours_worked']]
+    return compact_frame(df)
 
 def compute_daily_summary(df):
-    # calculate daily summary
-    df_daily=df.groupby(['employee_id','name','date']).agg({'hours_worked':'sum'}).reset_index()
-    df_daily['overtime']=df_daily['hours_worked'].apply(lambda x:max(0,x-8))
+    # calculate daily summary, one row per employee per day
+    df_daily=df.groupby(['employee_id','name','date'],observed=True)['hours_worked'].sum().reset_index()
+    df_daily['overtime']=(df_daily['hours_worked']-8).clip(lower=0)
     df_daily['weekday']=df_daily['date'].dt.dayofweek
     df_daily['is_weekend']=df_daily['weekday']>=5
     return df_daily
 
-def compute_monthly_excess(df,baseline=7.5*5*4):
-    # calculate monthly excess
-    df_monthly=df.copy()
-    df_monthly['month']=df_monthly['date'].dt.to_period("M").astype(str)
-    monthly_hours=df_monthly.groupby(['employee_id','name','month'])['hours_worked'].sum().reset_index()
-    monthly_hours['excess']=monthly_hours['hours_worked'].apply(lambda x:max(0,x-baseline))
-    avg_excess=monthly_hours.groupby(['employee_id','name'])['excess'].mean().reset_index()
-    avg_excess=avg_excess.rename(columns={'excess':'avg_monthly_excess'})
+def compute_monthly_hours(df_daily):
+    # hours per employee per month, doesnt depend on the baseline
+    month=df_daily['date'].to_numpy().astype('datetime64[M]')
+    return df_daily.assign(month=month).groupby(['employee_id','name','month'],observed=True)['hours_worked'].sum().reset_index()
+
+def compute_monthly_excess(monthly_hours,baseline=7.5*5*4):
+    # calculate monthly excess over the baseline, averaged per employee
+    excess=(monthly_hours['hours_worked']-baseline).clip(lower=0)
+    avg_excess=excess.groupby([monthly_hours['employee_id'],monthly_hours['name']],observed=True).mean().reset_index()
+    avg_excess=avg_excess.rename(columns={'hours_worked':'avg_monthly_excess'})
     return avg_excess
 
-def compute_burnout_metrics(df_daily,df_time,baseline=7.5*5*4):
-    # calculate burnout metrics
-    agg_metrics=df_daily.groupby(['employee_id','name']).agg(
-        total_days=('date','nunique'),
+def compute_employee_totals(df_daily):
+    # per employee totals from the daily summary, doesnt depend on the baseline
+    agg_metrics=df_daily.groupby(['employee_id','name'],observed=True).agg(
+        total_days=('date','size'), # daily summary has one row per date
         total_hours=('hours_worked','sum'),
         total_overtime=('overtime','sum'),
         weekend_days=('is_weekend','sum')
@@ -46,8 +42,12 @@ def compute_burnout_metrics(df_daily,df_time,baseline=7.5*5*4):
     agg_metrics['avg_daily_hours']=agg_metrics['total_hours']/agg_metrics['total_days']
     agg_metrics['avg_daily_overtime']=agg_metrics['total_overtime']/agg_metrics['total_days']
     agg_metrics['weekend_frequency']=agg_metrics['weekend_days']/agg_metrics['total_days']
-    avg_excess=compute_monthly_excess(df_time,baseline)
-    agg_metrics=agg_metrics.merge(avg_excess,on=["employee_id","name"],how="left")
+    return agg_metrics
+
+def score_burnout(totals,monthly_hours,baseline=7.5*5*4):
+    # the only step that depends on the baseline, works on per employee/per month rows
+    avg_excess=compute_monthly_excess(monthly_hours,baseline)
+    agg_metrics=totals.merge(avg_excess,on=["employee_id","name"],how="left")
     agg_metrics['avg_monthly_excess']=agg_metrics['avg_monthly_excess'].fillna(0)
     agg_metrics['burnout_score']=(
          agg_metrics['avg_daily_overtime']+
@@ -63,11 +63,25 @@ def compute_burnout_metrics(df_daily,df_time,baseline=7.5*5*4):
 
     return agg_metrics
 
-def get_burnout_analysis(db_path="timekeeping.db",baseline=7.5*5*4):
-    # load entries and compute burnout
+def compute_burnout_metrics(df_daily,baseline=7.5*5*4):
+    # calculate burnout metrics
+    return score_burnout(compute_employee_totals(df_daily),compute_monthly_hours(df_daily),baseline)
+
+@cache_on_db
+def load_burnout_base(db_path=DB_PATH):
+    # daily summary reduced to per employee totals and per employee/month hours,
+    # cached until the db changes so a new baseline only reruns score_burnout
     df_time=load_time_entries(db_path)
     if df_time.empty:
-        return pd.DataFrame()
+        return pd.DataFrame(),pd.DataFrame()
     df_daily=compute_daily_summary(df_time)
-    burnout_metrics=compute_burnout_metrics(df_daily,df_time,baseline)
-    return burnout_metrics
+    # sums in float64 past the float32 entries, names back to plain strings for the small frames
+    df_daily=df_daily.astype({'employee_id':'int64','name':str,'hours_worked':'float64','overtime':'float64'})
+    return compute_employee_totals(df_daily),compute_monthly_hours(df_daily)
+
+def get_burnout_analysis(db_path=DB_PATH,baseline=7.5*5*4):
+    # load entries and compute burnout
+    totals,monthly_hours=load_burnout_base(db_path)
+    if totals.empty:
+        return pd.DataFrame()
+    return score_burnout(totals,monthly_hours,baseline)
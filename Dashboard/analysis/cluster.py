@@ -1,25 +1,29 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import QuantileTransformer, FunctionTransformer
 from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from sklearn.metrics import silhouette_score
 from sklearn.pipeline import make_pipeline
+from joblib import Parallel,delayed
+from utils.data import DB_PATH,query,cache_on_db
 
 
-def load_project_features(db_path):
-    conn=sqlite3.connect(db_path)
+FEATURE_COLS=["total_billable_cost","percent_complete","fee_earned_to_date","fee_as_per_contract","amount_left_to_bill",
+    "target_fees_per_hour","actual_fees_per_hour","floor_area","cost_per_sq_ft","construction_budget","number_of_units"]
 
-    query_cost="""SELECT T.project_no,SUM(T.hours_worked*E.billable_rate) AS total_billable_cost FROM time_entries T
-    JOIN employees E ON T.employee_id=E.employee_id GROUP BY T.project_no"""
-    df_cost=pd.read_sql_query(query_cost,conn)
+def load_project_features(db_path=DB_PATH):
+
+    query_cost="""SELECT R.project_no,SUM(R.hours*E.billable_rate) AS total_billable_cost FROM monthly_project_hours R
+    JOIN employees E ON R.employee_id=E.employee_id GROUP BY R.project_no"""
+    df_cost=query(query_cost,db_path=db_path)
 
     query_financial="""SELECT project_no,percent_complete,fee_earned_to_date,fee_as_per_contract,
         amount_left_to_bill,target_fees_per_hour,actual_fees_per_hour,floor_area,cost_per_sq_ft,
         construction_budget,number_of_units FROM financial_data"""
-    df_fin=pd.read_sql_query(query_financial,conn)
-    conn.close()
+    df_fin=query(query_financial,db_path=db_path)
     #print(df_fin.describe())
 
 
@@ -50,35 +54,56 @@ def log_transform_skewed(X):
 
     return Xc
 
-def run_kmeans(db_path,n_clusters=3):
-    df=load_project_features(db_path)
-    feature_cols=["total_billable_cost","percent_complete","fee_earned_to_date","fee_as_per_contract","amount_left_to_bill",
-        "target_fees_per_hour","actual_fees_per_hour","floor_area","cost_per_sq_ft","construction_budget","number_of_units"]
+# the preprocessing, the PCA projection and KMeans for every k in the sweep are cached until
+# the db changes, so moving the k slider only picks a different cached fit
+K_MAX=10
 
-    X=df[feature_cols].values
+@cache_on_db
+def preprocess_features(db_path=DB_PATH):
+    # returns features df,transformed data,2D PCA coords and the fitted preprocessing pipeline
+    df=load_project_features(db_path)
+    X=df[FEATURE_COLS].values
     log_transformer = FunctionTransformer(log_transform_skewed,validate=False)
 
-    pipeline=make_pipeline(
+    preprocessor=make_pipeline(
         SimpleImputer(strategy="mean"),
         log_transformer,
-        QuantileTransformer(output_distribution="normal"),
-        KMeans(n_clusters=n_clusters)
+        QuantileTransformer(output_distribution="normal",n_quantiles=min(1000,len(X)))
     )
-    pipeline.fit(X)
+    # this is the transformed data after all preprocessing steps
+    data_scaled=preprocessor.fit_transform(X)
+
+    #PCA for 2D visualization
+    pca=PCA(n_components=2,random_state=42)
+    pca_coords=pca.fit_transform(data_scaled)
+    return df,data_scaled,pca_coords,preprocessor
+
+def fit_k(data_scaled,k):
+    kmeans=KMeans(n_clusters=k,n_init=10,random_state=42).fit(data_scaled)
+    # silhouette needs 2 to n-1 clusters
+    silhouette=silhouette_score(data_scaled,kmeans.labels_) if 1<k<len(data_scaled) else np.nan
+    return kmeans,kmeans.inertia_,silhouette
+
+@cache_on_db
+def cluster_sweep(db_path=DB_PATH,k_max=K_MAX,n_jobs=-1):
+    # KMeans for k=1..k_max in parallel, returns (k,inertia,silhouette) rows and the fitted model per k
+    df,data_scaled,pca_coords,preprocessor=preprocess_features(db_path)
+    ks=list(range(1,min(k_max,len(data_scaled))+1))
+    # threads, KMeans does its work outside the GIL and the dashboard shouldnt fork
+    fits=Parallel(n_jobs=n_jobs,prefer="threads")(delayed(fit_k)(data_scaled,k) for k in ks)
+    summary=pd.DataFrame({"k":ks,"inertia":[f[1] for f in fits],"silhouette":[f[2] for f in fits]})
+    models={k:f[0] for k,f in zip(ks,fits)}
+    return summary,models
+
+def run_kmeans(db_path=DB_PATH,n_clusters=3):
+    df,data_scaled,pca_coords,preprocessor=preprocess_features(db_path)
+    summary,models=cluster_sweep(db_path)
+    # k outside the sweep is fitted on its own
+    kmeans=models[n_clusters] if n_clusters in models else fit_k(data_scaled,n_clusters)[0]
 
     # retrieve cluster labels from the KMeans step
-    kmeans_step=pipeline.named_steps["kmeans"]
-
-    #print(labels.shape)
-    #print(labels[:10])
-    labels=kmeans_step.labels_
-
-    # transform the data using the pipeline
-    # this is the transformed data after all preprocessing steps
-    # it was a pain to get this into make_pipeline format
-    X_imputed=pipeline.named_steps["simpleimputer"].transform(X)
-    X_logged= pipeline.named_steps["functiontransformer"].transform(X_imputed)
-    data_scaled=pipeline.named_steps["quantiletransformer"].transform(X_logged)
+    labels=kmeans.labels_
+    pipeline=make_pipeline(*[step for name,step in preprocessor.steps],kmeans)
 
     df["cluster_label"] =labels
     # returns the transformed data after all preprocessing steps,labels,pipeline
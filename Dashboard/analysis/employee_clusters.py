@@ -1,43 +1,69 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 from sklearn.pipeline import make_pipeline
+from utils.data import DB_PATH,query,cache_on_db
 
+# the usage features and a fitted model for every k on the page's slider are cached until the db
+# changes, so other widgets on the page (and the slider) dont refit anything
+K_RANGE=range(2,7)
 
-# load annual usage data from database
-def load_annual_usage(db_path="../timekeeping.db"):
-    conn=sqlite3.connect(db_path)
-    billable=pd.read_sql("""SELECT e.employee_id,e.name,e.position,SUM(t.hours_worked) AS billable_hours
-        FROM time_entries t JOIN employees e USING(employee_id) GROUP BY e.employee_id""",conn)
-    nonbill=pd.read_sql("""SELECT n.employee_id,SUM(n.hours_worked) AS non_billable_hours
-        FROM non_billable_entries n GROUP BY n.employee_id""",conn)
-    conn.close()
-
-    # merge billable and non-billable data
-    # outer join to include all employees?????
-    df=pd.merge(billable,nonbill,on="employee_id",how="outer").fillna(0)
+def usage_features(df):
+    # percentages and log hours for lifetime or per year rows, all columns at once
     df['total_hours']=df['billable_hours']+df['non_billable_hours']
     df['total_hours']=df['total_hours'].replace(0,1) # div by zero
     df['billable_pct']=df['billable_hours']/df['total_hours']
     df['non_billable_pct']=df['non_billable_hours']/df['total_hours']
     df["is_senior"]=df["position"].str.contains("Senior|Principal",na=False).astype(int)
+    df['log_total_hours']=np.log1p(df['total_hours'])
     return df
 
+# load annual usage data from database
+@cache_on_db
+def load_annual_usage(db_path=DB_PATH,per_year=False):
+    # hours per employee from the monthly_employee_hours rollup, per employee and year if per_year
+    # (one GROUP BY for every employee-year)
+    year=",substr(R.month,1,4) AS year" if per_year else ""
+    group=",year" if per_year else ""
+    sql=f"""SELECT R.employee_id,E.name,E.position{year},
+        SUM(IFNULL(R.billable_hours,0)) AS billable_hours,SUM(IFNULL(R.non_billable_hours,0)) AS non_billable_hours
+        FROM monthly_employee_hours R LEFT JOIN employees E ON R.employee_id=E.employee_id
+        GROUP BY R.employee_id{group} ORDER BY R.employee_id{group}"""
+    return usage_features(query(sql,db_path=db_path))
+
 # cluster data into groups
 def cluster_data(df,n_clusters=3):
-    df['log_total_hours']=np.log1p(df['total_hours'])
+    if 'log_total_hours' not in df:
+        df['log_total_hours']=np.log1p(df['total_hours'])
     X =df[['billable_pct','log_total_hours']]
     #print(X.shape)
     pipeline=make_pipeline(
         StandardScaler(),
-        KMeans(n_clusters=n_clusters)
+        KMeans(n_clusters=n_clusters,n_init=10,random_state=42)
     )
-    # fit and predict
-    #pipeline.fit(X)
     # add cluster labels to original dataframe
     df['cluster']=pipeline.fit_predict(X)
     # return kmeans model
     km=pipeline.steps[-1][1]
-    return df,km
\ No newline at end of file
+    return df,km
+
+@cache_on_db
+def cluster_usage(db_path=DB_PATH,per_year=False):
+    # usage rows with a cluster_<k> label column for every k in K_RANGE, and the model per k
+    df=load_annual_usage(db_path,per_year)
+    models={}
+    for k in K_RANGE:
+        if k>len(df):
+            break
+        df,models[k]=cluster_data(df,n_clusters=k)
+        df[f'cluster_{k}']=df.pop('cluster')
+    return df,models
+
+def get_usage_clusters(db_path=DB_PATH,n_clusters=3,per_year=False):
+    # same as cluster_data(load_annual_usage()) but served from the cached fits
+    df,models=cluster_usage(db_path,per_year)
+    if n_clusters not in models:
+        return cluster_data(df,n_clusters)
+    df['cluster']=df[f'cluster_{n_clusters}']
+    return df,models[n_clusters]
@@ -1,7 +1,13 @@
-import sqlite3
 import pandas as pd
 import numpy as np
+import os
 import re
+import sqlite3
+import argparse
+import hashlib
+import tempfile
+import joblib
+import streamlit as st
 from datetime import datetime
 import matplotlib.pyplot as plt
 from sklearn.pipeline import make_pipeline
@@ -9,6 +15,7 @@ from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestRegressor
 import plotly.graph_objects as go
+from utils.data import DB_PATH,query
 
 # clean project number
 def clean_project_no(project_no):
@@ -17,25 +24,26 @@ def clean_project_no(project_no):
     m=re.match(r'(\d+)',s)
     return m.group(1)if m else s
 
-# get monthly expenditure
-def get_monthly_expenditure(project_no,db_path="../timekeeping.db"):
-    conn=sqlite3.connect(db_path)
-    query=f"""
-      SELECT strftime('%Y-%m',T.date)AS month,
-             SUM(T.hours_worked*CAST(E.billable_rate AS INTEGER))AS total_expenditure
-      FROM time_entries T
-      JOIN employees E ON T.employee_id=E.employee_id
-      WHERE T.project_no='{project_no}'
-      GROUP BY month
-      ORDER BY month;
-    """
-    df=pd.read_sql_query(query,conn)
-    conn.close()
-    
-    if df.empty:
-        print(f"No data found for project {project_no}")
-        return pd.DataFrame()
-    
+# models are trained once per project per data version and stored with joblib next to the db
+# (forecast_models/), so the dashboard only trains when a project's monthly series changed
+# train every project ahead of time with: python -m analysis.forecasting [db] [--n-jobs N] (from Dashboard/)
+MODEL_VERSION=1 # bump when the features or the pipeline change, stored models are retrained
+N_LAGS=5 # months of expenditure each prediction looks back on (lag_1..lag_5)
+FEATURES=['month_index']+[f'lag_{i}'for i in range(1,N_LAGS+1)]
+BACKTEST_MONTHS=3 # months held out for the MAPE stored with each model
+EXPENDITURE_SQL="""
+  SELECT R.project_no,R.month,
+         SUM(R.hours*CAST(E.billable_rate AS INTEGER))AS total_expenditure
+  FROM monthly_project_hours R
+  JOIN employees E ON R.employee_id=E.employee_id
+  {where}
+  GROUP BY R.project_no,R.month
+  ORDER BY R.project_no,R.month;
+"""
+
+def prepare_expenditure(df):
+    # month,total_expenditure rows -> ds,expenditure,month_index
+    df=df.copy()
     df['expenditure']=df['total_expenditure']
     df['ds']=pd.to_datetime(df['month']+"-01")
     
@@ -47,109 +55,314 @@ def get_monthly_expenditure(project_no,db_path="../timekeeping.db"):
     df['month_index']=np.arange(1,len(df)+1)
     return df
 
-def last_n_months(df,n=5):
+# get monthly expenditure
+def get_monthly_expenditure(project_no,db_path=DB_PATH):
+    # from the monthly_project_hours rollup (hours per project/month/employee)
+    df=query(EXPENDITURE_SQL.format(where="WHERE R.project_no=?"),(project_no,),db_path=db_path)
+    
+    if df.empty:
+        print(f"No data found for project {project_no}")
+        return pd.DataFrame()
+    return prepare_expenditure(df)
+
+def last_n_months(df,n=N_LAGS):
     for i in range(1,n+1):
         df[f'lag_{i}']=df['expenditure'].shift(i)
     df=df.dropna().reset_index(drop=True)
     return df
 
-# forecast expenditure
-def forecast_expenditure(project_no,forecast_period=3,db_path="timekeeping.db"):
-    df=get_monthly_expenditure(project_no,db_path)
-    #print(df.shape)
-    if df.empty or len(df)<5:
-        print("Not enough data to forecast.")
+def fit_forecaster(df):
+    # fit the pipeline on the lagged series, None if there arent enough months for one lagged row
+    df_lnm=last_n_months(df.copy())
+    if df_lnm.empty:
         return None
-
-    df_lnm=last_n_months(df.copy(),n=5)
-    # sorry about the for loop
-    features=['month_index']+[f'lag_{i}'for i in range(1,6)]
-    X=df_lnm[features]
-    y=df_lnm['expenditure']
-    
     #like in class:
     pipeline=make_pipeline(
         SimpleImputer(strategy='median'),
         StandardScaler(),
         RandomForestRegressor(n_estimators=200)
     )
-    # fit the model
-    #print(X.shape,y.shape)
-    pipeline.fit(X,y)
+    pipeline.fit(df_lnm[FEATURES],df_lnm['expenditure'])
+    return pipeline
 
-    # predict future values
+def predict_ahead(pipeline,df,periods):
+    # predict future values, each prediction becomes a lag for the next month
     forecasts=[]
     last_month_index=df['month_index'].iloc[-1]
-    last_expenditures=df['expenditure'].iloc[-5:].values.tolist()
+    last_expenditures=df['expenditure'].iloc[-N_LAGS:].values.tolist()
     
-    for i in range(1,forecast_period+1):
+    for i in range(1,periods+1):
         # for each month in the forecast period
         # create new month index and features
-
-        #print(last_expenditures)
         new_index=last_month_index+i
-        new_features=np.array([new_index]+last_expenditures).reshape(1,-1)
+        new_features=pd.DataFrame([[new_index]+last_expenditures],columns=FEATURES)
         y_pred=pipeline.predict(new_features)[0]
-        #print(y_pred)
         # append new pred
         forecasts.append(y_pred)
         # pop the first element and append the new pred
         last_expenditures.pop(0)
         last_expenditures.append(y_pred)
+    return forecasts
+
+def backtest_mape(df,test_period=3):
+    # split data into train and test sets, fit on the train months and forecast the last test_period
+    # the train months need N_LAGS months of history plus one to have a single lagged row
+    if len(df)<N_LAGS+1+test_period:
+        return None
+    train_df=df.iloc[:len(df)-test_period].copy()
+    test_df=df.iloc[len(df)-test_period:].reset_index(drop=True)
+    pipeline=fit_forecaster(train_df)
+    if pipeline is None:
+        return None
+    forecast_array=np.array(predict_ahead(pipeline,train_df,test_period))
+    actual_array=test_df['expenditure'].values[:test_period]
+
+    # https://en.wikipedia.org/wiki/Mean_absolute_percentage_error
+    return np.mean(np.abs(forecast_array-actual_array)/np.abs(actual_array))*100
+
+def data_version(df):
+    # changes whenever the project's monthly series (or MODEL_VERSION) does
+    hashed=pd.util.hash_pandas_object(df[['ds','expenditure']],index=False).values
+    return f"{MODEL_VERSION}-{hashlib.sha1(hashed.tobytes()).hexdigest()}"
+
+def train_entry(df):
+    # model and backtest for one series, what gets stored per project
+    pipeline=fit_forecaster(df)
+    if pipeline is None:
+        return None
+    return {'version':data_version(df),'model':pipeline,'mape':backtest_mape(df,BACKTEST_MONTHS)}
+
+def model_path(project_no,db_path=DB_PATH):
+    model_dir=os.path.join(os.path.dirname(os.path.abspath(db_path)),"forecast_models")
+    return os.path.join(model_dir,re.sub(r'[^\w.-]','_',str(project_no))+".joblib")
+
+def load_entry(path,version):
+    # stored entry if it was trained on this version of the data
+    if not os.path.exists(path):
+        return None
+    try:
+        entry=joblib.load(path)
+    except Exception as e:
+        print(f"Could not load {path}: {e}")
+        return None
+    return entry if entry.get('version')==version else None
+
+def save_entry(path,entry):
+    model_dir=os.path.dirname(path)
+    os.makedirs(model_dir,exist_ok=True)
+    # a temp file of its own, so two writers of the same model cant interleave or replace each other's
+    fd,tmp=tempfile.mkstemp(dir=model_dir,suffix=".tmp")
+    os.close(fd)
+    try:
+        joblib.dump(entry,tmp)
+        os.replace(tmp,path) # a reader never sees half a file
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+@st.cache_resource(show_spinner="Training the forecast model...")
+def cached_entry(path,version,_df):
+    # stored or newly trained entry, one per project and data version for the whole server
+    # (so a forecast click doesnt reload the file). sessions asking for the same one while it
+    # trains wait for it instead of training it again
+    entry=load_entry(path,version)
+    if entry is None:
+        entry=train_entry(_df)
+        if entry is not None:
+            save_entry(path,entry)
+    return entry
+
+def get_forecaster(project_no,db_path=DB_PATH):
+    # (monthly series, entry) for the project, the entry is trained and stored only if
+    # there isnt one for this version of the data
+    df=get_monthly_expenditure(project_no,db_path)
+    if df.empty or len(df)<N_LAGS:
+        return df,None
+    return df,cached_entry(model_path(project_no,db_path),data_version(df),df)
+
+# forecast expenditure
+def forecast_expenditure(project_no,forecast_period=3,db_path=DB_PATH):
+    df,entry=get_forecaster(project_no,db_path)
+    #print(df.shape)
+    if entry is None:
+        print("Not enough data to forecast.")
+        return None
+    forecasts=predict_ahead(entry['model'],df,forecast_period)
     
     # create forecast dataframe
     last_date=df['ds'].max()
     forecast_dates=[last_date+pd.DateOffset(months=i)for i in range(1,forecast_period+1)]
     forecast_df=pd.DataFrame({'ds':forecast_dates,'forecast_expenditure':forecasts})
-    
-    # evaluate forecast before returning
-    evaluate_forecast_expenditure(project_no,forecast_period=forecast_period,db_path=db_path)
-    
     return forecast_df
 
 # evaluate forecast expenditure
-def evaluate_forecast_expenditure(project_no,forecast_period=3,test_period=3,db_path="../timekeeping.db"):
-    
-    # split data into train and test sets,make sure to use the last 5 months,evaluate
-    
-    df=get_monthly_expenditure(project_no,db_path)
-    if len(df)<(forecast_period+test_period):
+def evaluate_forecast_expenditure(project_no,forecast_period=3,db_path=DB_PATH):
+    # backtest MAPE over the last BACKTEST_MONTHS months, computed when the model was trained
+    df,entry=get_forecaster(project_no,db_path)
+    if entry is None or len(df)<(forecast_period+BACKTEST_MONTHS) or entry['mape'] is None:
         print("Not enough data for evaluation.")
         return None
-    
-    train_df=df.iloc[:len(df)-test_period].copy()
-    test_df=df.iloc[len(df)-test_period:].copy()
-    # print(train_df.shape,test_df.shape)
-    train_df_lag=last_n_months(train_df.copy(),n=5)
-    features=['month_index']+[f'lag_{i}'for i in range(1,6)]
-    X_train=train_df_lag[features]
-    y_train=train_df_lag['expenditure']
-    
+    print("Evaluation Metrics:")
+    print("MAPE:",entry['mape'])
+    return entry['mape']
+
+def train_all(db_path=DB_PATH,n_jobs=-1,force=False):
+    # batch job: one query for every project's series, then the projects whose stored model
+    # is missing or out of date are trained in parallel (n_jobs processes, -1 for every core)
+    monthly=query(EXPENDITURE_SQL.format(where=""),db_path=db_path)
+    todo=[]
+    current=0
+    for project_no,group in monthly.groupby('project_no',sort=False):
+        df=prepare_expenditure(group)
+        if len(df)<N_LAGS:
+            continue
+        path=model_path(project_no,db_path)
+        if not force and load_entry(path,data_version(df)) is not None:
+            current+=1
+            continue
+        todo.append((path,df))
+    entries=joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(train_entry)(df) for path,df in todo)
+    trained=0
+    for (path,df),entry in zip(todo,entries):
+        if entry is not None:
+            save_entry(path,entry)
+            trained+=1
+    return trained,current
+
+# portfolio forecasts: every project at once from a project x month expenditure matrix,
+# one global model (or one per run_kmeans cluster) trained on every project's months, and one
+# predict per forecast month for all active projects. written to the project_forecasts table
+ACTIVE_MONTHS=3 # a project is active if it had expenditure in the last ACTIVE_MONTHS months
+MIN_CLUSTER_ROWS=50 # smaller clusters are forecast by the global model
+
+def expenditure_matrix(db_path=DB_PATH):
+    # project x month (every calendar month, 0 where a project had no hours), current month excluded
+    monthly=query(EXPENDITURE_SQL.format(where=""),db_path=db_path)
+    monthly=monthly[monthly['month']<pd.Timestamp.today().strftime('%Y-%m')]
+    if monthly.empty:
+        return pd.DataFrame()
+    matrix=monthly.pivot(index='project_no',columns='month',values='total_expenditure')
+    months=pd.period_range(matrix.columns.min(),matrix.columns.max(),freq='M').astype(str)
+    return matrix.reindex(columns=months).fillna(0).astype(float)
+
+def lag_features(values,first):
+    # month_index and lag_1..lag_5 for every project and month at once, shape (projects,months,6)
+    # months before a project started count as 0 expenditure
+    n_projects,n_months=values.shape
+    padded=np.hstack([np.zeros((n_projects,N_LAGS)),values])
+    windows=np.lib.stride_tricks.sliding_window_view(padded,N_LAGS,axis=1)[:,:n_months,::-1] # lag_1 first
+    month_index=np.arange(1,n_months+1)[None,:]-first[:,None]
+    return np.concatenate([month_index[:,:,None],windows],axis=2)
+
+def fit_portfolio_model(X,y,n_jobs=None):
     pipeline=make_pipeline(
         SimpleImputer(strategy='median'),
         StandardScaler(),
-        RandomForestRegressor(n_estimators=200)
+        RandomForestRegressor(n_estimators=200,n_jobs=n_jobs)
     )
-    pipeline.fit(X_train,y_train)
-    
-    forecasts=[]
-    last_month_index=train_df['month_index'].iloc[-1]
-    last_expenditures=train_df['expenditure'].iloc[-5:].values.tolist()
-    
-    for i in range(1,test_period+1):
-        new_index=last_month_index+i
-        new_features=np.array([new_index]+last_expenditures).reshape(1,-1)
-        y_pred=pipeline.predict(new_features)[0]
-        forecasts.append(y_pred)
-        last_expenditures.pop(0)
-        last_expenditures.append(y_pred)
-    
-    test_df=test_df.reset_index(drop=True)
-    forecast_array=np.array(forecasts)
-    actual_array=test_df['expenditure'].values[:test_period]
+    pipeline.fit(pd.DataFrame(X,columns=FEATURES),y)
+    return pipeline
 
-    # https://en.wikipedia.org/wiki/Mean_absolute_percentage_error
-    mape=np.mean(np.abs(forecast_array-actual_array)/np.abs(actual_array))*100
-    
-    print("Evaluation Metrics:")
-    print("MAPE:",mape)
\ No newline at end of file
+def forecast_portfolio(db_path=DB_PATH,forecast_period=3,n_clusters=None,n_jobs=-1):
+    # forecasts for every active project, n_clusters=None for one global model
+    # returns project_no,month,forecast_expenditure,model rows
+    matrix=expenditure_matrix(db_path)
+    if matrix.empty:
+        return pd.DataFrame(columns=['project_no','month','forecast_expenditure','model'])
+    values=matrix.to_numpy()
+    n_projects,n_months=values.shape
+    spent=values>0
+    first=np.where(spent.any(axis=1),spent.argmax(axis=1),n_months)
+    last=n_months-1-spent[:,::-1].argmax(axis=1)
+    features=lag_features(values,first)
+
+    # training rows are each project's months from its first to its last month with expenditure
+    month_no=np.arange(n_months)[None,:]
+    in_range=(month_no>=first[:,None])&(month_no<=last[:,None])
+
+    # group label per project, -1 is the global model
+    groups=np.full(n_projects,-1)
+    if n_clusters:
+        from analysis.cluster import run_kmeans
+        clusters=run_kmeans(db_path,n_clusters)[0].set_index('project_no')['cluster_label']
+        groups=matrix.index.map(clusters).fillna(-1).astype(int).to_numpy()
+        # clusters with too few months to train on fall back to the global model
+        rows=np.bincount(groups+1,weights=in_range.sum(axis=1))
+        groups=np.where(rows[groups+1]>=MIN_CLUSTER_ROWS,groups,-1)
+    models={-1:fit_portfolio_model(features[in_range],values[in_range],n_jobs)}
+    for label in np.unique(groups[groups>=0]):
+        rows=in_range&(groups==label)[:,None]
+        models[label]=fit_portfolio_model(features[rows],values[rows],n_jobs)
+
+    # recursive forecast from the last month, every active project in one predict per month and model
+    active=np.flatnonzero(spent.any(axis=1)&(last>=n_months-ACTIVE_MONTHS))
+    lags=np.hstack([np.zeros((n_projects,N_LAGS)),values])[active][:,::-1][:,:N_LAGS]
+    month_index=n_months-first[active]
+    forecasts=np.zeros((len(active),forecast_period))
+    for step in range(forecast_period):
+        X=pd.DataFrame(np.column_stack([month_index+step+1,lags]),columns=FEATURES)
+        for label,model in models.items():
+            selected=groups[active]==label
+            if selected.any():
+                forecasts[selected,step]=model.predict(X[selected])
+        lags=np.column_stack([forecasts[:,step],lags[:,:4]])
+
+    last_month=pd.Period(matrix.columns[-1],freq='M')
+    months=[str(last_month+i) for i in range(1,forecast_period+1)]
+    model_names=np.where(groups[active]>=0,np.char.add("cluster_",groups[active].astype(str)),"global")
+    return pd.DataFrame({
+        'project_no':np.repeat(matrix.index[active].to_numpy(),forecast_period),
+        'month':np.tile(months,len(active)),
+        'forecast_expenditure':forecasts.ravel(),
+        'model':np.repeat(model_names,forecast_period),
+    })
+
+def create_forecast_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS project_forecasts(
+        project_no TEXT NOT NULL,
+        month TEXT NOT NULL,
+        forecast_expenditure REAL,
+        model TEXT,
+        created_at TEXT,
+        PRIMARY KEY(project_no,month)
+    )""")
+
+def save_portfolio_forecasts(forecasts,db_path=DB_PATH):
+    # replaces the table contents, the forecasts are for the data as it is now
+    conn=sqlite3.connect(db_path)
+    create_forecast_table(conn)
+    created_at=datetime.now().isoformat(timespec='seconds')
+    rows=[(r.project_no,r.month,float(r.forecast_expenditure),r.model,created_at) for r in forecasts.itertuples(index=False)]
+    with conn:
+        conn.execute("DELETE FROM project_forecasts")
+        conn.executemany("INSERT INTO project_forecasts(project_no,month,forecast_expenditure,model,created_at) VALUES (?,?,?,?,?)",rows)
+    conn.close()
+
+def load_project_forecast(project_no,db_path=DB_PATH):
+    # stored portfolio forecast for one project, empty if there is none (or no table yet)
+    exists=query("SELECT name FROM sqlite_master WHERE type='table' AND name='project_forecasts'",db_path=db_path)
+    if exists.empty:
+        return pd.DataFrame(columns=['ds','forecast_expenditure','model'])
+    df=query("SELECT month,forecast_expenditure,model FROM project_forecasts WHERE project_no=? ORDER BY month",(project_no,),db_path=db_path)
+    df['ds']=pd.to_datetime(df['month']+"-01")
+    return df[['ds','forecast_expenditure','model']]
+
+def main():
+    parser=argparse.ArgumentParser(description="Train the expenditure forecasters ahead of the dashboard")
+    parser.add_argument("db_path",nargs="?",default=DB_PATH)
+    parser.add_argument("--n-jobs",type=int,default=-1,help="parallel jobs (default -1, every core)")
+    parser.add_argument("--portfolio",action="store_true",help="forecast every active project with one global model into project_forecasts")
+    parser.add_argument("--clusters",type=int,default=None,help="with --portfolio, one model per run_kmeans cluster")
+    parser.add_argument("--months",type=int,default=3,help="with --portfolio, months to forecast")
+    args=parser.parse_args()
+    if args.portfolio:
+        forecasts=forecast_portfolio(args.db_path,args.months,args.clusters,args.n_jobs)
+        save_portfolio_forecasts(forecasts,args.db_path)
+        print(f"project_forecasts: {forecasts['project_no'].nunique()} projects, {len(forecasts)} rows")
+        return
+    trained,current=train_all(args.db_path,args.n_jobs)
+    print(f"forecast models trained: {trained}, already up to date: {current}")
+
+if __name__=="__main__":
+    main()
@@ -1,5 +1,5 @@
-import sqlite3
 import pandas as pd
+from utils.data import DB_PATH,cache_on_db,compact_frame,load_employees,load_monthly_employee_hours
 
 def month_to_season(month):
     if month in [12,1,2]:
@@ -11,26 +11,23 @@ def month_to_season(month):
     else:
         return "Fall"
 
-def load_monthly_hours(db_path="../timekeeping.db"):
-    conn=sqlite3.connect(db_path)
-    emp=pd.read_sql("""SELECT employee_id,name,position FROM employees""",conn)
+@cache_on_db
+def load_monthly_hours(db_path=DB_PATH):
+    emp=load_employees(db_path)[['employee_id','name','position']]
     # add is_senior column
     # change to just titles TODO
     emp['is_senior']=emp['position'].str.contains("Senior|Principal", na=False).astype(int)
 
-    bill=pd.read_sql("SELECT employee_id, date, hours_worked FROM time_entries", conn)
-    nonb=pd.read_sql("SELECT employee_id, date, hours_worked FROM non_billable_entries",conn)
-    conn.close()
-
-    df=pd.concat([bill,nonb],ignore_index=True)
-    df['month_dt']=pd.to_datetime(df['date']).dt.to_period('M').dt.to_timestamp()
-    # group by monthly
-    monthly=(df.groupby(['employee_id', 'month_dt'])['hours_worked'].sum().reset_index().rename(columns={'hours_worked':'total_hours'}))
+    # monthly totals come from the monthly_employee_hours rollup
+    monthly=load_monthly_employee_hours(db_path)
+    monthly['total_hours']=monthly['billable_hours'].fillna(0)+monthly['non_billable_hours'].fillna(0)
+    monthly['month_dt']=pd.to_datetime(monthly['month']+"-01")
+    monthly=monthly[['employee_id','month_dt','total_hours']]
     # join with employee data
     monthly=monthly.merge(emp,on='employee_id',how='left')
-    return monthly
+    return compact_frame(monthly,"monthly_hours")
 
-def load_seasonal_hours(db_path="../timekeeping.db"):
+def load_seasonal_hours(db_path=DB_PATH):
     #load monthly hours from db
     monthly=load_monthly_hours(db_path)
 
@@ -1,63 +1,81 @@
-import sqlite3
 import pandas as pd
 import numpy as np
-from scipy.stats import linregress
-
-def get_top10_trends(db_path="../timekeeping.db",start_date="2010-01-01"):
-    conn=sqlite3.connect(db_path)
-    bill_entries=pd.read_sql("SELECT employee_id, date, hours_worked FROM time_entries", conn)
-    nonbill_entries=pd.read_sql("SELECT employee_id, date, hours_worked FROM non_billable_entries", conn)
-    names=pd.read_sql("SELECT employee_id, name FROM employees",conn)
-    conn.close()
-
-    total_bill=bill_entries.groupby('employee_id')['hours_worked'].sum().reset_index()
-    top10=total_bill.nlargest(10,'hours_worked')['employee_id'].tolist()
-
-    bill_entries=bill_entries[bill_entries.date>=start_date].copy()
-    nonbill_entries=nonbill_entries[nonbill_entries.date>=start_date].copy()
-
-    def build_monthly(eid):
-        # seperate billable and non-billable entries
-        b=bill_entries[bill_entries.employee_id==eid].copy()
-        n=nonbill_entries[nonbill_entries.employee_id==eid].copy()
-
-        # convert date to datetime and extract month
-        b['month']=pd.to_datetime(b.date).dt.to_period('M')
-        n['month']=pd.to_datetime(n.date).dt.to_period('M')
-
-        # group by month and sum hours worked
-        mb=b.groupby('month')['hours_worked'].sum()
-        mn=n.groupby('month')['hours_worked'].sum()
-        # convert to data frame, rename columns, and join
-        m=mb.rename('billable').to_frame().join(mn.rename('nonbillable'),how='outer').fillna(0).reset_index()
-
-        # metrics
-        m['total']=m.billable+m.nonbillable
-        m['billable_pct']=m.billable/m.total
-        m['month_dt']=m.month.dt.to_timestamp()
-
-        # built month index
-        m['month_idx']=m['month'].astype('period[M]').astype('int64').astype(int) # threw so many errors, not sure if best practice
-        #print(m['month_idx'].dtype)
-        m['m_idx']=m['month_idx']-m['month_idx'].min()
-        #print(m['m_idx'])
-        # center around mean for better interpretation
-        mean_idx=m['m_idx'].mean()
-        x_centered=m['m_idx']-mean_idx
-        
-        # lin regress
-        slope,intercept,r,p,se=linregress(x_centered,m['billable_pct'])
-        return m,slope,intercept,p
-
-    trends=[]
-    monthly_data={}
-    for eid in top10:
-        # get monthly data for each employee
-        #print(f"Processing employee {eid}")
-        mdf,slope,intercept,p=build_monthly(eid)
-        name=names.loc[names.employee_id==eid,'name'].iloc[0]
-        trends.append({'employee_id':eid,'name':name,'slope':slope,'intercept':intercept,'p_value':p,'mean_idx':mdf['m_idx'].mean()})
-        monthly_data[eid]=mdf
-
-    trends_df=pd.DataFrame(trends)
+from scipy.stats import t as t_dist
+from utils.data import DB_PATH,load_employees,load_monthly_employee_hours,cache_on_db
+
+def build_monthly(monthly):
+    # every employee at once, one row per employee per month from the monthly_employee_hours rollup
+    # a month with only one kind of hours has 0 for the other
+    m=pd.DataFrame({'employee_id':monthly.employee_id.to_numpy(),
+        'month':pd.PeriodIndex(monthly.month,freq='M'),
+        'billable':monthly.billable_hours.fillna(0).to_numpy(),
+        'nonbillable':monthly.non_billable_hours.fillna(0).to_numpy()})
+
+    # metrics
+    m['total']=m.billable+m.nonbillable
+    m['billable_pct']=m.billable/m.total
+    m['month_dt']=m.month.dt.to_timestamp()
+
+    # month index, months since each employee's first month
+    m['month_idx']=m['month'].astype('int64')
+    m['m_idx']=m['month_idx']-m.groupby('employee_id')['month_idx'].transform('min')
+    return m
+
+def fit_trends(m):
+    # least squares of billable_pct on the centered month index for every employee in one pass
+    # closed form of scipy.stats.linregress (same slope/intercept/two sided p-value), see
+    # https://en.wikipedia.org/wiki/Simple_linear_regression
+    g=m.groupby('employee_id',sort=False)
+    mean_idx=g['m_idx'].transform('mean')
+    x=m['m_idx']-mean_idx # center around mean for better interpretation
+    y=m['billable_pct']
+    dx=x-x.groupby(m.employee_id,sort=False).transform('mean')
+    dy=y-g['billable_pct'].transform('mean')
+    sums=pd.DataFrame({'n':1,'x':x,'y':y,'sxx':dx*dx,'syy':dy*dy,'sxy':dx*dy,'y_min':y,'y_max':y,'mean_idx':mean_idx})
+    fits=sums.groupby(m.employee_id,sort=False).agg(n=('n','size'),xmean=('x','mean'),ymean=('y','mean'),sxx=('sxx','sum'),
+        syy=('syy','sum'),sxy=('sxy','sum'),y_min=('y_min','min'),y_max=('y_max','max'),mean_idx=('mean_idx','first'))
+    n=fits['n'].to_numpy()
+    with np.errstate(divide='ignore',invalid='ignore'):
+        r=np.where((fits.sxx==0)|(fits.syy==0),np.where(fits.sxy==0,np.nan,0.0),fits.sxy/np.sqrt(fits.sxx*fits.syy))
+        r=np.clip(r,-1.0,1.0)
+        slope=(fits.sxy/fits.sxx).to_numpy()
+        df=n-2
+        t=r*np.sqrt(df/((1.0-r+1e-20)*(1.0+r+1e-20)))
+        p=2*t_dist.sf(np.abs(t),df)
+    # two points always fit exactly
+    p=np.where(n==2,np.where(fits.y_min==fits.y_max,1.0,0.0),p)
+    return pd.DataFrame({'employee_id':fits.index,'slope':slope,'intercept':fits.ymean.to_numpy()-slope*fits.xmean.to_numpy(),
+        'p_value':p,'mean_idx':fits.mean_idx.to_numpy(),'months':n})
+
+@cache_on_db
+def compute_trends(db_path=DB_PATH,start_date="2010-01-01"):
+    # trend for every employee with at least two months since start_date, cached until the db changes
+    # returns (trends, monthly rows) with trends ordered by total billable hours (all time)
+    monthly=load_monthly_employee_hours(db_path)
+    names=load_employees(db_path)[['employee_id','name']]
+
+    total_bill=monthly[monthly.billable_hours.notna()].groupby('employee_id')['billable_hours'].sum()
+    ranked=total_bill.sort_values(ascending=False,kind='stable')
+
+    # rollup is monthly so start_date is applied to the month it falls in
+    m=build_monthly(monthly[monthly.month>=start_date[:7]])
+    trends=fit_trends(m)
+    trends=trends[trends['months']>=2].set_index('employee_id')
+    trends=trends.loc[[eid for eid in ranked.index if eid in trends.index]].reset_index()
+    trends=trends.merge(names,on='employee_id',how='left')
+    return trends,m
+
+def get_trends(db_path=DB_PATH,start_date="2010-01-01",top_n=10):
+    # role evolution for the top_n employees by billable hours (top_n=None for everyone)
+    # every employee is fitted in compute_trends, so top_n only changes how many are returned
+    trends,m=compute_trends(db_path,start_date)
+    if top_n is not None:
+        trends=trends.head(top_n)
+    trends=trends.reset_index(drop=True)
+    selected=m[m.employee_id.isin(trends.employee_id)]
+    monthly_data={eid:mdf.drop(columns='employee_id').reset_index(drop=True) for eid,mdf in selected.groupby('employee_id')}
+    trends_df=trends[['employee_id','name','slope','intercept','p_value','mean_idx']]
     return trends_df,monthly_data
+
+def get_top10_trends(db_path=DB_PATH,start_date="2010-01-01"):
+    return get_trends(db_path,start_date,top_n=10)
@@ -1,63 +1,74 @@
-import sqlite3
+import numpy as np
 import pandas as pd
+from utils.data import DB_PATH,query,cache_on_db
 
-def load_phase_data(db_path="../timekeeping.db",phase_map=None):
+# per project queries bind project_no as a parameter and are cached per project until the db changes
+# WHERE T.project_no=? is a range scan on idx_time_entries_project_date
+
+def get_phase(work_codes,phase_map):
+    # work code -> phase name, anything not in the map is "Other"
+    return work_codes.map(phase_map).fillna("Other")
+
+@cache_on_db
+def load_phase_data(db_path=DB_PATH,phase_map=None,project_no=None):
+    # entries with phase and cost for one project, or every project if project_no is None
     if phase_map is None:
         phase_map={}
-    conn=sqlite3.connect(db_path)
-    query="""SELECT T.project_no,T.work_code,T.hours_worked,T.date,E.billable_rate,P.project_name
+    sql="""SELECT T.project_no,T.work_code,T.hours_worked,T.date,E.billable_rate,P.project_name
     FROM time_entries T JOIN employees E ON T.employee_id=E.employee_id JOIN projects P ON T.project_no=P.project_no"""
-    df=pd.read_sql_query(query,conn)
-    conn.close()
+    params=()
+    if project_no is not None:
+        sql+=" WHERE T.project_no=?"
+        params=(project_no,)
+    df=query(sql,params,db_path=db_path)
 
     df['date']=pd.to_datetime(df['date'],errors='coerce')
-    
-    def get_phase(code):
-        #return code
-        return phase_map.get(code, "Other")
-    df['phase'] = df['work_code'].apply(get_phase)
+    df['phase'] = get_phase(df['work_code'],phase_map)
     df['cost'] = df['hours_worked'] * df['billable_rate']
     #print(df.head())
     return df
 
-def find_time_entries(project_no,db_path="../timekeeping.db"):
-    query=f"SELECT date,hours_worked FROM time_entries WHERE project_no='{project_no}'"
-    conn=sqlite3.connect(db_path)
-    df=pd.read_sql(query,conn)
+@cache_on_db
+def load_phase_totals(db_path=DB_PATH,phase_map=None):
+    # hours and cost per phase over every project, summed per work code in sqlite
+    # instead of loading every entry
+    if phase_map is None:
+        phase_map={}
+    sql="""SELECT T.work_code,SUM(T.hours_worked) AS total_hours,SUM(T.hours_worked*E.billable_rate) AS total_cost
+    FROM time_entries T JOIN employees E ON T.employee_id=E.employee_id JOIN projects P ON T.project_no=P.project_no
+    GROUP BY T.work_code"""
+    df=query(sql,db_path=db_path)
+    df['phase']=get_phase(df['work_code'],phase_map)
+    return df.groupby('phase')[['total_hours','total_cost']].sum().reset_index()
+
+@cache_on_db
+def find_time_entries(project_no,db_path=DB_PATH):
+    sql="SELECT date,hours_worked FROM time_entries WHERE project_no=?"
+    df=query(sql,(project_no,),db_path=db_path)
     #print("len(df)")
     if df.empty:
-        return "No data found for project {project_no}"
-    else:
-        # adjust time entries for analysis
-        df["date"]=pd.to_datetime(df["date"])
-        df["month"]=df["date"].dt.to_period("M").astype(str)
-        df["day_of_week"]=df["date"].dt.dayofweek
-        #print(df['day_of_week'].unique().count())
-        #print(df['day_of_week'].unique())
-        def categorize(row):
-            if row["day_of_week"]>=5:
-                return "Weekend"
-            elif row["hours_worked"]>7.5:
-                return "Overtime"
-            else:
-                return "Regular"
-        # categorize work types
-        df["type"]=df.apply(categorize,axis=1)
-        #print(df_time.head())
-        # group by month and type
-        agg_df=df.groupby(["month","type"])["hours_worked"].sum().reset_index()
-        agg_df["project_no"]=project_no
+        # no entries for this project
+        return pd.DataFrame(columns=["month","type","hours_worked","project_no"])
+    # adjust time entries for analysis
+    df["date"]=pd.to_datetime(df["date"])
+    df["month"]=df["date"].dt.to_period("M").astype(str)
+    df["day_of_week"]=df["date"].dt.dayofweek
+    # categorize work types, weekend first then overtime
+    df["type"]=np.select([df["day_of_week"]>=5,df["hours_worked"]>7.5],["Weekend","Overtime"],default="Regular")
+    #print(df_time.head())
+    # group by month and type
+    agg_df=df.groupby(["month","type"])["hours_worked"].sum().reset_index()
+    agg_df["project_no"]=project_no
     return agg_df
 
 
-def get_project_summary(project_no,db_path="../timekeeping.db"):
-    conn=sqlite3.connect(db_path)
-    query=f"""
+def get_project_summary(project_no,db_path=DB_PATH):
+    sql="""
     SELECT p.project_captain,f.percent_complete,f.amount_left_to_bill
     FROM projects p LEFT JOIN financial_data f ON p.project_no=f.project_no
-    WHERE p.project_no='{project_no}'
+    WHERE p.project_no=?
     """
-    df=pd.read_sql_query(query,conn)
+    df=query(sql,(project_no,),db_path=db_path)
     return df
 
 
@@ -65,5 +76,3 @@ def summarize_time_and_cost_by_phase(df):
     grouped=df.groupby(['project_no','project_name','phase']).agg(total_hours=('hours_worked','sum'),total_cost=('cost','sum')).reset_index()
     grouped=grouped.sort_values('total_cost',ascending=False)
     return grouped
-
-
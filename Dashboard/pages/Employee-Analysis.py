@@ -6,8 +6,8 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from scipy.stats import ttest_1samp,shapiro,wilcoxon,mannwhitneyu
-from analysis.employee_clusters import load_annual_usage,cluster_data
-from analysis.senior_trends import get_top10_trends
+from analysis.employee_clusters import load_annual_usage,get_usage_clusters
+from analysis.senior_trends import get_trends
 from analysis.seasonality import load_monthly_hours,month_to_season
 from analysis.burnout import get_burnout_analysis
 from numpy import percentile
@@ -56,17 +56,19 @@ st.header("Utilization Clusters")
 
 # k selection for interactivity
 k=st.sidebar.slider("Number of clusters (k)",2,6,2) # Cluster slider
-# from analysis.employee_clusters, import cluster_data
-clustered,km=cluster_data(df,n_clusters=k)
+usage_mode=st.sidebar.radio("Utilization per",["Lifetime","Year"]) # lifetime totals or one point per employee-year
+per_year=usage_mode=="Year"
+# from analysis.employee_clusters, every k is fitted once and cached until the db changes
+clustered,km=get_usage_clusters(n_clusters=k,per_year=per_year)
 
 # colours that are more distint and vibrant
 custom_colours=["#FF9999","#66B3FF","#99FF99","#FFCC99","#FFD700"]
-df['cluster']=df['cluster'].astype(str)
+clustered['cluster']=clustered['cluster'].astype(str)
 
 # create scatters
 fig=px.scatter(clustered,x='billable_pct',y='log_total_hours',color='cluster',
     color_discrete_sequence=px.colors.qualitative.Set2,
-    hover_data=['name','position','total_hours'],
+    hover_data=['name','position','total_hours']+(['year'] if per_year else []),
     title="% Billable vs. Log(Total Hours)")
 #print(clustered['is_senior'].unique())
 #print(clustered['is_senior'].value_counts())
@@ -81,8 +83,10 @@ summary['avg_billable_pct']=(summary['avg_billable_pct']*100).astype(str)+'%'
 st.dataframe(summary)
 
 st.header("Role Evolution Over Time:")
-# from senior trends
-trends_df,monthly_data=get_top10_trends()
+# from senior trends, every employee is fitted in one cached pass so showing more costs the same
+trend_options={"Top 10":10,"Top 20":20,"Top 30":30,"All Employees":None}
+trend_choice=st.sidebar.selectbox("Role Evolution Employees",list(trend_options.keys()))
+trends_df,monthly_data=get_trends(top_n=trend_options[trend_choice])
 
 #print(trends_df.columns)
 
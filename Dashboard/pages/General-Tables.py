@@ -1,20 +1,34 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
+import io
+import csv
 
 from utils.header_navigation import show_buttons#CUSTOM HEADER (utils folder)
+from utils.data import query,read_sql,iter_query,load_employees,load_projects
 
 show_buttons("Timekeeping Tables", "Table Data")
 
-#connect
-conn = sqlite3.connect('../timekeeping.db')
+# tables are browsed a page at a time with keyset queries (WHERE (sort cols,rowid) > last row shown)
+# instead of SELECT * into st.write, filters run in sqlite and only one page is loaded per rerun
+# sorts are limited to indexed columns, rowid breaks ties so every row has a unique position
+TABLES = {
+    "Employees": {"table": "employees", "filters": [], "sorts": {"Employee ID": []}},
+    "Projects": {"table": "projects", "filters": [], "sorts": {"Table Order": [], "Project No": ["project_no"]}},
+    "Time Entries": {"table": "time_entries", "filters": ["employee", "project", "date", "work_code"],
+        "sorts": {"Entry ID": [], "Employee, Date": ["employee_id", "date"], "Project, Date": ["project_no", "date"]}},
+    "Non-Billable Entries": {"table": "non_billable_entries", "filters": ["employee", "date", "category"],
+        "sorts": {"Entry ID": [], "Employee, Category, Date": ["employee_id", "category", "date"]}},
+    "Financial Data": {"table": "financial_data", "filters": [], "sorts": {"Table Order": [], "Project No": ["project_no"]}},
+}
 
 #helper function
-# takes SQL queries and returnvas a pandas df
-def load_data(query):
-    return pd.read_sql(query, conn)
+# takes SQL queries and returns a pandas df (cached until the db changes)
+def load_data(sql, params=()):
+    return query(sql, params)
+
+def to_param(value):
+    # numpy scalars from a DataFrame row -> plain python for sqlite
+    return value.item() if hasattr(value, "item") else value
 
 
 
@@ -22,39 +36,121 @@ def load_data(query):
 #should be under pages tab
 #lets you choose which table to look at
 st.sidebar.header("Select Data to View")
-data_option = st.sidebar.selectbox("Choose a table", ["Employees", "Projects", "Time Entries", "Non-Billable Entries", "Financial Data"])
+data_option = st.sidebar.selectbox("Choose a table", list(TABLES.keys()))
+config = TABLES[data_option]
+table = config["table"]
+
+#filters, each one adds a WHERE clause with a bound parameter
+conditions = []
+params = []
+if "employee" in config["filters"]:
+    employees_df = load_employees().sort_values("name")
+    selected_employee = st.sidebar.selectbox("Employee", ["All"] + employees_df["name"].tolist())
+    if selected_employee != "All":
+        conditions.append("employee_id = ?")
+        params.append(to_param(employees_df.loc[employees_df["name"] == selected_employee, "employee_id"].iloc[0]))
+
+if "project" in config["filters"]:
+    projects_df = load_projects().sort_values("project_no")
+    project_options = ["All"] + (projects_df["project_no"] + " - " + projects_df["project_name"].fillna("")).tolist()
+    selected_project = st.sidebar.selectbox("Project", project_options)
+    if selected_project != "All":
+        conditions.append("project_no = ?")
+        params.append(selected_project.split(" - ")[0])
+
+if "date" in config["filters"]:
+    date_bounds = load_data(f"SELECT MIN(date) AS first, MAX(date) AS last FROM {table}")
+    if pd.notnull(date_bounds["first"].iloc[0]):
+        first = pd.to_datetime(date_bounds["first"].iloc[0]).date()
+        last = pd.to_datetime(date_bounds["last"].iloc[0]).date()
+        date_range = st.sidebar.date_input("Date Range", value=(first, last), min_value=first, max_value=last)
+        # date_input returns one date while the end of the range is still being picked
+        if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+            if date_range[0] > first:
+                conditions.append("date >= ?")
+                params.append(date_range[0].isoformat())
+            if date_range[1] < last:
+                conditions.append("date <= ?")
+                params.append(date_range[1].isoformat())
+
+for column, label in (("work_code", "Work Code"), ("category", "Category")):
+    if column in config["filters"]:
+        values = load_data(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY {column}")[column].tolist()
+        selected_value = st.sidebar.selectbox(label, ["All"] + values)
+        if selected_value != "All":
+            conditions.append(f"{column} = ?")
+            params.append(selected_value)
+
+sort_label = st.sidebar.selectbox("Sort by", list(config["sorts"].keys()))
+descending = st.sidebar.checkbox("Descending", value=False)
+page_size = st.sidebar.selectbox("Rows per page", [50, 100, 500, 1000], index=1)
+
+sort_cols = config["sorts"][sort_label] + ["rowid"]
+order_by = ",".join(col + (" DESC" if descending else "") for col in sort_cols)
+where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+#page cursors live in session state, cursors[i] is the sort key of the last row before page i+1
+#changing the table, a filter or the sort goes back to page 1
+signature = (table, tuple(conditions), tuple(params), sort_label, descending, page_size)
+if st.session_state.get("tables_signature") != signature:
+    st.session_state["tables_signature"] = signature
+    st.session_state["tables_cursors"] = [None]
+cursors = st.session_state["tables_cursors"]
+
+page_conditions = list(conditions)
+page_params = list(params)
+if cursors[-1] is not None:
+    page_conditions.append(f"({','.join(sort_cols)}) {'<' if descending else '>'} ({','.join('?' * len(sort_cols))})")
+    page_params.extend(cursors[-1])
+page_query = f"SELECT rowid AS _row, * FROM {table}"
+if page_conditions:
+    page_query += " WHERE " + " AND ".join(page_conditions)
+page_query += f" ORDER BY {order_by} LIMIT {page_size}"
+
+total_rows = int(load_data(f"SELECT COUNT(*) AS n FROM {table}{where}", params)["n"].iloc[0])
+total_pages = max(1, -(-total_rows // page_size))
+page_number = len(cursors)
+# pages arent cached, a cache entry per page browsed would grow with every page turned
+page_df = read_sql(page_query, page_params)
 
 
 
 #table display
-if data_option == "Employees":
-    employee_query = "SELECT * FROM employees"
-    employees_df = load_data(employee_query)
-    st.write("### Employee Data", employees_df)
-
-elif data_option == "Projects":
-    project_query = "SELECT * FROM projects"
-    projects_df = load_data(project_query)
-    st.write("### Project Data", projects_df)
-
-elif data_option == "Time Entries":
-    time_entries_query = "SELECT * FROM time_entries"
-    time_entries_df = load_data(time_entries_query)
-    st.write("### Time Entries Data", time_entries_df)
-    
-
-elif data_option == "Non-Billable Entries":
-    non_billable_query = "SELECT * FROM non_billable_entries"
-    non_billable_df = load_data(non_billable_query)
-    st.write("### Non-Billable Entries Data", non_billable_df)
-
-elif data_option == "Financial Data":
-    financial_data_query = "SELECT * FROM financial_data"
-    financial_data_df = load_data(financial_data_query)
-    st.write("### Time Entries Data", financial_data_df)
-
-
-
-
-conn.close()
-
+st.write(f"### {data_option} Data")
+st.caption(f"{total_rows:,} rows | page {page_number} of {total_pages:,}")
+st.dataframe(page_df.drop(columns=["_row"]), use_container_width=True, hide_index=True)
+
+col_prev, col_next, col_spacer = st.columns([1, 1, 4])
+with col_prev:
+    if st.button("Previous Page", disabled=page_number == 1):
+        cursors.pop()
+        st.rerun()
+with col_next:
+    if st.button("Next Page", disabled=page_number >= total_pages or page_df.empty):
+        last_row = page_df.iloc[-1]
+        cursors.append([to_param(last_row["_row" if col == "rowid" else col]) for col in sort_cols])
+        st.rerun()
+
+
+#csv export of the rows matching the filters, in parts of EXPORT_ROWS rows
+#streamlit holds a download's whole file in memory, so a big table is exported a part at a time
+#to keep that to one part's csv. a part is built only when its button is clicked, rows go from
+#a sqlite cursor to the csv a chunk at a time without a DataFrame
+EXPORT_ROWS = 100000
+export_parts = max(1, -(-total_rows // EXPORT_ROWS))
+export_part = 0
+if export_parts > 1:
+    export_part = st.selectbox("Export part", range(export_parts),
+        format_func=lambda i: f"rows {i * EXPORT_ROWS + 1:,} - {min((i + 1) * EXPORT_ROWS, total_rows):,}")
+
+def export_csv(part=export_part):
+    out = io.StringIO(newline="")
+    writer = csv.writer(out)
+    chunks = iter_query(f"SELECT * FROM {table}{where} ORDER BY {order_by} LIMIT {EXPORT_ROWS} OFFSET {part * EXPORT_ROWS}", params)
+    writer.writerow(next(chunks))
+    for rows in chunks:
+        writer.writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+export_name = f"{table}.csv" if export_parts == 1 else f"{table}_part{export_part + 1}_of_{export_parts}.csv"
+st.download_button("Export Filtered Rows to CSV", data=export_csv, file_name=export_name, mime="text/csv")
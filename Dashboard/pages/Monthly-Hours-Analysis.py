@@ -1,40 +1,38 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import sqlite3
 import streamlit as st
 import numpy as np
 
 from utils.header_navigation import show_buttons#CUSTOM HEADER (utils folder)
+from utils.data import query,load_employees,load_time_entries,load_non_billable_entries,load_projects
 
 show_buttons("Monthly Hours Analysis", "Insights into Monthly Employee Trends & Productivity")
 
-conn =sqlite3.connect('../timekeeping.db')
-
-#extract from db tables
-df_employees = pd.read_sql("SELECT employee_id, name FROM Employees", conn)
-df_time = pd.read_sql("SELECT employee_id, date, hours_worked, work_code FROM time_entries", conn)
-df_non_billable = pd.read_sql("SELECT employee_id, category, date, hours_worked FROM non_billable_entries", conn)
-
-#transf
-df_time["date"] = pd.to_datetime(df_time["date"])
-df_time["month"] = df_time["date"].dt.to_period("M")
-df_non_billable["date"] =pd.to_datetime(df_non_billable["date"])
-df_non_billable["month"] = df_non_billable["date"].dt.to_period("M")
-df = df_time.merge(df_employees, on="employee_id", how="left")
-
 #SIDEBAR 
 st.sidebar.header("Filter Data")
 
-#months - This filters all the following vizs by month
-df["year"]=df["month"].dt.year
-df["month_num"]=df["month"].dt.month
+#months with billable hours come from the monthly rollup, so only the selected year's entries are loaded
+billable_months = query("SELECT DISTINCT month FROM monthly_employee_hours WHERE billable_hours IS NOT NULL ORDER BY month")
+billable_months["year"] = billable_months["month"].str[:4].astype(int)
+billable_months["month_num"] = billable_months["month"].str[5:7].astype(int)
 
-years=sorted(df["year"].unique())
+#months - This filters all the following vizs by month
+years=sorted(billable_months["year"].unique())
 selected_year=st.sidebar.selectbox("Select a Year", years, index=len(years) - 1)
 
-available_months=df[df["year"] == selected_year]["month_num"].unique()
+available_months=billable_months[billable_months["year"] == selected_year]["month_num"].unique()
 available_months=sorted(available_months)
+
+#extract from db tables (cached, only reread when the db changes), parquet snapshot when there is one
+df_employees = load_employees()[["employee_id", "name"]]
+df_time = load_time_entries(years=[selected_year])[["employee_id", "date", "hours_worked", "work_code"]]
+df_non_billable = load_non_billable_entries(years=[selected_year])
+
+#transf
+df_time["month"] = df_time["date"].dt.to_period("M")
+df_non_billable["month"] = df_non_billable["date"].dt.to_period("M")
+df = df_time.merge(df_employees, on="employee_id", how="left")
 month_names={1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 
                6: "June", 7: "July", 8: "August", 9: "September", 
                10: "October", 11: "November", 12: "December"}
@@ -78,7 +76,7 @@ employee_hours["prev_hours"]=employee_hours["hours_worked"].shift(1)
 employee_hours["prev_hours"]=employee_hours["prev_hours"].fillna(0)
 employee_hours["pct_change"]=employee_hours.apply(calc_pct_increase,axis=1)
 employee_hours["prev_hours"]=employee_hours["prev_hours"].fillna(0)
-work_type_hours = filtered_df.groupby("work_code")["hours_worked"].sum().reset_index()
+work_type_hours = filtered_df.groupby("work_code", observed=True)["hours_worked"].sum().reset_index()
 billable_hours = filtered_df["hours_worked"].sum()
 non_billable_hours = filtered_non_billable_df["hours_worked"].sum()
 
@@ -114,7 +112,7 @@ fig2 = px.pie(work_type_hours, names="work_code", values="hours_worked",
 
 #we need a more advanced query for fig 3
 #setup for fig3
-query = f"""
+top_projects_query = f"""
     SELECT te.project_no, SUM(te.hours_worked) AS total_hours
     FROM time_entries te
     WHERE te.date LIKE '{selected_month}%'  -- filter by selected month
@@ -122,8 +120,8 @@ query = f"""
     ORDER BY total_hours DESC  -- Sort by total hours worked in descending order
     LIMIT 5;  -- get top5 projects (or fewer if there are less than 5)
 """
-top_projects_df = pd.read_sql(query, conn)
-top_projects_df = top_projects_df.merge(pd.read_sql("SELECT project_no, project_name FROM projects", conn), on="project_no", how="left")
+top_projects_df = query(top_projects_query)
+top_projects_df = top_projects_df.merge(load_projects()[["project_no", "project_name"]], on="project_no", how="left")
 
 
 fig3 = px.bar(top_projects_df, 
@@ -7,24 +7,21 @@ if dashboard_path not in sys.path:
 
 
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-from analysis.forecasting import forecast_expenditure,get_monthly_expenditure
+from analysis.forecasting import forecast_expenditure,evaluate_forecast_expenditure,get_monthly_expenditure,load_project_forecast
 from utils.header_navigation import show_buttons
-from analysis.time_cost_phase import load_phase_data,summarize_time_and_cost_by_phase,find_time_entries,get_project_summary
-from analysis.cluster import run_kmeans
-from sklearn.decomposition import PCA
+from utils.data import query
+from analysis.time_cost_phase import load_phase_data,load_phase_totals,summarize_time_and_cost_by_phase,find_time_entries,get_project_summary
+from analysis.cluster import run_kmeans,preprocess_features,cluster_sweep
 
 from utils.header_navigation import show_buttons#CUSTOM HEADER (utils folder)
 
 show_buttons("Project Insights", "Insights into Project Performance & Clustering")
 
 st.title("Project Insights")
-conn=sqlite3.connect('../timekeeping.db') # connect to db
-
-projects_df=pd.read_sql("SELECT project_no,project_name FROM projects ORDER BY project_no",conn) # fetch projects
+projects_df=query("SELECT project_no,project_name FROM projects ORDER BY project_no") # fetch projects (cached)
 
 if projects_df.empty:
     st.error("No projects available.")
@@ -32,16 +29,24 @@ st.subheader("K-Means Clustering")
 st.write("This section allows you to run a clustering algorithm on the project data to identify patterns and group similar projects together.")
 st.write("The axes are labeled as PC1 and PC2, in short, PCA is used to reduce dimensionality of data to capture the most important features.")
 k=st.slider("Number of Clusters", min_value=1, max_value=10, value=3)
+# every k is fitted once (cached until the db changes), after the first run the slider just switches views
 if st.button("Run Clustering"):
+    st.session_state["clustering_run"]=True
+if st.session_state.get("clustering_run"):
     df,data_scaled,labels,kmeans_model=run_kmeans(db_path="../timekeeping.db",n_clusters=k)
     #print(df,data_scaled,labels,kmeans_model)
     # print("data_scaled",data_scaled.shape)
     n_clusters=len(set(labels))
 
     st.write(f"**Number of Clusters**: {n_clusters}")
-    #PCA for 2D visualization
-    pca=PCA(n_components=2,random_state=42)
-    pca_coords=pca.fit_transform(data_scaled)
+    #PCA for 2D visualization (cached with the preprocessed features)
+    pca_coords=preprocess_features(db_path="../timekeeping.db")[2]
+
+    # elbow and silhouette over the whole sweep to help pick k
+    sweep_df=cluster_sweep(db_path="../timekeeping.db")[0]
+    col1,col2=st.columns(2)
+    col1.plotly_chart(px.line(sweep_df,x='k',y='inertia',markers=True,title='Elbow (Inertia by k)'),use_container_width=True)
+    col2.plotly_chart(px.line(sweep_df,x='k',y='silhouette',markers=True,title='Silhouette Score by k'),use_container_width=True)
     
     df_plot=pd.DataFrame({
         'PC1':pca_coords[:,0],
@@ -122,6 +127,12 @@ else:
         st.subheader("Expenditure Forecast")
 
         with st.expander("Generate Forecast Report"):
+            # portfolio forecast from the batch job (python -m analysis.forecasting --portfolio), if it has been run
+            portfolio_df=load_project_forecast(selected_proj_no,db_path="../timekeeping.db")
+            if not portfolio_df.empty:
+                st.write("**Portfolio Forecast** (all projects, one model)")
+                st.dataframe(portfolio_df.rename(columns={'ds':'Month','forecast_expenditure':'Forecasted Expenditure','model':'Model'}),use_container_width=True)
+
             forecast_months=st.slider("Months to Forecast",min_value=1,max_value=3,value=3)
 
             if st.button("Run Forecast"):
@@ -142,6 +153,11 @@ else:
                     fig2=px.line(combined_df,x="ds",y=["Actual Expenditure","Forecasted Expenditure"],title=f"Forecasted Expenditure for Project {selected_proj_no}",labels={"value":"Expenditure ($)","variable":"Legend"},markers=True)
                     st.plotly_chart(fig2,use_container_width=True)
 
+                    # backtest of the same model on the last 3 months, stored when it was trained
+                    mape=evaluate_forecast_expenditure(selected_proj_no,forecast_months,db_path="../timekeeping.db")
+                    if mape is not None:
+                        st.caption(f"Backtest MAPE (last 3 months): {mape:.1f}%")
+
                 else:
                     st.warning("Not enough data to generate a forecast.")
 
@@ -175,10 +191,8 @@ else:
                    "nan":"Empty Work Code"}
 
         # from analysis load phase data
-        df_phases=load_phase_data(db_path="../timekeeping.db",phase_map=phase_map)
-
         # only care about this project
-        df_phases_selected=df_phases[df_phases["project_no"]==selected_proj_no]
+        df_phases_selected=load_phase_data(db_path="../timekeeping.db",phase_map=phase_map,project_no=selected_proj_no)
         
         if df_phases_selected.empty:
             st.warning("No phase data for this project")
@@ -201,13 +215,11 @@ else:
         
         st.subheader("Aggregated Phase Data Across ALL Projects")
 
-        filtered_df_phases=df_phases[df_phases['phase']!="Empty Work Code"] # filter empty work codes
-
-        all_phase_summary=(filtered_df_phases.groupby('phase').agg(total_hours=('hours_worked','sum'),total_cost=('cost','sum')).reset_index())
+        # totals per phase are summed in sqlite, not from every entry of every project
+        all_phase_summary=load_phase_totals(db_path="../timekeeping.db",phase_map=phase_map)
+        all_phase_summary=all_phase_summary[all_phase_summary['phase']!="Empty Work Code"] # filter empty work codes
 
         # total cost by phase pie chart
         fig_all=px.pie(all_phase_summary,names='phase',values='total_cost',title="Overall Cost Distribution by Phase (All Projects)",color='phase',color_discrete_sequence=px.colors.qualitative.Plotly)
         st.plotly_chart(fig_all,use_container_width=True)
 
-conn.close()
-
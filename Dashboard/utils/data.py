@@ -0,0 +1,213 @@
+import os
+import json
+import logging
+import functools
+import inspect
+import sqlite3
+import threading
+import pandas as pd
+import streamlit as st
+try:
+    import pyarrow.parquet as pq
+except ImportError: # optional, without it everything is read from sqlite
+    pq=None
+
+# shared data access for the dashboard pages and analysis loaders
+# one pooled connection per db file (st.cache_resource) and DataFrame caches (st.cache_data)
+# keyed on the db file's mtime, so reruns from sidebar widgets dont go back to sqlite
+# and reloading timekeeping.db invalidates everything on the next rerun
+
+DB_PATH="../timekeeping.db" # relative to Dashboard/, where streamlit is run from
+logger=logging.getLogger(__name__)
+
+def db_mtime(db_path=DB_PATH):
+    return os.path.getmtime(db_path)
+
+# the caches below are keyed on the db mtime, so after a write the frames cached for the old
+# version would only go when max_entries pushes them out. current_mtime clears them as soon as
+# a changed mtime is seen, max_entries bounds what one version can hold
+DB_CACHES=[]
+_seen_mtimes={} # db path -> mtime the caches hold frames for
+
+def db_cache(max_entries):
+    def register(func):
+        cached=st.cache_data(show_spinner=False,max_entries=max_entries)(func)
+        DB_CACHES.append(cached)
+        return cached
+    return register
+
+def current_mtime(db_path):
+    db_path=os.path.abspath(db_path)
+    mtime=db_mtime(db_path)
+    if _seen_mtimes.setdefault(db_path,mtime)!=mtime:
+        _seen_mtimes[db_path]=mtime
+        for cached in DB_CACHES:
+            cached.clear()
+    return mtime
+
+@st.cache_resource(show_spinner=False)
+def _connection(db_path,inode):
+    # inode in the key so a db that was replaced (not just written to) gets a new connection
+    # streamlit sessions run on their own threads, the lock keeps them off the connection at the same time
+    conn=sqlite3.connect(db_path,check_same_thread=False)
+    return conn,threading.Lock()
+
+def get_connection(db_path=DB_PATH):
+    db_path=os.path.abspath(db_path)
+    return _connection(db_path,os.stat(db_path).st_ino)
+
+@db_cache(max_entries=256)
+def _cached_query(sql,params,db_path,mtime):
+    conn,lock=get_connection(db_path)
+    with lock:
+        return pd.read_sql_query(sql,conn,params=params)
+
+def query(sql,params=(),db_path=DB_PATH):
+    # cached pd.read_sql_query, callers get their own copy of the frame so mutating it is fine
+    db_path=os.path.abspath(db_path)
+    return _cached_query(sql,tuple(params),db_path,current_mtime(db_path))
+
+def cache_on_db(func):
+    # st.cache_data for an analysis function with a db_path argument, keyed on the db mtime
+    # like query() so it only recomputes after the db changes, and on the other arguments
+    # (e.g. one cache entry per project_no)
+    signature=inspect.signature(func)
+    def cached(mtime,*args,**kwargs):
+        return func(*args,**kwargs)
+    # streamlit keys a cache on module+qualname+source, give each wrapped function its own
+    cached.__module__=func.__module__
+    cached.__qualname__=func.__qualname__
+    cached=db_cache(max_entries=32)(cached)
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+        bound=signature.bind(*args,**kwargs)
+        bound.apply_defaults()
+        db_path=bound.arguments["db_path"]=os.path.abspath(bound.arguments["db_path"])
+        return cached(current_mtime(db_path),*bound.args,**bound.kwargs)
+    return wrapper
+
+def iter_query(sql,params=(),db_path=DB_PATH,chunk_size=10000):
+    # uncached, yields the column names then lists of up to chunk_size rows
+    # for exports, uses its own connection so a long export doesnt hold the shared one
+    conn=sqlite3.connect(db_path)
+    try:
+        cur=conn.execute(sql,tuple(params))
+        yield [d[0] for d in cur.description]
+        while True:
+            rows=cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+# parquet snapshot of the entry tables and rollups written by export_parquet.py (repo root) into
+# warehouse/ next to the db, one directory per table partitioned by year, typed columns
+# (dates are already datetimes, codes are categoricals, hours float32). loaders read just the
+# columns and years they need, memory mapped, and fall back to sqlite when there is no snapshot
+def snapshot_manifest(db_path=DB_PATH):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)),"warehouse","_manifest.json")
+
+def load_snapshot(path,columns,years=None):
+    filters=[("year","in",list(years))] if years is not None else None
+    table=pq.read_table(path,columns=list(columns),filters=filters,memory_map=True,partitioning="hive")
+    return table.to_pandas(date_as_object=False,split_blocks=True,self_destruct=True)
+
+@db_cache(max_entries=16)
+def _cached_snapshot(path,columns,years,mtime):
+    return load_snapshot(path,columns,years)
+
+def read_snapshot(table,columns,years=None,db_path=DB_PATH,cached=True):
+    # the table from the snapshot (cached on the manifest's mtime, rewritten on every export),
+    # None if there isnt one or the db was written after it was exported (it could be missing
+    # some of the changes) so the caller reads sqlite instead
+    # cached=False for loaders that cache their own result
+    manifest=snapshot_manifest(db_path)
+    path=os.path.join(os.path.dirname(manifest),table)
+    if pq is None or not os.path.exists(manifest) or not os.path.isdir(path):
+        return None
+    with open(manifest) as f:
+        if json.load(f).get("db_mtime")!=current_mtime(db_path):
+            return None
+    years=None if years is None else tuple(sorted(int(y) for y in years))
+    if not cached:
+        return load_snapshot(path,columns,years)
+    return _cached_snapshot(path,tuple(columns),years,os.path.getmtime(manifest))
+
+def read_sql(sql,params=(),db_path=DB_PATH):
+    # uncached pd.read_sql_query on the pooled connection, for loaders that cache their own result
+    conn,lock=get_connection(db_path)
+    with lock:
+        return pd.read_sql_query(sql,conn,params=tuple(params))
+
+def year_filter(column,years):
+    # WHERE clause and params for the sqlite fallback of a loader with a years argument
+    if years is None:
+        return "",()
+    years=sorted(int(y) for y in years)
+    return f" WHERE CAST(substr({column},1,4) AS INTEGER) IN ({','.join('?'*len(years))})",tuple(years)
+
+# compact dtypes for the entry sized frames: datetime64 dates, categoricals for the repeated
+# codes and names, int32 ids and float32 hours (whole hours and quarters are exact in float32)
+# a frame is converted once inside a cached loader and the cache holds the compact copy
+COMPACT_DTYPES={"employee_id":"int32","project_no":"category","work_code":"category","category":"category","name":"category",
+    "date":"datetime64","hours_worked":"float32","hours":"float32","total_hours":"float32"}
+
+def frame_memory(df):
+    return int(df.memory_usage(index=True,deep=True).sum())
+
+def compact_frame(df,label=None):
+    # returns df with the COMPACT_DTYPES columns converted, the memory saved is logged (debug) under label
+    # deep memory_usage walks every object, only measured when the debug line will be logged
+    measure=label is not None and logger.isEnabledFor(logging.DEBUG)
+    before=frame_memory(df) if measure else 0
+    for column in df.columns.intersection(list(COMPACT_DTYPES)):
+        kind=COMPACT_DTYPES[column]
+        if kind=="datetime64":
+            if not pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column]=pd.to_datetime(df[column],errors="coerce",format="ISO8601")
+        elif kind=="int32" and df[column].isna().any():
+            df[column]=df[column].astype("Int32") # nullable when there are missing ids
+        else:
+            df[column]=df[column].astype(kind)
+    if measure:
+        after=frame_memory(df)
+        logger.debug("%s: %s rows, %.1f MiB -> %.1f MiB",label,f"{len(df):,}",before/2**20,after/2**20)
+    return df
+
+# whole tables (or the given years), the columns the pages and analysis modules actually use
+def load_employees(db_path=DB_PATH):
+    return query("SELECT employee_id,name,position,billable_rate FROM employees",db_path=db_path)
+
+@cache_on_db
+def load_time_entries(db_path=DB_PATH,years=None):
+    # compact dtypes, cached per years until the db changes
+    columns=["employee_id","project_no","work_code","date","hours_worked"]
+    df=read_snapshot("time_entries",columns,years,db_path,cached=False)
+    if df is None:
+        where,params=year_filter("date",years)
+        df=read_sql(f"SELECT {','.join(columns)} FROM time_entries{where}",params,db_path)
+    return compact_frame(df,"time_entries")
+
+@cache_on_db
+def load_non_billable_entries(db_path=DB_PATH,years=None):
+    columns=["employee_id","category","date","hours_worked"]
+    df=read_snapshot("non_billable_entries",columns,years,db_path,cached=False)
+    if df is None:
+        where,params=year_filter("date",years)
+        df=read_sql(f"SELECT {','.join(columns)} FROM non_billable_entries{where}",params,db_path)
+    return compact_frame(df,"non_billable_entries")
+
+def load_projects(db_path=DB_PATH):
+    return query("SELECT project_no,project_name,project_captain,developer,neighbourhood FROM projects",db_path=db_path)
+
+# monthly rollups maintained by the loaders (rollups.py in the repo root)
+def load_monthly_employee_hours(db_path=DB_PATH):
+    # billable_hours/non_billable_hours are NaN for a month with no entries of that kind
+    columns=["employee_id","month","billable_hours","non_billable_hours"]
+    df=read_snapshot("monthly_employee_hours",columns,db_path=db_path)
+    if df is None:
+        return query(f"SELECT {','.join(columns)} FROM monthly_employee_hours ORDER BY employee_id,month",db_path=db_path)
+    # float32 in the snapshot, the trend fits and seasonality sums expect float64 like sqlite gives
+    df=df.astype({"employee_id":"int64","billable_hours":"float64","non_billable_hours":"float64"})
+    return df.sort_values(["employee_id","month"],ignore_index=True)
@@ -1,9 +1,29 @@
 import pandas as pd
+import numpy as np
+import io
 import re
+import math
 import os
 import glob
+import json
+import hashlib
 import logging
-from datetime import datetime
+import argparse
+import itertools
+import queue
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler,QueueListener
+from concurrent.futures import ProcessPoolExecutor,ThreadPoolExecutor
+from collections import deque
+from time import perf_counter
+from datetime import datetime,time
+import openpyxl
+import xlrd
+from openpyxl.cell.cell import TYPE_ERROR,TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+from run_report import StageTimer,file_record,write_run_report,report_lines
 
 # https://realpython.com/python-logging/
 
@@ -11,17 +31,32 @@ from datetime import datetime
 # log file will be created in the same directory as the script
 error_logger=logging.getLogger("error_logger")
 error_logger.setLevel(logging.ERROR)
-error_handler=logging.FileHandler("error_log.txt", mode='w')
-error_formatter=logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-error_handler.setFormatter(error_formatter)
-error_logger.addHandler(error_handler)
 missing_logger = logging.getLogger("missing_logger")
 missing_logger.setLevel(logging.WARNING)
-missing_handler = logging.FileHandler("missing_names_log.txt", mode='w')
-missing_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-missing_handler.setFormatter(missing_formatter)
-missing_logger.addHandler(missing_handler)
 
+def setup_logging(error_log="error_log.txt",missing_log="missing_names_log.txt"):
+    # attach the file handlers, only done by the main run so importing
+    # this module (e.g. from small_tasks) doesnt truncate the logs
+    error_handler=logging.FileHandler(error_log, mode='w')
+    error_formatter=logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    error_handler.setFormatter(error_formatter)
+    error_logger.addHandler(error_handler)
+    missing_handler = logging.FileHandler(missing_log, mode='w')
+    missing_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    missing_handler.setFormatter(missing_formatter)
+    missing_logger.addHandler(missing_handler)
+
+# for --workers: worker processes push log records onto a queue and the parent
+# writes them, so only one process ever touches the log files
+# https://docs.python.org/3/howto/logging-cookbook.html#logging-to-a-single-file-from-multiple-processes
+class ParentLogHandler(logging.Handler):
+    def emit(self,record):
+        # hand the record to the parent's logger of the same name
+        logging.getLogger(record.name).handle(record)
+
+def init_worker(log_queue):
+    for logger in (error_logger,missing_logger):
+        logger.handlers=[QueueHandler(log_queue)]
 
 def parse_hours(val):
     # convert cell hours to float
@@ -36,6 +71,36 @@ def parse_hours(val):
     except ValueError:
         return 0.0 # whatever
 
+def parse_hours_block(block):
+    # parse_hours over a whole block of cells at once (the day columns and TOTAL),
+    # returns a float array the shape of the block
+    # blanks, "x" and anything that isnt a number are 0, negatives are 0
+    values=block.to_numpy(dtype=object).ravel()
+    filled=pd.notna(values)
+    parsed=np.zeros(len(values))
+    # to_numeric only picks out the numbers, it rounds long decimals ("103.03999999999999")
+    # differently to float() so the values themselves are converted with float()
+    numeric=filled&pd.notna(pd.to_numeric(values,errors="coerce"))
+    try:
+        parsed[numeric]=values[numeric].astype(float)
+    except ValueError: # something to_numeric takes and float() doesnt, do it all cell by cell
+        numeric[:]=False
+    # "x", text and the odd string float() takes but to_numeric doesnt (e.g. "1_0")
+    odd=filled&~numeric
+    if odd.any():
+        parsed[odd]=[parse_hours(v) for v in values[odd]]
+    parsed[~(parsed>=0)]=0.0 # NaN and negatives
+    return parsed.reshape(block.shape)
+
+def invalid_keys(col):
+    # mask of cells that are empty, "0" or "0.0" (a missing PROJECT NO/PROJECT NAME)
+    values=col.to_numpy(dtype=object)
+    return pd.isna(values)|np.isin(np.char.strip(values.astype(str)),["","0","0.0"])
+
+def count_numeric_cells(row):
+    # cells that only contain digits
+    return int(np.char.isdecimal(np.char.strip(row.to_numpy(dtype=object).astype(str))).sum())
+
 def drop_if_both_empty(df_in):
 
     if df_in.empty:
@@ -47,289 +112,849 @@ def drop_if_both_empty(df_in):
     for col in needed_cols:
         if col not in df_in.columns:
             return df_in
-    
-    # check invalid values in PROJECT NO and PROJECT NAME columns
-    def is_invalid(val):
-        if pd.isnull(val):
-            return True
-        s=str(val).strip()
-        return s in ["","0","0.0"]
 
     # create a mask to filter out rows where both PROJECT NO and PROJECT NAME are invalid
-    mask=~((df_in["PROJECT NO"].apply(is_invalid)) & (df_in["PROJECT NAME"].apply(is_invalid)))
+    mask=~(invalid_keys(df_in["PROJECT NO"])&invalid_keys(df_in["PROJECT NAME"]))
     return df_in[mask].copy()
 
-def process_file(file_path,input_base,output_base):
+# readers
+# the grid used to come from pd.read_excel(sheet_name="Sheet1",header=None,dtype=str), which converts
+# every column of the sheet (the junk past the table too) and for .xls loads every sheet in the book.
+# the readers below build the same rows pandas' own readers would, only for the first READ_COLS
+# columns, and hand them to the same parser read_excel uses, so the grid is read_excel's cut to
+# READ_COLS columns. workbooks are told apart by their first bytes like pandas does (some .xls are
+# really xlsx), formats without a reader here (.xlsb, pyxlsb) still go through read_excel
+READ_COLS=40 # the table is 36 wide, the name/month candidates are inside that
+XLS_MAGIC=b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+ZIP_MAGIC=b"PK\x03\x04"
+
+def xlsx_cell(cell):
+    # same conversion as pandas' openpyxl reader
+    if cell.value is None:
+        return ""
+    if cell.data_type==TYPE_ERROR:
+        return np.nan
+    if cell.data_type==TYPE_NUMERIC:
+        val=int(cell.value)
+        return val if val==cell.value else float(cell.value)
+    return cell.value
+
+def xlsx_rows(source):
+    # openpyxl in read only, values only mode, rows cut to READ_COLS cells
+    # source is a path or the workbook's bytes (same for xls_rows)
+    if isinstance(source,bytes):
+        source=io.BytesIO(source)
+    book=openpyxl.load_workbook(source,read_only=True,data_only=True,keep_links=False)
+    try:
+        sheet=book["Sheet1"]
+        sheet.reset_dimensions() # the stored dimensions cant be trusted
+        rows=[]
+        last_row_with_data=-1
+        for row_number,row in enumerate(sheet.iter_rows(max_col=READ_COLS)):
+            converted=[xlsx_cell(cell) for cell in row]
+            while converted and converted[-1]=="":
+                converted.pop()
+            if converted:
+                last_row_with_data=row_number
+            rows.append(converted)
+        return rows[:last_row_with_data+1]
+    finally:
+        book.close()
+
+def xls_cell(value,cell_type,datemode):
+    # same conversion as pandas' xlrd reader
+    if cell_type==xlrd.XL_CELL_DATE:
+        try:
+            value=xlrd.xldate.xldate_as_datetime(value,datemode)
+        except OverflowError:
+            return value
+        # dates on the epoch are times
+        if value.timetuple()[0:3]==((1904,1,1) if datemode else (1899,12,31)):
+            value=time(value.hour,value.minute,value.second,value.microsecond)
+    elif cell_type==xlrd.XL_CELL_ERROR:
+        value=np.nan
+    elif cell_type==xlrd.XL_CELL_BOOLEAN:
+        value=bool(value)
+    elif cell_type==xlrd.XL_CELL_NUMBER and math.isfinite(value):
+        if int(value)==value:
+            value=int(value)
+    return value
+
+def xls_rows(source):
+    # xlrd on_demand, only Sheet1 is loaded, rows cut to READ_COLS cells
+    if isinstance(source,bytes):
+        book=xlrd.open_workbook(file_contents=source,on_demand=True)
+    else:
+        book=xlrd.open_workbook(source,on_demand=True)
+    try:
+        sheet=book.sheet_by_name("Sheet1")
+        ncols=min(sheet.ncols,READ_COLS)
+        return [[xls_cell(value,cell_type,book.datemode) for value,cell_type in zip(sheet.row_values(i,0,ncols),sheet.row_types(i,0,ncols))]
+            for i in range(sheet.nrows)]
+    finally:
+        book.release_resources()
+
+READERS={"xlsx":xlsx_rows,"xls":xls_rows}
+
+def sheet_format(head):
+    # workbook format from its first bytes, None for anything without a reader in READERS
+    if head.startswith(XLS_MAGIC):
+        return "xls"
+    if head.startswith(ZIP_MAGIC):
+        return "xlsx"
+    return None
+
+def rows_to_frame(rows):
+    # the rest of what read_excel does with a sheet's rows
+    if rows:
+        width=max(len(row) for row in rows)
+        rows=[row+[""]*(width-len(row)) for row in rows]
+    try:
+        return TextParser(rows,header=None,dtype=str,skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+def read_raw_sheet(file_path,reader="capped",data=None):
+    # raw grid of Sheet1, everything as strings, no header
+    # reader="pandas" is the old full read_excel, kept as the baseline for small_tasks/benchmark_readers.py
+    # and clean_workbook(single_parse=False)
+    # data: the workbook's bytes if they were already read (the prefetch in run_pipeline)
+    rows_reader=None
+    if reader=="capped" and not file_path.lower().endswith(".xlsb"):
+        if data is None:
+            with open(file_path,"rb") as f:
+                head=f.read(8)
+        else:
+            head=data[:8]
+        rows_reader=READERS.get(sheet_format(head))
+    if rows_reader is None:
+        with pd.ExcelFile(file_path if data is None else io.BytesIO(data)) as xls:
+            return pd.read_excel(xls,sheet_name="Sheet1",header=None,dtype=str)
+    return rows_to_frame(rows_reader(file_path if data is None else data))
+
+def frame_from_raw(df_raw,header_row):
+    # same as read_excel(header=header_row) but sliced out of the grid we already have
+    # column names get overwritten with expected_cols anyway
+    df=df_raw.iloc[header_row+1:].reset_index(drop=True)
+    df.columns=range(df.shape[1])
+    return df
+
+# manually determine employee name and month/year from the first few rows of the file.
+# if time, try to find a better solution
+# candidate locations for employee name (row, col):
+# priority order: Q3 (2,16), Q2 (1,16), R3 (2,17), O3 (2,14), Q1 (1,16), R1 (1,17), O1 (1,14)
+NAME_CANDIDATES=[(2,16),(1,16),(2,17),(2,14),(1,16),(1,17),(1,14)]
+# for month/year, first try AJ3 (r:3, i:2, c:35),
+# then AJ2 (r:2, i:1, c:35),
+# then AK3 (r:3, i:2, c:36),
+# then AK2 (r:2, i:1, c:36),
+# then AI2 (r:2, i:1, c:34),
+# then AI3 (r:3, i:2, c:34)
+# same as above, but with different column numbers
+MONTH_YEAR_CANDIDATES=[(2,35),(1,35),(2,36),(1,36),(1,34),(2,34)]
+
+def has_value(df_raw,row_idx,col_idx):
+    if df_raw.shape[0]>row_idx and df_raw.shape[1]>col_idx:
+        candidate=df_raw.iloc[row_idx,col_idx]
+        return pd.notnull(candidate) and str(candidate).strip()!=""
+    return False
+
+def first_filled(df_raw,candidates):
+    # first candidate cell with something in it, as [row,col] (json friendly), or None
+    for row_idx,col_idx in candidates:
+        if has_value(df_raw,row_idx,col_idx):
+            return [row_idx,col_idx]
+    return None
+
+def detect_header_row(df_raw):
+    # determine header row for timecard table.
+    # we try row 4 (i 3): if that row has at least 5 cells that are purely numeric, we assume it's the header; else use row 5 (i 4).
+    header_row_candidate=3
+    if df_raw.shape[0]>header_row_candidate:
+        row_contents=df_raw.iloc[header_row_candidate]
+        #cells that only contain numeric
+        numeric_count=count_numeric_cells(row_contents)
+        return header_row_candidate if numeric_count>=5 else 4
+    return 4
+
+def probe_layout(df_raw):
+    # where this sheet keeps the name and month/year, and its header row
+    return {"name_cell":first_filled(df_raw,NAME_CANDIDATES),
+            "month_year_cell":first_filled(df_raw,MONTH_YEAR_CANDIDATES),
+            "header_row":detect_header_row(df_raw)}
+
+# template fingerprints
+# the timesheets come from a handful of templates that change every few years. a template is
+# fingerprinted from the top of Sheet1 (rows 1-4): the table width, every label and where it is
+# (digits as #) and which of the name/month candidate cells are filled. that decides everything
+# probe_layout looks at, so the layout resolved for the first file of a template holds for the
+# rest and they skip the probing. templates.json in the output folder keeps the layouts with a
+# few sample files each, layouts not seen before are listed in the processing summary
+TEMPLATES_NAME="templates.json"
+FINGERPRINT_ROWS=4
+TEMPLATE_SAMPLES=3
+VALUE_CELLS=set(NAME_CANDIDATES+MONTH_YEAR_CANDIDATES)
+
+def template_fingerprint(df_raw):
+    cells=[]
+    for (row_idx,col_idx),val in np.ndenumerate(df_raw.iloc[:FINGERPRINT_ROWS].to_numpy(dtype=object)):
+        if pd.isnull(val) or str(val).strip()=="":
+            continue
+        if (row_idx,col_idx) in VALUE_CELLS:
+            cells.append(f"{row_idx},{col_idx}") # filled, not what with
+        else:
+            label=re.sub(r"\d+","#"," ".join(str(val).split()).upper())
+            cells.append(f"{row_idx},{col_idx}:{label}")
+    # the candidate lists are part of it so changing them invalidates the stored layouts
+    signature=f"{NAME_CANDIDATES}{MONTH_YEAR_CANDIDATES}{min(df_raw.shape[1],36)}|"+"|".join(cells)
+    return hashlib.sha1(signature.encode()).hexdigest()[:12]
+
+def load_templates(output_base):
+    path=os.path.join(output_base,TEMPLATES_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_templates(templates,output_base):
+    os.makedirs(output_base,exist_ok=True)
+    path=os.path.join(output_base,TEMPLATES_NAME)
+    with open(path+".tmp","w") as f:
+        json.dump(templates,f,indent=1,sort_keys=True)
+    os.replace(path+".tmp",path)
+
+def record_template(templates,metrics,file_key):
+    # keep the layout a file was cleaned with, returns True for a template not seen before
+    fingerprint=metrics["template"]
+    new=fingerprint not in templates
+    if new:
+        templates[fingerprint]={**metrics["layout"],"samples":[]}
+    samples=templates[fingerprint]["samples"]
+    if len(samples)<TEMPLATE_SAMPLES and file_key not in samples:
+        samples.append(file_key)
+    return new
+
+# stages of metrics["timings"], in the order a file goes through them (write is added by whoever writes the csvs)
+CLEAN_STAGES=("read","header","parse","clean","write")
+
+def clean_workbook(file_path,single_parse=True,templates=None,data=None):
+    # read and clean one timesheet
+    # returns (employee_name,month_year,project_data,summary_data,metrics)
+    # single_parse: read the workbook once and derive everything from that grid
+    # single_parse=False is the old path (3 full read_excel reads, none capped), the baseline
+    # small_tasks/compare_single_parse.py checks the capped single read against
+    # templates: known layouts by fingerprint (see template_fingerprint), files of those skip the probing
+    # data: the workbook's bytes, already read
+    # metrics["timings"] has the seconds spent reading, finding the header/layout, parsing and cleaning
+    timer=StageTimer()
     metrics={"file":file_path,
             "missing_name":0,
             "missing_date":0,
             "project_rows":0,
             "summary_rows":0,
-            "has_summary":0
+            "has_summary":0,
+            "template_hit":0
             } # for logging purposes
-    try:
-        with pd.ExcelFile(file_path) as xls:
-            df_raw=pd.read_excel(xls,sheet_name="Sheet1",header=None,dtype=str)
-        # manually determine employee name and month/year from the first few rows of the file.
-        # if time, try to find a better solution
-        # candidate locations for employee name (row, col):
-        # priority order: Q3 (2,16), Q2 (1,16), R3 (2,17), O3 (2,14), Q1 (1,16), R1 (1,17), O1 (1,14)
-        
-        candidates=[(2,16),(1,16),(2,17),(2,14),(1,16),(1,17),(1,14)]
-        # find employee name in the candidates
-        employee_name_raw=None
-        candidate_row=None
-        for row_idx,col_idx in candidates:
-            if df_raw.shape[0]>row_idx and df_raw.shape[1]>col_idx:
-                #cjecl
-                candidate=df_raw.iloc[row_idx,col_idx]
-                if pd.notnull(candidate) and str(candidate).strip()!="":
-                    employee_name_raw=candidate
-                    candidate_row=row_idx
-                    # found
-                    #print(employee_name,candidate_row,candidate)
-                    break
-        #manually determine month/year from the first few rows of the file
-        # for month/year, first try AJ3 (r:3, i:2, c:35),
-        # then AJ2 (r:2, i:1, c:35),
-        # then AK3 (r:3, i:2, c:36),
-        # then AK2 (r:2, i:1, c:36),
-        # then AI2 (r:2, i:1, c:34),
-        # then AI3 (r:3, i:2, c:34)
-        # same as above, but with different column numbers
-        month_year_raw=None
-        month_year_candidates=[(2,35),(1,35),(2,36),(1,36),(1,34),(2,34)]
-        for row_idx,col_idx in month_year_candidates:
-            if df_raw.shape[0]>row_idx and df_raw.shape[1]>col_idx:
-                candidate=df_raw.iloc[row_idx,col_idx]
-                if pd.notnull(candidate) and str(candidate).strip()!="":
-                    # print(candidate)
-                    month_year_raw=candidate
-                    break
-        
-        # convert employee name and month/year to strings, and strip whitespace
-        # if either is missing, log it and set to "Unknown"
-        employee_name=str(employee_name_raw).strip() if employee_name_raw is not None else "Unknown"
-        month_year = str(month_year_raw).strip() if pd.notnull(month_year_raw) and str(month_year_raw).strip() != "" else "Unknown"
-        if employee_name=="Unknown":
-            metrics["missing_name"]=1
-            missing_logger.warning(f"Missing name in file:{file_path}")
-        if month_year=="Unknown":
-            metrics["missing_date"]=1
-            missing_logger.warning(f"Missing month/year in file:{file_path}")
-
-        print(f"Detected Name = {employee_name}, Month/Year ={month_year}")
-
-        # determine header row for timecard table.
-        # we try row 4 (i 3): if that row has at least 5 cells that are purely numeric, we assume it's the header; else use row 5 (i 4).
-        header_row_candidate=3
-        with pd.ExcelFile(file_path) as xls:
-            temp_df=pd.read_excel(xls,sheet_name="Sheet1",header=None,dtype=str)
-        if temp_df.shape[0]>header_row_candidate:
-            row_contents=temp_df.iloc[header_row_candidate]
-            #cells that only contain numeric
-            numeric_count = sum(
-                1 for cell in row_contents
-                if re.match(r'^\d+$', str(cell).strip()))
-            header_row=header_row_candidate if numeric_count>=5 else 4
-        else:
-            header_row=4
-
-        #print(f"Header row = {header_row}")
-        #to account for adjusting header rows
-        # manual time sheets 
+    df_raw=read_raw_sheet(file_path,reader="capped" if single_parse else "pandas",data=data)
+    metrics["bytes_read"]=len(data) if data is not None else os.path.getsize(file_path)
+    timer.lap("read")
+    fingerprint=template_fingerprint(df_raw)
+    layout=templates.get(fingerprint) if templates else None
+    if layout is not None:
+        metrics["template_hit"]=1
+    else:
+        layout=probe_layout(df_raw)
+        if not single_parse:
+            layout["header_row"]=detect_header_row(read_raw_sheet(file_path,reader="pandas"))
+    metrics["template"]=fingerprint
+    metrics["layout"]={k:layout[k] for k in ("name_cell","month_year_cell","header_row")}
+
+    name_cell=layout["name_cell"]
+    month_year_cell=layout["month_year_cell"]
+    employee_name_raw=df_raw.iloc[name_cell[0],name_cell[1]] if name_cell else None
+    month_year_raw=df_raw.iloc[month_year_cell[0],month_year_cell[1]] if month_year_cell else None
+    header_row=layout["header_row"]
+    
+    # convert employee name and month/year to strings, and strip whitespace
+    # if either is missing, log it and set to "Unknown"
+    employee_name=str(employee_name_raw).strip() if employee_name_raw is not None else "Unknown"
+    month_year = str(month_year_raw).strip() if pd.notnull(month_year_raw) and str(month_year_raw).strip() != "" else "Unknown"
+    if employee_name=="Unknown":
+        metrics["missing_name"]=1
+        missing_logger.warning(f"Missing name in file:{file_path}")
+    if month_year=="Unknown":
+        metrics["missing_date"]=1
+        missing_logger.warning(f"Missing month/year in file:{file_path}")
+
+    print(f"Detected Name = {employee_name}, Month/Year ={month_year}")
+    timer.lap("header")
+
+    #print(f"Header row = {header_row}")
+    #to account for adjusting header rows
+    # manual time sheets 
+    if single_parse:
+        df=frame_from_raw(df_raw,header_row)
+    else:
         with pd.ExcelFile(file_path) as xls:
             df=pd.read_excel(xls,sheet_name="Sheet1",header=header_row,dtype=str)
 
-        #limit to first 36 cols since nonsense beyond those sometimes
-        #print(df.shape)
-        df=df.iloc[:,:36]
-        expected_cols=(
-            ["PROJECT NO", "PROJECT NAME", "WORK CODE"] +
-            [str(i) for i in range(1,32)] +
-            ["TOTAL","DESCRIPTION / COMMENTS"])
-        df.columns=expected_cols[:df.shape[1]]
-        #print(df.columns)
-        #print(df.shape[1])
-        
+    #limit to first 36 cols since nonsense beyond those sometimes
+    #print(df.shape)
+    df=df.iloc[:,:36]
+    expected_cols=(
+        ["PROJECT NO", "PROJECT NAME", "WORK CODE"] +
+        [str(i) for i in range(1,32)] +
+        ["TOTAL","DESCRIPTION / COMMENTS"])
+    df.columns=expected_cols[:df.shape[1]]
+    #print(df.columns)
+    #print(df.shape[1])
+    
+    
+    # day columns and TOTAL parsed as one block
+    hour_cols=[c for c in df.columns if c.isdigit()]+(["TOTAL"] if "TOTAL" in df.columns else [])
+    if hour_cols:
+        df[hour_cols]=parse_hours_block(df[hour_cols])
+    timer.lap("parse")
+
+    if "PROJECT NAME" not in df.columns:
+        raise ValueError("PROJECT NAME is missing; strange layout")
+    subtotal_idx=df[df["PROJECT NAME"].str.contains("subtotal",case=False,na=False)].index
+    if len(subtotal_idx)>0:
+        subrow=subtotal_idx[0]
+        project_data=df.iloc[:subrow].copy()
+        summary_data=df.iloc[subrow+1 :].copy()
+    else:
+        project_data=df.copy()
+        summary_data=pd.DataFrame()
+
+    # drop rows if both empty
+    project_data=drop_if_both_empty(project_data)
+    summary_data=drop_if_both_empty(summary_data)
+
+    # hnalde summary data
+    if not summary_data.empty:
+        summary_data.reset_index(drop=True,inplace=True)
+        #further cleaning
+        col0=summary_data.columns[0]
+        total_idx=summary_data[summary_data[col0].fillna("").str.lower().str.strip().str.contains("total", na=False)].index
+        if not total_idx.empty:
+            cutoff=total_idx[0]
+            summary_data=summary_data.iloc[:cutoff].copy()
         
-        day_cols=[c for c in df.columns if c.isdigit()]
-        for c in day_cols:
-            df[c]=df[c].apply(parse_hours)
-        if "TOTAL" in df.columns:
-            df["TOTAL"]=df["TOTAL"].apply(parse_hours)
-
-        if "PROJECT NAME" not in df.columns:
-            raise ValueError("PROJECT NAME is missing; strange layout")
-        subtotal_idx=df[df["PROJECT NAME"].str.contains("subtotal",case=False,na=False)].index
-        if len(subtotal_idx)>0:
-            subrow=subtotal_idx[0]
-            project_data=df.iloc[:subrow].copy()
-            summary_data=df.iloc[subrow+1 :].copy()
-        else:
-            project_data=df.copy()
-            summary_data=pd.DataFrame()
-
-        # drop rows if both empty
-        project_data=drop_if_both_empty(project_data)
-        summary_data=drop_if_both_empty(summary_data)
-
-        # hnalde summary data
-        if not summary_data.empty:
-            summary_data.reset_index(drop=True,inplace=True)
-            #further cleaning
-            col0=summary_data.columns[0]
-            total_idx=summary_data[summary_data[col0].fillna("").str.lower().str.strip().str.contains("total", na=False)].index
-            if not total_idx.empty:
-                cutoff=total_idx[0]
-                summary_data=summary_data.iloc[:cutoff].copy()
-            
-            # collapse first 3 cols in 1
-            if len(summary_data.columns)>=3:
-                c0,c1,c2=summary_data.columns[0],summary_data.columns[1],summary_data.columns[2]
-                summary_data["non-billable"]=(summary_data[c0].fillna("") + " " +summary_data[c1].fillna("") + " " +summary_data[c2].fillna("")).str.strip()
-                summary_data.drop(columns=[c0, c1,c2],inplace=True)
-                new_cols=["non-billable"]+[col for col in summary_data.columns if col!="non-billable"]
-                summary_data=summary_data[new_cols]
-
-        if not project_data.empty and len(project_data) > 1:
-            project_data = project_data.drop(project_data.index[0]).copy()
-
-        # log
-        metrics["project_rows"]=len(project_data)
-        metrics["summary_rows"]=len(summary_data)
-        if not summary_data.empty:
-            metrics["has_summary"]=1
-
-        # alot was drawn inspo from this
-        # https://www.youtube.com/watch?v=-ARI4Cz-awo
-
-        rel_path=os.path.relpath(file_path, input_base)
-        subdir=os.path.dirname(rel_path)
-        proj_out_folder = os.path.join(output_base, subdir, "Projects")
-        sum_out_folder = os.path.join(output_base,subdir, "Summaries")
-        os.makedirs(proj_out_folder,exist_ok=True)
-        os.makedirs(sum_out_folder,exist_ok=True)
-
-        # create file safe name
-        file_safe_name=re.sub(r"\W+","_",employee_name)
-        file_safe_month =re.sub(r"\W+","_",month_year)
-        base_name=f"{file_safe_name}_{file_safe_month}"
-        projects_csv=os.path.join(proj_out_folder,f"{base_name}_projects.csv")
-        summary_csv=os.path.join(sum_out_folder,f"{base_name}_summary.csv")
-
-        project_data.to_csv(projects_csv,index=False)
-        if not summary_data.empty:
-            summary_data.to_csv(summary_csv,index=False)
-            print(f"[SAVED] {projects_csv}")
-            print(f"[SAVED] {summary_csv}")
-        else:
-            print(f"[SAVED] {projects_csv} (no summary rows)")
+        # collapse first 3 cols in 1
+        if len(summary_data.columns)>=3:
+            c0,c1,c2=summary_data.columns[0],summary_data.columns[1],summary_data.columns[2]
+            summary_data["non-billable"]=(summary_data[c0].fillna("") + " " +summary_data[c1].fillna("") + " " +summary_data[c2].fillna("")).str.strip()
+            summary_data.drop(columns=[c0, c1,c2],inplace=True)
+            new_cols=["non-billable"]+[col for col in summary_data.columns if col!="non-billable"]
+            summary_data=summary_data[new_cols]
+
+    if not project_data.empty and len(project_data) > 1:
+        project_data = project_data.drop(project_data.index[0]).copy()
+
+    # log
+    metrics["project_rows"]=len(project_data)
+    metrics["summary_rows"]=len(summary_data)
+    if not summary_data.empty:
+        metrics["has_summary"]=1
+    timer.lap("clean")
+    metrics["timings"]=timer.seconds
+    return employee_name,month_year,project_data,summary_data,metrics
+
+def write_csv(df,path):
+    # write then rename, a temp name per process/thread so two workbooks writing the same csv name
+    # at once (--workers) each replace it whole instead of interleaving
+    tmp=f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_csv(tmp,index=False)
+        os.replace(tmp,path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
+def write_cleaned_csvs(file_path,input_base,output_base,employee_name,month_year,project_data,summary_data):
+    # write the Projects/Summaries csvs, returns their paths relative to output_base
+    # alot was drawn inspo from this
+    # https://www.youtube.com/watch?v=-ARI4Cz-awo
+    rel_path=os.path.relpath(file_path, input_base)
+    subdir=os.path.dirname(rel_path)
+    proj_out_folder = os.path.join(output_base, subdir, "Projects")
+    sum_out_folder = os.path.join(output_base,subdir, "Summaries")
+    os.makedirs(proj_out_folder,exist_ok=True)
+    os.makedirs(sum_out_folder,exist_ok=True)
+
+    # create file safe name
+    file_safe_name=re.sub(r"\W+","_",employee_name)
+    file_safe_month =re.sub(r"\W+","_",month_year)
+    base_name=f"{file_safe_name}_{file_safe_month}"
+    projects_csv=os.path.join(proj_out_folder,f"{base_name}_projects.csv")
+    summary_csv=os.path.join(sum_out_folder,f"{base_name}_summary.csv")
+
+    write_csv(project_data,projects_csv)
+    outputs=[os.path.relpath(projects_csv,output_base)]
+    if not summary_data.empty:
+        write_csv(summary_data,summary_csv)
+        outputs.append(os.path.relpath(summary_csv,output_base))
+        print(f"[SAVED] {projects_csv}")
+        print(f"[SAVED] {summary_csv}")
+    else:
+        print(f"[SAVED] {projects_csv} (no summary rows)")
+    return outputs
+
+def process_file(file_path,input_base,output_base,single_parse=True,templates=None):
+    try:
+        employee_name,month_year,project_data,summary_data,metrics=clean_workbook(file_path,single_parse,templates)
+        start=perf_counter()
+        metrics["outputs"]=write_cleaned_csvs(file_path,input_base,output_base,employee_name,month_year,project_data,summary_data)
+        metrics["timings"]["write"]=perf_counter()-start
         return metrics
     except Exception as e:
         error_logger.error(f"Error processing {file_path}: {e}")
         raise
 
-# main loop
-input_directory="Timekeeping"
-output_base="Cleaned_Timekeeping"
-
-#log
-total_files=0
-successful_files=0
-error_files=0
-errored_files=[]
-missing_name_count=0
-missing_date_count=0
-total_project_rows=0
-total_summary_rows=0
-files_with_summary=0
-
-all_files=[]
-for year_folder in os.listdir(input_directory):
-    # check if the folder name is a valid year,month
-    if not year_folder.isdigit():
-        continue
-    year=int(year_folder)
-    if year<2004 or year>2025:
-        continue
-    year_path=os.path.join(input_directory,year_folder)
-    if not os.path.isdir(year_path):
-        continue
-    for month_folder in os.listdir(year_path):
-        month_path=os.path.join(year_path,month_folder)
-        if not os.path.isdir(month_path):
+def find_timesheet_files(input_directory,min_year=2004,max_year=2025):
+    all_files=[]
+    for year_folder in os.listdir(input_directory):
+        # check if the folder name is a valid year,month
+        if not year_folder.isdigit():
+            continue
+        year=int(year_folder)
+        if year<min_year or year>max_year:
             continue
-        for file in glob.glob(os.path.join(month_path,"*.xls*")):
-            if "~$" in os.path.basename(file).lower(): #weird fragmented data
+        year_path=os.path.join(input_directory,year_folder)
+        if not os.path.isdir(year_path):
+            continue
+        for month_folder in os.listdir(year_path):
+            month_path=os.path.join(year_path,month_folder)
+            if not os.path.isdir(month_path):
                 continue
-            all_files.append(file)
-
-#print(f"Found {len(all_files)} files in {input_directory}")
-print(f"Total files found: {len(all_files)}")
-
-for file in all_files:
-    total_files+=1
+            for file in glob.glob(os.path.join(month_path,"*")):
+                # extension check by hand, glob is case sensitive on linux and some are .XLS
+                if not os.path.splitext(file)[1].lower().startswith(".xls"):
+                    continue
+                if "~$" in os.path.basename(file).lower(): #weird fragmented data
+                    continue
+                all_files.append(file)
+    return sorted(all_files)
+
+# incremental cleaning
+# manifest.json in the output folder maps each source workbook to its size, mtime,
+# sha256 and the csvs it produced. a rerun only cleans new/changed workbooks
+MANIFEST_NAME="manifest.json"
+# stored in every manifest entry, bump it whenever a change to the cleaning changes the csvs it writes
+# so the next incremental run recleans everything instead of keeping csvs from the old code
+CLEANER_VERSION=1
+
+def manifest_key(file_path,input_base):
+    # forward slashes so the manifest is the same on windows and linux
+    return os.path.relpath(file_path,input_base).replace(os.sep,"/")
+
+def hash_file(file_path):
+    h=hashlib.sha256()
+    with open(file_path,"rb") as f:
+        for chunk in iter(lambda:f.read(1<<20),b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_signature(file_path):
+    st=os.stat(file_path)
+    return {"size":st.st_size,"mtime":st.st_mtime}
+
+def load_manifest(output_base):
+    path=os.path.join(output_base,MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest,output_base):
+    os.makedirs(output_base,exist_ok=True)
+    path=os.path.join(output_base,MANIFEST_NAME)
+    # write then rename so a killed run doesnt leave half a manifest
+    with open(path+".tmp","w") as f:
+        json.dump(manifest,f,indent=1,sort_keys=True)
+    os.replace(path+".tmp",path)
+
+def plan_incremental(all_files,input_base,output_base,manifest):
+    # returns (files to clean with their new signature, number unchanged, manifest keys whose source is gone)
+    to_process=[]
+    unchanged=0
+    seen=set()
+    for file in all_files:
+        key=manifest_key(file,input_base)
+        seen.add(key)
+        entry=manifest.get(key)
+        sig=file_signature(file)
+        outputs_ok=entry is not None and entry.get("cleaner")==CLEANER_VERSION and all(os.path.exists(os.path.join(output_base,o)) for o in entry["outputs"])
+        if outputs_ok and entry["size"]==sig["size"] and entry["mtime"]==sig["mtime"]:
+            unchanged+=1
+            continue
+        # only hash when the cheap check fails
+        sig["sha256"]=hash_file(file)
+        if outputs_ok and entry["sha256"]==sig["sha256"]:
+            # touched but same bytes, just refresh the stat info
+            entry.update(sig)
+            unchanged+=1
+            continue
+        to_process.append((file,sig))
+    removed=[key for key in manifest if key not in seen]
+    return to_process,unchanged,removed
+
+def remove_outputs(outputs,manifest,output_base):
+    # delete csvs a source no longer produces, returns (number deleted,manifest keys to reclean)
+    # two workbooks can map to the same csv name. the csv may hold what the source that dropped it
+    # wrote, so it is deleted anyway and the other workbooks claiming it are returned to be cleaned
+    # again, which writes it back with their content
+    claimants={}
+    for key,entry in manifest.items():
+        for o in entry["outputs"]:
+            claimants.setdefault(o,[]).append(key)
+    removed=0
+    dirty=set()
+    for o in outputs:
+        path=os.path.join(output_base,o)
+        dirty.update(claimants.get(o,[]))
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[REMOVED] {path}")
+            removed+=1
+    return removed,dirty
+
+def reclean_files(keys,input_base,signatures):
+    # source files of manifest keys returned by remove_outputs, with their signature added to signatures
+    files=[]
+    for key in sorted(keys):
+        file=os.path.join(input_base,*key.split("/"))
+        if os.path.exists(file):
+            signatures[file]={**file_signature(file),"sha256":hash_file(file)}
+            files.append(file)
+    return files
+
+def process_file_safe(file,input_base,output_base,templates=None):
+    # returns (file,metrics,error) instead of raising so results can come back from a worker
     try:
-        metrics=process_file(file,input_directory,output_base)
-        successful_files+=1
-        if metrics["missing_name"]:
-            missing_name_count+=1
-        if metrics["missing_date"]:
-            missing_date_count+=1
-        total_project_rows+=metrics["project_rows"]
-        total_summary_rows+=metrics["summary_rows"]
-        files_with_summary+=metrics["has_summary"]
+        return file,process_file(file,input_base,output_base,templates=templates),None
     except Exception as exc:
-        error_files+=1
-        errored_files.append(file)
-        print(f"Error processing {file}: {exc}")
-
-print("\nProcessing Summary:")
-print(f"Total files processed: {total_files}")
-print(f"Successfully processed: {successful_files}")
-print(f"Files with errors: {error_files}")
-
-if errored_files:
-    print("Errored files:")
-    for f in errored_files:
-        print("  ",f)
-
-print(f"Files with missing name: {missing_name_count}")
-print(f"Files with missing month/year: {missing_date_count}")
-print(f"Total project rows processed: {total_project_rows}")
-print(f"Total summary rows processed: {total_summary_rows}")
-print(f"Files with summary rows: {files_with_summary}")
-
-# create a summary file, for personal purpose and future reference
-processing_summary_folder="Processing_Summaries"
-os.makedirs(processing_summary_folder,exist_ok=True)
-timestamp=datetime.now().strftime("%Y%m%d_%H%M%S")
-summary_filename=f"processing_summary_{timestamp}.txt"
-summary_filepath=os.path.join(processing_summary_folder,summary_filename)
-
-
-with open(summary_filepath,"w") as f:
-    f.write("Processing Summary:\n")
-    f.write(f"Timestamp: {datetime.now()}\n")
-    f.write(f"Total files processed: {total_files}\n")
-    f.write(f"Successfully processed: {successful_files}\n")
-    f.write(f"Files with errors: {error_files}\n")
-    if errored_files:
-        f.write("Errored files:\n")
-        for ef in errored_files:
-            f.write(f"  {ef}\n")
-    f.write(f"Files with missing name: {missing_name_count}\n")
-    f.write(f"Files with missing month/year: {missing_date_count}\n")
-    f.write(f"Total project rows processed: {total_project_rows}\n")
-    f.write(f"Total summary rows processed: {total_summary_rows}\n")
-    f.write(f"Files with summary rows: {files_with_summary}\n")
-
-
-# print("report")
-#print("Processing Summary:")
-#print(f"Total files processed: {total_files}")
+        return file,None,str(exc)
+
+def run_serial(all_files,input_directory,output_base,templates):
+    # templates is updated by the caller as results come back, so later files use what earlier ones found
+    for file in all_files:
+        yield process_file_safe(file,input_directory,output_base,templates)
+
+def run_parallel(all_files,input_directory,output_base,workers,templates):
+    # each worker gets the templates known at the start of the run
+    log_queue=multiprocessing.Queue()
+    listener=QueueListener(log_queue,ParentLogHandler())
+    listener.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers,initializer=init_worker,initargs=(log_queue,)) as pool:
+            # map keeps the input order so the summary lists errors in the same order as a serial run
+            n=len(all_files)
+            written=set() # csvs written by the files yielded so far
+            for file,metrics,exc in pool.map(process_file_safe,all_files,[input_directory]*n,[output_base]*n,[templates]*n,chunksize=8):
+                if metrics is not None and written.intersection(metrics["outputs"]):
+                    # an earlier workbook of the run writes the same csv name (e.g. a .xlsx and its .xlsb copy)
+                    # and the two processes raced for it. both are done now, so cleaning this one again
+                    # here leaves the later file's csv, like a serial run
+                    file,metrics,exc=process_file_safe(file,input_directory,output_base,templates)
+                if metrics is not None:
+                    written.update(metrics["outputs"])
+                yield file,metrics,exc
+    finally:
+        listener.stop()
+
+# prefetch pipeline for the serial run
+# reading a workbook off the (network) Timekeeping share, cleaning it and writing its csvs used to
+# strictly alternate, so the cpu sat idle on every read. run_pipeline overlaps them: io threads read
+# the bytes of the next PREFETCH workbooks ahead, the main thread cleans from those bytes and a
+# writer thread writes the csvs in batches. results come back in input order once written, like run_serial
+PREFETCH=8
+IO_THREADS=4
+WRITE_BATCH=16
+
+class StageStats:
+    # files, bytes, busy and waiting seconds of one pipeline stage, added to from several threads
+    def __init__(self,name):
+        self.name=name
+        self.files=0
+        self.bytes=0
+        self.seconds=0.0
+        self.waiting=0.0
+        self.lock=threading.Lock()
+
+    def add(self,seconds,nbytes=0):
+        with self.lock:
+            self.files+=1
+            self.bytes+=nbytes
+            self.seconds+=seconds
+
+    def summary(self):
+        mib=self.bytes/2**20
+        rate=f"{self.files/self.seconds:.1f} files/s" if self.seconds else "-"
+        if self.bytes and self.seconds:
+            rate+=f", {mib/self.seconds:.1f} MiB/s"
+        return f"{self.name}: {self.files} files, {mib:.1f} MiB, {self.seconds:.1f}s busy ({rate}), {self.waiting:.1f}s waiting for input"
+
+def pipeline_stages():
+    return {name:StageStats(name) for name in ("read","clean","write")}
+
+def read_bytes(file_path,stats):
+    # returns (bytes,seconds reading them)
+    start=perf_counter()
+    with open(file_path,"rb") as f:
+        data=f.read()
+    seconds=perf_counter()-start
+    stats.add(seconds,len(data))
+    return data,seconds
+
+def write_stage(write_queue,results,input_base,output_base,stats):
+    # writer thread: (file,cleaned workbook,error) items off write_queue, up to WRITE_BATCH at a time,
+    # None ends it. every item ends up on results as (file,metrics,error)
+    while True:
+        start=perf_counter()
+        batch=[write_queue.get()]
+        stats.waiting+=perf_counter()-start
+        while len(batch)<WRITE_BATCH and batch[-1] is not None:
+            try:
+                batch.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in batch:
+            if item is None:
+                return
+            file,cleaned,exc=item
+            if cleaned is not None:
+                start=perf_counter()
+                try:
+                    employee_name,month_year,project_data,summary_data,metrics=cleaned
+                    metrics["outputs"]=write_cleaned_csvs(file,input_base,output_base,employee_name,month_year,project_data,summary_data)
+                    metrics["timings"]["write"]=perf_counter()-start
+                    stats.add(perf_counter()-start,sum(os.path.getsize(os.path.join(output_base,o)) for o in metrics["outputs"]))
+                    results.put((file,metrics,None))
+                    continue
+                except Exception as e:
+                    error_logger.error(f"Error processing {file}: {e}")
+                    exc=str(e)
+            results.put((file,None,exc))
+
+def run_pipeline(all_files,input_directory,output_base,templates,stages,prefetch=PREFETCH,io_threads=IO_THREADS):
+    # stages: pipeline_stages(), filled in as the run goes
+    write_queue=queue.Queue(maxsize=prefetch) # bounded, cleaning cant get far ahead of the writer
+    results=queue.Queue()
+    writer=threading.Thread(target=write_stage,args=(write_queue,results,input_directory,output_base,stages["write"]),daemon=True)
+    writer.start()
+    files=iter(all_files)
+    with ThreadPoolExecutor(max_workers=io_threads) as pool:
+        # at most prefetch workbooks read ahead of the one being cleaned
+        pending=deque((file,pool.submit(read_bytes,file,stages["read"])) for file in itertools.islice(files,prefetch))
+        while pending:
+            file,future=pending.popleft()
+            upcoming=next(files,None)
+            if upcoming is not None:
+                pending.append((upcoming,pool.submit(read_bytes,upcoming,stages["read"])))
+            try:
+                start=perf_counter()
+                data,read_seconds=future.result()
+                stages["clean"].waiting+=perf_counter()-start
+                start=perf_counter()
+                cleaned=clean_workbook(file,templates=templates,data=data)
+                stages["clean"].add(perf_counter()-start,len(data))
+                # the prefetched read counts towards the file's read time, next to parsing the workbook
+                cleaned[4]["timings"]["read"]+=read_seconds
+                write_queue.put((file,cleaned,None))
+            except Exception as exc:
+                error_logger.error(f"Error processing {file}: {exc}")
+                write_queue.put((file,None,str(exc)))
+            # hand back whatever has been written so far
+            while not results.empty():
+                yield results.get()
+    write_queue.put(None)
+    writer.join()
+    while not results.empty():
+        yield results.get()
 
+# main loop
+def main():
+    parser=argparse.ArgumentParser(description="Clean the Timekeeping workbooks into Cleaned_Timekeeping csvs")
+    parser.add_argument("--workers",type=int,default=1,help="number of worker processes (default 1, serial)")
+    parser.add_argument("--full",action="store_true",help="ignore the manifest and reclean every workbook")
+    parser.add_argument("--prefetch",type=int,default=PREFETCH,help=f"workbooks read ahead of the one being cleaned in a serial run (default {PREFETCH}, 0 reads/cleans/writes one at a time)")
+    parser.add_argument("--io-threads",type=int,default=IO_THREADS,help=f"threads reading ahead (default {IO_THREADS})")
+    args=parser.parse_args()
+
+    input_directory="Timekeeping"
+    output_base="Cleaned_Timekeeping"
+    setup_logging()
+
+    #log
+    total_files=0
+    successful_files=0
+    error_files=0
+    errored_files=[]
+    missing_name_count=0
+    missing_date_count=0
+    total_project_rows=0
+    total_summary_rows=0
+    files_with_summary=0
+    template_hits=0
+    new_templates={} # fingerprint -> files of it this run
+    records=[] # per file stage timings for the run report
+
+    all_files=find_timesheet_files(input_directory)
+
+    #print(f"Found {len(all_files)} files in {input_directory}")
+    print(f"Total files found: {len(all_files)}")
+
+    manifest={} if args.full else load_manifest(output_base)
+    to_process,unchanged_files,removed_sources=plan_incremental(all_files,input_directory,output_base,manifest)
+    print(f"Unchanged files skipped: {unchanged_files}")
+
+    # sources that disappeared take their csvs with them
+    removed_outputs=0
+    dirty=set() # manifest keys sharing a deleted csv, cleaned again to write it back
+    for key in removed_sources:
+        entry=manifest.pop(key)
+        removed,claimants=remove_outputs(entry["outputs"],manifest,output_base)
+        removed_outputs+=removed
+        dirty|=claimants
+
+    templates=load_templates(output_base)
+    signatures=dict(to_process)
+    files=[file for file,sig in to_process]
+    redo=[file for file in reclean_files(dirty,input_directory,signatures) if file not in dict(to_process)]
+    files+=redo
+    recleaned_files=len(redo)
+    stages=None
+    run_start=perf_counter()
+    if args.workers>1:
+        results=run_parallel(files,input_directory,output_base,args.workers,templates)
+    elif args.prefetch>0:
+        stages=pipeline_stages()
+        results=run_pipeline(files,input_directory,output_base,templates,stages,args.prefetch,args.io_threads)
+    else:
+        results=run_serial(files,input_directory,output_base,templates)
+
+    # merge per file metrics
+    while results is not None:
+        dirty=set()
+        for file,metrics,exc in results:
+            total_files+=1
+            if exc is None:
+                successful_files+=1
+                key=manifest_key(file,input_directory)
+                old_outputs=manifest.get(key,{}).get("outputs",[])
+                manifest[key]={**signatures[file],"outputs":metrics["outputs"],"cleaner":CLEANER_VERSION}
+                # e.g. name fixed in the sheet so the csv name changed
+                removed,claimants=remove_outputs([o for o in old_outputs if o not in metrics["outputs"]],manifest,output_base)
+                removed_outputs+=removed
+                dirty|=claimants
+                if metrics["missing_name"]:
+                    missing_name_count+=1
+                if metrics["missing_date"]:
+                    missing_date_count+=1
+                total_project_rows+=metrics["project_rows"]
+                total_summary_rows+=metrics["summary_rows"]
+                files_with_summary+=metrics["has_summary"]
+                template_hits+=metrics["template_hit"]
+                if record_template(templates,metrics,key) or metrics["template"] in new_templates:
+                    new_templates[metrics["template"]]=new_templates.get(metrics["template"],0)+1
+                records.append(file_record(key,key.split("/")[0],metrics["timings"],metrics["bytes_read"],
+                    metrics["project_rows"]+metrics["summary_rows"],CLEAN_STAGES))
+            else:
+                error_files+=1
+                errored_files.append(file)
+                print(f"Error processing {file}: {exc}")
+        # workbooks sharing a csv that was just deleted write it again, one at a time in input order
+        redo=reclean_files(dirty,input_directory,signatures)
+        recleaned_files+=len(redo)
+        results=run_serial(redo,input_directory,output_base,templates) if redo else None
+
+    save_manifest(manifest,output_base)
+    save_templates(templates,output_base)
+
+    # throughput of each pipeline stage, busy time is summed over the threads of a stage
+    run_seconds=perf_counter()-run_start
+    pipeline_lines=[f"Cleaning wall time: {run_seconds:.1f}s ({total_files/run_seconds:.1f} files/s)" if run_seconds else "Cleaning wall time: 0s"]
+    if stages is not None:
+        pipeline_lines+=[f"  {stage.summary()}" for stage in stages.values()]
+    pipeline_lines+=report_lines(records,CLEAN_STAGES)
+
+    # layouts seen for the first time, with a few files to look at
+    template_lines=[f"Known templates: {len(templates)} (new this run: {len(new_templates)})",
+        f"Files that used a known template: {template_hits}"]
+    for fingerprint,count in sorted(new_templates.items(),key=lambda item:-item[1]):
+        entry=templates[fingerprint]
+        template_lines.append(f"  new template {fingerprint}: {count} files, name cell {entry['name_cell']}, "
+            f"month/year cell {entry['month_year_cell']}, header row {entry['header_row']}")
+        for sample in entry["samples"]:
+            template_lines.append(f"    {sample}")
+
+    print("\nProcessing Summary:")
+    print(f"Total files processed: {total_files}")
+    print(f"Unchanged files skipped: {unchanged_files}")
+    print(f"Removed sources: {len(removed_sources)}")
+    print(f"Stale csvs deleted: {removed_outputs}")
+    print(f"Recleaned for a shared csv: {recleaned_files}")
+    print(f"Successfully processed: {successful_files}")
+    print(f"Files with errors: {error_files}")
 
-print(f"Processing summary saved to {summary_filepath}")
+    if errored_files:
+        print("Errored files:")
+        for f in errored_files:
+            print("  ",f)
+
+    print(f"Files with missing name: {missing_name_count}")
+    print(f"Files with missing month/year: {missing_date_count}")
+    print(f"Total project rows processed: {total_project_rows}")
+    print(f"Total summary rows processed: {total_summary_rows}")
+    print(f"Files with summary rows: {files_with_summary}")
+    for line in template_lines+pipeline_lines:
+        print(line)
+
+    # create a summary file, for personal purpose and future reference
+    processing_summary_folder="Processing_Summaries"
+    os.makedirs(processing_summary_folder,exist_ok=True)
+    timestamp=datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_filename=f"processing_summary_{timestamp}.txt"
+    summary_filepath=os.path.join(processing_summary_folder,summary_filename)
+    # per file timings, p50/p95/p99 per year folder and the slowest files as json/csv (run_report.py)
+    report_paths=write_run_report(processing_summary_folder,f"processing_summary_{timestamp}",records,CLEAN_STAGES,
+        {"script":"clean_test.py","timestamp":timestamp,"wall_seconds":round(run_seconds,3),"files":total_files,
+        "errors":error_files,"unchanged":unchanged_files,"workers":args.workers,"prefetch":args.prefetch if args.workers<=1 else 0})
+
+    with open(summary_filepath,"w") as f:
+        f.write("Processing Summary:\n")
+        f.write(f"Timestamp: {datetime.now()}\n")
+        f.write(f"Total files processed: {total_files}\n")
+        f.write(f"Unchanged files skipped: {unchanged_files}\n")
+        f.write(f"Removed sources: {len(removed_sources)}\n")
+        f.write(f"Stale csvs deleted: {removed_outputs}\n")
+        f.write(f"Recleaned for a shared csv: {recleaned_files}\n")
+        f.write(f"Successfully processed: {successful_files}\n")
+        f.write(f"Files with errors: {error_files}\n")
+        if errored_files:
+            f.write("Errored files:\n")
+            for ef in errored_files:
+                f.write(f"  {ef}\n")
+        f.write(f"Files with missing name: {missing_name_count}\n")
+        f.write(f"Files with missing month/year: {missing_date_count}\n")
+        f.write(f"Total project rows processed: {total_project_rows}\n")
+        f.write(f"Total summary rows processed: {total_summary_rows}\n")
+        f.write(f"Files with summary rows: {files_with_summary}\n")
+        for line in template_lines+pipeline_lines:
+            f.write(f"{line}\n")
+        f.write(f"Run report: {', '.join(report_paths)}\n")
+
+
+    # print("report")
+    #print("Processing Summary:")
+    #print(f"Total files processed: {total_files}")
+
+
+    print(f"Processing summary saved to {summary_filepath}")
+    print(f"Run report saved to {', '.join(report_paths)}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,87 @@
+import sqlite3
+import difflib
+from collections import defaultdict
+
+# matching parsed timesheet names to the master employee list
+# 1. confirmed aliases (employee_aliases table, source='manual') e.g. Parisa -> Paria
+# 2. exact match
+# 3. previously resolved fuzzy matches (memory, then employee_aliases source='fuzzy')
+# 4. difflib, but only against names that share a trigram with the parsed name
+
+def create_alias_table(conn):
+    # not dropped by load_test, aliases survive a full reload
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS employee_aliases (
+        alias TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        source TEXT NOT NULL
+    )
+    """)
+    conn.commit()
+
+def add_alias(conn,alias,name,source="manual"):
+    # manual aliases always win over fuzzy ones
+    # no commit here, the loader commits with the rest of its transaction
+    conn.execute("""
+    INSERT INTO employee_aliases(alias,name,source) VALUES (?,?,?)
+    ON CONFLICT(alias) DO UPDATE SET name=excluded.name,source=excluded.source
+    WHERE employee_aliases.source!='manual' OR excluded.source='manual'
+    """,(alias,name,source))
+
+def trigrams(name):
+    s=f"  {name.lower()} "
+    return {s[i:i+3] for i in range(len(s)-2)}
+
+class EmployeeMatcher:
+    def __init__(self,master_employees,conn=None,cutoff=0.8):
+        # master_employees: {name: employee_id}
+        self.master_employees=master_employees
+        self.master_names=list(master_employees.keys())
+        self.cutoff=cutoff
+        self.conn=conn
+        self.cache={}
+        # trigram -> master names containing it
+        self.index=defaultdict(set)
+        for name in self.master_names:
+            for gram in trigrams(name):
+                self.index[gram].add(name)
+        self.manual={}
+        self.fuzzy={}
+        if conn is not None:
+            create_alias_table(conn)
+            for alias,name,source in conn.execute("SELECT alias,name,source FROM employee_aliases"):
+                # ignore aliases pointing at someone no longer in the master list
+                if name in master_employees:
+                    (self.manual if source=="manual" else self.fuzzy)[alias]=name
+
+    def candidates(self,parsed_name):
+        counts=defaultdict(int)
+        for gram in trigrams(parsed_name):
+            for name in self.index.get(gram,()):
+                counts[name]+=1
+        return list(counts)
+
+    def fuzzy_match(self,parsed_name):
+        # a name sharing no trigram with the parsed one is nowhere near the cutoff, so an empty block
+        # (or no close match in it) is no match, unknown names never scan the full list
+        matches=difflib.get_close_matches(parsed_name,self.candidates(parsed_name),n=1,cutoff=self.cutoff)
+        return matches[0] if matches else None
+
+    def match(self,parsed_name):
+        # returns the master name, or None if nothing is close enough
+        if parsed_name in self.manual:
+            return self.manual[parsed_name]
+        if parsed_name in self.master_employees:
+            return parsed_name
+        if parsed_name in self.cache:
+            return self.cache[parsed_name]
+        matched=self.fuzzy.get(parsed_name)
+        if matched is None:
+            matched=self.fuzzy_match(parsed_name)
+            if matched is not None and self.conn is not None:
+                add_alias(self.conn,parsed_name,matched,source="fuzzy")
+        self.cache[parsed_name]=matched
+        return matched
+
+    def employee_id(self,name):
+        return self.master_employees[name]
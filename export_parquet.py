@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# columnar snapshot of the entry tables and the monthly rollups for the dashboard's analysis reads
+# warehouse/<table>/year=<year>/part-0.parquet next to timekeeping.db, partitioned by year with
+# typed columns (date32 dates, dictionary encoded codes, int32 ids, float32 hours) so a reader
+# loads only the columns and years it needs without parsing text dates
+# the loaders refresh the years they wrote to when a snapshot exists (or with --parquet),
+# `python export_parquet.py [db]` rewrites the whole thing
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # optional, without it the dashboard reads everything from sqlite
+    pa=None
+    pq=None
+
+# table -> (select, year expression, arrow type per column)
+SNAPSHOT_TABLES={
+    "time_entries":("SELECT employee_id,project_no,work_code,date,hours_worked FROM time_entries","CAST(substr(date,1,4) AS INTEGER)",
+        {"employee_id":"int32","project_no":"dictionary","work_code":"dictionary","date":"date32","hours_worked":"float32"}),
+    "non_billable_entries":("SELECT employee_id,category,date,hours_worked FROM non_billable_entries","CAST(substr(date,1,4) AS INTEGER)",
+        {"employee_id":"int32","category":"dictionary","date":"date32","hours_worked":"float32"}),
+    "monthly_employee_hours":("SELECT employee_id,month,billable_hours,non_billable_hours FROM monthly_employee_hours","CAST(substr(month,1,4) AS INTEGER)",
+        {"employee_id":"int32","month":"string","billable_hours":"float32","non_billable_hours":"float32"}),
+    "monthly_project_hours":("SELECT project_no,month,employee_id,hours FROM monthly_project_hours","CAST(substr(month,1,4) AS INTEGER)",
+        {"project_no":"dictionary","month":"string","employee_id":"int32","hours":"float32"}),
+}
+
+def snapshot_dir(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)),"warehouse")
+
+def to_arrow(df,types):
+    arrays=[]
+    for column,kind in types.items():
+        values=df[column]
+        if kind=="date32":
+            array=pa.array(pd.to_datetime(values,errors="coerce",format="%Y-%m-%d").to_numpy().astype("datetime64[D]"),type=pa.date32())
+        elif kind=="dictionary":
+            array=pa.array(values,type=pa.string(),from_pandas=True).dictionary_encode()
+        elif kind=="string":
+            array=pa.array(values,type=pa.string(),from_pandas=True)
+        elif kind=="int32":
+            array=pa.array(pd.to_numeric(values,errors="coerce").astype("Int32"),type=pa.int32())
+        else:
+            array=pa.array(pd.to_numeric(values,errors="coerce").to_numpy(dtype=np.float32),type=pa.float32())
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays,names=list(types))
+
+def write_partition(df,table,year,path):
+    # one year of one table, written next to the old file and swapped in
+    types=SNAPSHOT_TABLES[table][2]
+    partition=os.path.join(path,table,f"year={year}")
+    if df.empty:
+        shutil.rmtree(partition,ignore_errors=True)
+        return 0
+    os.makedirs(partition,exist_ok=True)
+    tmp=os.path.join(partition,"part-0.parquet.tmp")
+    pq.write_table(to_arrow(df,types),tmp,compression="zstd")
+    os.replace(tmp,os.path.join(partition,"part-0.parquet"))
+    return len(df)
+
+def export_snapshot(db_path,years=None):
+    # years=None rewrites every table into a fresh directory, otherwise only those years' partitions
+    # returns rows written per table
+    if pa is None:
+        raise ImportError("pyarrow is needed for the parquet snapshot (pip install pyarrow)")
+    path=snapshot_dir(db_path)
+    target=path
+    if years is None:
+        target=path+".tmp"
+        shutil.rmtree(target,ignore_errors=True)
+    conn=sqlite3.connect(db_path)
+    counts={}
+    for table,(sql,year_expr,types) in SNAPSHOT_TABLES.items():
+        counts[table]=0
+        if years is None:
+            # one pass over the table, split by year here instead of a scan per year
+            df=pd.read_sql_query(f"SELECT *,{year_expr} AS year FROM ({sql}) WHERE year IS NOT NULL",conn)
+            for year,group in df.groupby("year"):
+                counts[table]+=write_partition(group,table,year,target)
+            continue
+        for year in sorted(years):
+            df=pd.read_sql_query(f"{sql} WHERE {year_expr}=?",conn,params=(year,))
+            counts[table]+=write_partition(df,table,year,target)
+    conn.close()
+    # the dashboard keys its snapshot cache on the manifest, it is written last
+    os.makedirs(target,exist_ok=True)
+    manifest={"db_path":os.path.abspath(db_path),"db_mtime":os.path.getmtime(db_path),
+        "exported_at":datetime.now().isoformat(timespec="seconds"),"years":None if years is None else sorted(years),"rows":counts}
+    with open(os.path.join(target,"_manifest.json.tmp"),"w") as f:
+        json.dump(manifest,f,indent=2)
+    os.replace(os.path.join(target,"_manifest.json.tmp"),os.path.join(target,"_manifest.json"))
+    if years is None:
+        shutil.rmtree(path,ignore_errors=True)
+        os.replace(target,path)
+    return counts
+
+def refresh_snapshot(db_path,years=None,force=False):
+    # for the loaders: keep an existing snapshot in step with the years just loaded (None for all,
+    # after a --rebuild), force (--parquet) creates one. nothing happens without pyarrow
+    if pa is None:
+        if force:
+            print("pyarrow is not installed, skipping the parquet snapshot")
+        return None
+    exists=os.path.exists(os.path.join(snapshot_dir(db_path),"_manifest.json"))
+    if not exists and not force:
+        return None
+    if years is not None and not years:
+        return None
+    return export_snapshot(db_path,years if exists else None)
+
+def main():
+    db_path=sys.argv[1] if len(sys.argv)>1 else "timekeeping.db"
+    counts=export_snapshot(db_path)
+    for table,rows in counts.items():
+        print(f"{table}: {rows} rows")
+    print(f"snapshot written to {snapshot_dir(db_path)}")
+
+if __name__=="__main__":
+    main()
@@ -53,9 +53,12 @@ def clean_project_no(project_no):
 db_path = 'timekeeping.db'
 conn = sqlite3.connect(db_path)
 cur = conn.cursor()
-cur.execute("DROP TABLE IF EXISTS projects")
-cur.execute("DROP TABLE IF EXISTS financial_data")
-conn.commit()
+# tables are no longer dropped, rows are upserted on project_no so time_entries
+# and the rest of the db stay put. pass --rebuild to drop them first like before
+if "--rebuild" in sys.argv:
+    cur.execute("DROP TABLE IF EXISTS projects")
+    cur.execute("DROP TABLE IF EXISTS financial_data")
+    conn.commit()
 
 cur.execute("""
     CREATE TABLE IF NOT EXISTS projects (
@@ -99,6 +102,15 @@ cur.execute("""
         corrected_fee_construction_budget REAL
     );
 """)
+# small_tasks/clean_financial_data.py rewrites financial_data with to_sql, which drops the primary key
+# and can leave a project_no twice, keep the latest row (highest rowid) of each before indexing
+try:
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_financial_data_project ON financial_data(project_no)")
+except sqlite3.IntegrityError:
+    cur.execute("""DELETE FROM financial_data WHERE project_no IS NOT NULL
+        AND rowid NOT IN (SELECT MAX(rowid) FROM financial_data GROUP BY project_no)""")
+    print(f"Removed {cur.rowcount} duplicate rows in financial_data.")
+    cur.execute("CREATE UNIQUE INDEX idx_financial_data_project ON financial_data(project_no)")
 conn.commit()
 
 project_data=pd.read_excel('Project_Data/Project_Archive_List.xls', sheet_name='Sheet1', skiprows=1)
@@ -112,10 +124,19 @@ project_data.columns = ['project_no', 'project_name', 'project_captain', 'develo
 project_data = project_data.dropna(subset=['project_no'])
 project_data = project_data[~project_data[['project_name', 'project_captain', 'developer', 'neighbourhood']].isna().all(axis=1)]
 project_data['project_no'] = project_data['project_no'].apply(clean_project_no)
+# rows missing a NOT NULL field and repeats of a project_no were skipped by the old INSERT OR IGNORE,
+# drop them here so the first complete row still wins now that a conflict updates
+project_data = project_data.dropna(subset=['project_name', 'project_captain'])
+project_data = project_data.drop_duplicates(subset=['project_no'], keep='first')
 project_tuples = list(project_data[['project_no','project_name','project_captain','developer','neighbourhood']].itertuples(index=False, name=None))
 cur.executemany('''
-    INSERT OR IGNORE INTO projects (project_no, project_name, project_captain, developer, neighbourhood)
+    INSERT INTO projects (project_no, project_name, project_captain, developer, neighbourhood)
     VALUES (?,?,?,?,?)
+    ON CONFLICT(project_no) DO UPDATE SET
+        project_name = excluded.project_name,
+        project_captain = excluded.project_captain,
+        developer = excluded.developer,
+        neighbourhood = excluded.neighbourhood
 ''', project_tuples)
 conn.commit()
 financial_data.columns = financial_data.columns.str.strip()
@@ -144,6 +165,7 @@ financial_data.columns = [
 ]
 
 financial_data['project_no'] = financial_data['project_no'].astype(str).apply(clean_project_no)
+financial_data = financial_data.drop_duplicates(subset=['project_no'], keep='first')
 
 financial_tuples = list(financial_data[['project_no','percent_complete','fee_earned_to_date',
     'fee_as_per_contract','amount_left_to_bill','target_fees_per_hour','actual_fees_per_hour',
@@ -156,7 +178,7 @@ financial_tuples = list(financial_data[['project_no','percent_complete','fee_ear
 ]].itertuples(index=False, name=None))
 
 cur.executemany('''
-    INSERT OR IGNORE INTO financial_data (
+    INSERT INTO financial_data (
         project_no, percent_complete, fee_earned_to_date,
         fee_as_per_contract, amount_left_to_bill, target_fees_per_hour, actual_fees_per_hour,
         pre_CA_budget_hours, pre_CA_actual_hours, hours_left, months_in_construction, construction_fee_per_month,
@@ -166,6 +188,34 @@ cur.executemany('''
         fee_construction_budget, corrected_fee_construction_budget
     )
     VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(project_no) DO UPDATE SET
+        percent_complete = excluded.percent_complete,
+        fee_earned_to_date = excluded.fee_earned_to_date,
+        fee_as_per_contract = excluded.fee_as_per_contract,
+        amount_left_to_bill = excluded.amount_left_to_bill,
+        target_fees_per_hour = excluded.target_fees_per_hour,
+        actual_fees_per_hour = excluded.actual_fees_per_hour,
+        pre_CA_budget_hours = excluded.pre_CA_budget_hours,
+        pre_CA_actual_hours = excluded.pre_CA_actual_hours,
+        hours_left = excluded.hours_left,
+        months_in_construction = excluded.months_in_construction,
+        construction_fee_per_month = excluded.construction_fee_per_month,
+        CA_actual_hours = excluded.CA_actual_hours,
+        CA_budget_hours = excluded.CA_budget_hours,
+        date_updated = excluded.date_updated,
+        classification = excluded.classification,
+        storeys = excluded.storeys,
+        construction_type = excluded.construction_type,
+        floor_area = excluded.floor_area,
+        cost_per_sq_ft = excluded.cost_per_sq_ft,
+        construction_budget = excluded.construction_budget,
+        number_of_units = excluded.number_of_units,
+        corrected_fee_budget_hours = excluded.corrected_fee_budget_hours,
+        corrected_fee_actual_hours = excluded.corrected_fee_actual_hours,
+        fee_per_unit_based_on_higher_fee_value = excluded.fee_per_unit_based_on_higher_fee_value,
+        fee_per_sf_based_on_higher_fee_value = excluded.fee_per_sf_based_on_higher_fee_value,
+        fee_construction_budget = excluded.fee_construction_budget,
+        corrected_fee_construction_budget = excluded.corrected_fee_construction_budget
 ''', financial_tuples)
 conn.commit()
 
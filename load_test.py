@@ -5,32 +5,17 @@ import os
 import re
 import sys
 import glob
+import zlib
 import logging
+from time import perf_counter
 from datetime import datetime
-import difflib
+from employee_matching import EmployeeMatcher
+from rollups import create_rollup_tables,drop_rollup_tables,refresh_rollups,entry_months
+from export_parquet import refresh_snapshot
+from run_report import StageTimer,file_record,write_run_report,report_lines
 
-# configure logging
-logging.basicConfig(filename='missing_projects.log',level=logging.WARNING,format='%(asctime)s - %(levelname)s - %(message)s',filemode='a')
-
-# validate and parse command line arguments
-if len(sys.argv)<3:
-    print("Usage: python scriptname.py <start_year> <end_year>")
-    sys.exit(1)
-
-try:
-    min_year=int(sys.argv[1])
-    max_year=int(sys.argv[2])
-except ValueError:
-    print("Error: Start and end year must be integers.")
-    sys.exit(1)
-
-if not (2003<=min_year<=2025) or not (2003<=max_year<=2025):
-    print("Error: Years must be between 2003 and 2024.")
-    sys.exit(1)
-
-if min_year>max_year:
-    print("Error: Start year must be less than or equal to end year.")
-    sys.exit(1)
+# stages a csv goes through, timed per file for the run report (run_report.py)
+LOAD_STAGES=("match","read","build","insert")
 
 # helper: revised filename parser
 def parse_filename(filename):
@@ -63,7 +48,8 @@ def parse_filename(filename):
     return (employee_name.strip(),month_year.strip())
 
 def id_hash(employee_name):
-    return hash(employee_name)%1000000
+    # crc32 rather than hash(), which is salted per process so ids changed every run
+    return zlib.crc32(employee_name.encode("utf-8"))%1000000
 
 # updated clean_project_no
 def clean_project_no(project_no):
@@ -86,16 +72,11 @@ def drop_tables_if_exists(db_path):
     cur.execute("DROP TABLE IF EXISTS employees")
     cur.execute("DROP TABLE IF EXISTS time_entries")
     cur.execute("DROP TABLE IF EXISTS non_billable_entries")
+    cur.execute("DROP TABLE IF EXISTS rejected_rows")
     conn.commit()
+    drop_rollup_tables(conn)
     conn.close()
-    print("Tables dropped successfully (employees,time_entries,non_billable_entries).")
-
-# helper: get matching employee using difflib
-def get_matching_employee(parsed_name,master_names,cutoff=0.8):
-    if parsed_name in master_names:
-        return parsed_name
-    matches=difflib.get_close_matches(parsed_name,master_names,n=1,cutoff=cutoff)
-    return matches[0] if matches else None
+    print("Tables dropped successfully (employees,time_entries,non_billable_entries,rejected_rows,monthly rollups).")
 
 def load_master_employees(db_path,master_file):
     df=pd.read_excel(master_file,sheet_name='employees')
@@ -107,11 +88,6 @@ def load_master_employees(db_path,master_file):
     df['position']=df['Code'].map(linked_dict)
     df['Name']=df['Name'].astype(str).str.strip()
     df=df[df['Name']!=""]
-    master_employees={}
-    for idx,row in df.iterrows():
-        name=row['Name']
-        employee_id=id_hash(name)
-        master_employees[name]=employee_id
     conn=sqlite3.connect(db_path)
     cur=conn.cursor()
     cur.execute("""
@@ -120,7 +96,14 @@ def load_master_employees(db_path,master_file):
             name TEXT NOT NULL UNIQUE,
             billable_rate INTEGER,
             position TEXT)""")
-    
+    # keep the ids already in the table so reloading doesnt orphan existing entries
+    existing_ids=dict(cur.execute("SELECT name,employee_id FROM employees").fetchall())
+    master_employees={}
+    for idx,row in df.iterrows():
+        name=row['Name']
+        employee_id=existing_ids.get(name,id_hash(name))
+        master_employees[name]=employee_id
+
     for name,employee_id in master_employees.items():
         employee_rates=df.loc[df['Name']==name,'billable_rate']
         if employee_rates.empty:
@@ -138,26 +121,14 @@ def load_master_employees(db_path,master_file):
             pos=""
         else:
             pos=employee_positions.iloc[0]
-        cur.execute("INSERT OR IGNORE INTO employees(employee_id,name,billable_rate,position) VALUES(?,?,?,?)",(employee_id,name,rate,pos))
+        cur.execute("""INSERT INTO employees(employee_id,name,billable_rate,position) VALUES(?,?,?,?)
+            ON CONFLICT(name) DO UPDATE SET billable_rate=excluded.billable_rate,position=excluded.position""",(employee_id,name,rate,pos))
     conn.commit()
     conn.close()
     print("Master employees loaded into database.")
     return master_employees
 
-def load_projects_csv_to_db(csv_file,db_path,master_employees):
-    employee_name,month_year=parse_filename(csv_file)
-    print(f"[Projects] Parsed from filename: Employee = '{employee_name}', Month/Year = {month_year}")
-    matched_employee=get_matching_employee(employee_name,master_employees.keys())
-    if not matched_employee:
-        msg=f"Employee '{employee_name}' from file {csv_file} not found in master list. Skipping file."
-        logging.error(msg)
-        print(msg)
-        return
-    elif matched_employee!=employee_name:
-        print(f"Using close match: '{matched_employee}' for employee '{employee_name}'.")
-        employee_name=matched_employee
-    employee_id=master_employees[employee_name]
-    conn=sqlite3.connect(db_path)
+def create_entry_tables(conn):
     cur=conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS time_entries (
@@ -167,64 +138,13 @@ def load_projects_csv_to_db(csv_file,db_path,master_employees):
         work_code TEXT,
         date DATE,
         hours_worked DECIMAL,
+        source_file TEXT,
         FOREIGN KEY (employee_id) REFERENCES employees(employee_id),
         FOREIGN KEY (project_no) REFERENCES projects(project_no)
     )
     """)
     cur.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_employee_date ON time_entries(employee_id,date)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_project_date ON time_entries(project_no,date)")
-    conn.commit()
-    df=pd.read_csv(csv_file)
-    for idx,row in df.iterrows():
-        raw_project_no=row["PROJECT NO"]
-        cleaned_project_no=clean_project_no(raw_project_no)
-        if cleaned_project_no=="":
-            print(f"Skipping row {idx} due to invalid project number: {raw_project_no}")
-            continue
-        project_name=str(row["PROJECT NAME"]).strip()
-        work_code=str(row["WORK CODE"]).strip()
-        cur.execute("SELECT project_no FROM projects WHERE project_no = ?",(cleaned_project_no,))
-        if cur.fetchone() is None:
-            msg=f"Row {idx}: Project number {cleaned_project_no} ({project_name}) not found in projects table. Skipping row."
-            logging.warning(msg)
-            print(msg)
-            continue
-        for day in range(1,32):
-            col=str(day)
-            try:
-                hours=float(row[col])
-            except (ValueError,TypeError):
-                hours=0.0
-            if hours>0:
-                try:
-                    entry_date=datetime.strptime(f"{day} {month_year}","%d %B %Y").date()
-                except Exception as e:
-                    print(f"Error parsing date from '{month_year}' and day {day}: {e}")
-                    continue
-                cur.execute("""
-                INSERT INTO time_entries(employee_id,project_no,work_code,date,hours_worked)
-                VALUES (?,?,?,?,?)
-                """,(employee_id,cleaned_project_no,work_code,entry_date.isoformat(),hours))
-    conn.commit()
-    conn.close()
-    print(f"[Projects] Data from {csv_file} loaded into the database.")
-
-# loader for summary csvs (non-billable hours)
-def load_summary_csv_to_db(csv_file,db_path,master_employees):
-    employee_name,month_year=parse_filename(csv_file)
-    print(f"[Summary] Parsed from filename: Employee = '{employee_name}', Month/Year = {month_year}")
-    matched_employee=get_matching_employee(employee_name,master_employees.keys())
-    if not matched_employee:
-        msg=f"Employee '{employee_name}' from file {csv_file} not found in master list. Skipping file."
-        logging.error(msg)
-        print(msg)
-        return
-    elif matched_employee!=employee_name:
-        print(f"Using close match: '{matched_employee}' for employee '{employee_name}'.")
-        employee_name=matched_employee
-    employee_id=master_employees[employee_name]
-    conn=sqlite3.connect(db_path)
-    cur=conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS non_billable_entries (
         entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -232,70 +152,375 @@ def load_summary_csv_to_db(csv_file,db_path,master_employees):
         category TEXT,
         date DATE,
         hours_worked DECIMAL,
+        source_file TEXT,
         FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
     )
     """)
+    # rows skipped by the projects loader, replaces the per row lines in missing_projects.log
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rejected_rows (
+        reject_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_file TEXT,
+        row_index INTEGER,
+        raw_project_no TEXT,
+        project_no TEXT,
+        project_name TEXT,
+        reason TEXT,
+        UNIQUE (source_file,row_index)
+    )
+    """)
     conn.commit()
-    df=pd.read_csv(csv_file)
-    for idx,row in df.iterrows():
-        category=str(row["non-billable"]).strip()
-        if "total" in category.lower():
-            continue
-        for day in range(1,32):
-            col=str(day)
-            try:
-                hours=float(row[col])
-            except (ValueError,TypeError):
-                hours=0.0
-            if hours>0:
-                try:
-                    entry_date=datetime.strptime(f"{day} {month_year}","%d %B %Y").date()
-                except Exception as e:
-                    print(f"Error parsing date from '{month_year}' and day {day}: {e}")
-                    continue
-                cur.execute("""
-                INSERT INTO non_billable_entries(employee_id,category,date,hours_worked)
-                VALUES (?,?,?,?)
-                """,(employee_id,category,entry_date.isoformat(),hours))
+    create_source_columns(conn)
+    create_natural_keys(conn)
+    create_rollup_tables(conn)
+
+# natural keys, one row per employee/project/work code/day and employee/category/day
+# loads upsert on these so a year can be reloaded in place
+NATURAL_KEYS={
+    "time_entries":("idx_time_entries_natural",["employee_id","project_no","work_code","date"]),
+    "non_billable_entries":("idx_non_billable_natural",["employee_id","category","date"]),
+}
+
+def collapse_duplicate_entries(conn,table,key_cols):
+    # older dbs were loaded with plain INSERTs and can have the same key twice,
+    # fold those into the lowest entry_id with the hours summed so totals dont change
+    keys=",".join(key_cols)
+    join=" AND ".join(f"t.{c}=d.{c}" for c in key_cols)
+    cur=conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS temp.dupes")
+    cur.execute(f"""CREATE TEMP TABLE dupes AS
+        SELECT MIN(entry_id) AS keep_id,{keys},SUM(hours_worked) AS hours_worked
+        FROM {table} GROUP BY {keys} HAVING COUNT(*)>1""")
+    cur.execute(f"UPDATE {table} SET hours_worked=(SELECT hours_worked FROM dupes WHERE keep_id={table}.entry_id) WHERE entry_id IN (SELECT keep_id FROM dupes)")
+    cur.execute(f"DELETE FROM {table} WHERE entry_id IN (SELECT t.entry_id FROM {table} t JOIN dupes d ON {join} WHERE t.entry_id!=d.keep_id)")
+    removed=cur.rowcount
+    cur.execute("DROP TABLE temp.dupes")
     conn.commit()
-    conn.close()
+    print(f"Collapsed {removed} duplicate rows in {table}.")
+
+def create_source_columns(conn):
+    # source_file is the file an entry was last loaded from, a reload deletes that file's entries first
+    # entries loaded before the column existed have none and are only ever upserted (--rebuild fills it in)
+    for table in NATURAL_KEYS:
+        columns=[row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if "source_file" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN source_file TEXT")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_source ON {table}(source_file)")
+    conn.commit()
+
+def create_natural_keys(conn):
+    for table,(index_name,key_cols) in NATURAL_KEYS.items():
+        sql=f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table}({','.join(key_cols)})"
+        try:
+            conn.execute(sql)
+        except sqlite3.IntegrityError:
+            collapse_duplicate_entries(conn,table,key_cols)
+            conn.execute(sql)
+    conn.commit()
+
+def sum_duplicate_keys(rows):
+    # rows are (*key,hours); the same key can show up twice in one timesheet
+    # (same project and work code on two lines) so add those together before upserting
+    totals={}
+    for row in rows:
+        totals[row[:-1]]=totals.get(row[:-1],0.0)+row[-1]
+    return [key+(hours,) for key,hours in totals.items()]
+
+def load_project_numbers(conn):
+    # every valid project_no, read once so rows can be checked in memory
+    return {row[0] for row in conn.execute("SELECT project_no FROM projects")}
+
+def match_employee(employee_name,source,matcher):
+    # returns the employee_id, or None if the name isnt close to anyone in the master list
+    matched_employee=matcher.match(employee_name)
+    if not matched_employee:
+        msg=f"Employee '{employee_name}' from file {source} not found in master list. Skipping file."
+        logging.error(msg)
+        print(msg)
+        return None
+    elif matched_employee!=employee_name:
+        print(f"Using close match: '{matched_employee}' for employee '{employee_name}'.")
+    return matcher.employee_id(matched_employee)
+
+def resolve_employee(csv_file,matcher,label):
+    # parse the employee/month from the filename and match against the master list
+    # returns (employee_id,month_year) or (None,None) if the file should be skipped
+    employee_name,month_year=parse_filename(csv_file)
+    print(f"[{label}] Parsed from filename: Employee = '{employee_name}', Month/Year = {month_year}")
+    employee_id=match_employee(employee_name,csv_file,matcher)
+    if employee_id is None:
+        return None,None
+    return employee_id,month_year
+
+def melt_day_hours(df,month_year):
+    # wide day columns 1..31 -> long (row position,date,hours) for every cell with hours>0
+    # rows come out in the same order as the old row by row / day by day loop
+    day_cols=[str(day) for day in range(1,32) if str(day) in df.columns]
+    if df.empty or not day_cols:
+        return np.array([],dtype=int),[],np.array([])
+    hours=df[day_cols].to_numpy()
+    if hours.dtype==object:
+        # stray text in a day cell counts as 0, same as float() failing before
+        hours=pd.to_numeric(hours.ravel(),errors="coerce").reshape(hours.shape)
+    hours=hours.astype(float)
+    hours[np.isnan(hours)]=0.0
+    row_pos,col_pos=np.nonzero(hours>0)
+    if len(row_pos)==0:
+        return row_pos,[],np.array([])
+    try:
+        month_start=datetime.strptime(f"1 {month_year}","%d %B %Y").date()
+    except Exception as e:
+        print(f"Error parsing date from '{month_year}': {e}")
+        return np.array([],dtype=int),[],np.array([])
+    # build each day of the month once, days past month end (e.g. feb 30) are dropped
+    month_days={}
+    for day_col in day_cols:
+        try:
+            month_days[day_col]=month_start.replace(day=int(day_col)).isoformat()
+        except ValueError:
+            month_days[day_col]=None
+    dates=[month_days[day_cols[c]] for c in col_pos]
+    valid=np.array([d is not None for d in dates])
+    if not valid.all():
+        for c in sorted(set(col_pos[~valid])):
+            print(f"Error parsing date from '{month_year}' and day {day_cols[c]}: day is out of range for month")
+        dates=[d for d in dates if d is not None]
+    return row_pos[valid],dates,hours[row_pos[valid],col_pos[valid]]
+
+def build_project_rows(df,employee_id,month_year,valid_projects,source_file):
+    # cleaned projects frame -> (time_entries rows,rejected_rows rows)
+    project_nos=df["PROJECT NO"].map(clean_project_no)
+    project_names=df["PROJECT NAME"].map(str).str.strip()
+    work_codes=df["WORK CODE"].map(str).str.strip()
+    blank=(project_nos=="").to_numpy()
+    unknown=~project_nos.isin(valid_projects).to_numpy()&~blank
+    keep=~(blank|unknown)
+    rejects=[]
+    if not keep.all():
+        reasons=np.where(blank,"invalid project number","project not in projects table")
+        rejects=[(source_file,int(df.index[i]),str(df["PROJECT NO"].iloc[i]),project_nos.iloc[i],project_names.iloc[i],reasons[i])
+            for i in np.flatnonzero(~keep)]
+    row_pos,dates,hours=melt_day_hours(df,month_year)
+    valid=keep[row_pos]
+    rows=list(zip(
+        [employee_id]*int(valid.sum()),
+        project_nos.to_numpy()[row_pos[valid]].tolist(),
+        work_codes.to_numpy()[row_pos[valid]].tolist(),
+        [d for d,v in zip(dates,valid) if v],
+        hours[valid].tolist()))
+    return sum_duplicate_keys(rows),rejects
+
+def build_summary_rows(df,employee_id,month_year):
+    # cleaned summary frame -> non_billable_entries rows, total lines are skipped
+    categories=df["non-billable"].map(str).str.strip()
+    keep=~categories.str.lower().str.contains("total",regex=False).to_numpy()
+    row_pos,dates,hours=melt_day_hours(df,month_year)
+    valid=keep[row_pos]
+    return sum_duplicate_keys(list(zip(
+        [employee_id]*int(valid.sum()),
+        categories.to_numpy()[row_pos[valid]].tolist(),
+        [d for d,v in zip(dates,valid) if v],
+        hours[valid].tolist())))
+
+def clear_reloaded(conn,source_file):
+    # a reload replaces what the file loaded last time, so hours taken off (or moved in) a corrected
+    # sheet dont linger: its entries in both tables and its rejected rows go before the upserts.
+    # only rows from this file, another sheet for the same employee/month (e.g. in the next year's
+    # folder) keeps its rows. returns the 'YYYY-MM' months deleted from, for the rollups/snapshot
+    months=set()
+    for table in NATURAL_KEYS:
+        months.update(row[0] for row in conn.execute(f"SELECT DISTINCT substr(date,1,7) FROM {table} WHERE source_file=? AND date IS NOT NULL",(source_file,)))
+        conn.execute(f"DELETE FROM {table} WHERE source_file=?",(source_file,))
+    conn.execute("DELETE FROM rejected_rows WHERE source_file=?",(source_file,))
+    return months
+
+def loaded_sources(conn,prefix):
+    # files under prefix (a year folder) that entries or rejected rows were loaded from
+    tables=list(NATURAL_KEYS)+["rejected_rows"]
+    sql=" UNION ".join(f"SELECT source_file FROM {table} WHERE substr(source_file,1,?)=?" for table in tables)
+    return {row[0] for row in conn.execute(sql,[len(prefix),prefix]*len(tables))}
+
+def with_source(rows,source_file):
+    # rows as the insert functions take them, source_file last
+    return [row+(source_file,) for row in rows]
+
+# upserts: reloading a file replaces its hours instead of adding a second copy
+# if two timesheets give the same key the one loaded last wins (and becomes its source_file)
+# rows are build_*_rows rows with the source file added (with_source)
+def insert_project_rows(conn,rows,rejects=()):
+    if rejects:
+        conn.executemany("""
+        INSERT INTO rejected_rows(source_file,row_index,raw_project_no,project_no,project_name,reason)
+        VALUES (?,?,?,?,?,?)
+        ON CONFLICT(source_file,row_index) DO UPDATE SET raw_project_no=excluded.raw_project_no,
+            project_no=excluded.project_no,project_name=excluded.project_name,reason=excluded.reason
+        """,rejects)
+    conn.executemany("""
+    INSERT INTO time_entries(employee_id,project_no,work_code,date,hours_worked,source_file)
+    VALUES (?,?,?,?,?,?)
+    ON CONFLICT(employee_id,project_no,work_code,date) DO UPDATE SET hours_worked=excluded.hours_worked,source_file=excluded.source_file
+    """,rows)
+
+def insert_summary_rows(conn,rows):
+    conn.executemany("""
+    INSERT INTO non_billable_entries(employee_id,category,date,hours_worked,source_file)
+    VALUES (?,?,?,?,?)
+    ON CONFLICT(employee_id,category,date) DO UPDATE SET hours_worked=excluded.hours_worked,source_file=excluded.source_file
+    """,rows)
+
+def load_projects_csv_to_db(csv_file,conn,matcher,valid_projects,months=None,timer=None):
+    # the rows loaded from csv_file before are replaced (clear_reloaded)
+    # timer: a StageTimer, charged the seconds of each of LOAD_STAGES
+    timer=timer if timer is not None else StageTimer()
+    employee_id,month_year=resolve_employee(csv_file,matcher,"Projects")
+    timer.lap("match")
+    if employee_id is None:
+        return 0
+    df=pd.read_csv(csv_file)
+    timer.lap("read")
+    rows,rejects=build_project_rows(df,employee_id,month_year,valid_projects,csv_file)
+    if rejects:
+        print(f"[Projects] {len(rejects)} rows rejected from {csv_file} (see rejected_rows)")
+    if months is not None:
+        months.update(entry_months(rows,3))
+    timer.lap("build")
+    cleared=clear_reloaded(conn,csv_file)
+    if months is not None:
+        months.update(cleared)
+    insert_project_rows(conn,with_source(rows,csv_file),rejects)
+    timer.lap("insert")
+    print(f"[Projects] Data from {csv_file} loaded into the database.")
+    return len(rows)
+
+# loader for summary csvs (non-billable hours)
+def load_summary_csv_to_db(csv_file,conn,matcher,months=None,timer=None):
+    timer=timer if timer is not None else StageTimer()
+    employee_id,month_year=resolve_employee(csv_file,matcher,"Summary")
+    timer.lap("match")
+    if employee_id is None:
+        return 0
+    df=pd.read_csv(csv_file)
+    timer.lap("read")
+    rows=build_summary_rows(df,employee_id,month_year)
+    if months is not None:
+        months.update(entry_months(rows,2))
+    timer.lap("build")
+    cleared=clear_reloaded(conn,csv_file)
+    if months is not None:
+        months.update(cleared)
+    insert_summary_rows(conn,with_source(rows,csv_file))
+    timer.lap("insert")
     print(f"[Summary] Data from {csv_file} loaded into the database.")
+    return len(rows)
 
-# main processing loop
-input_directory="Cleaned_Timekeeping"
-db_path="timekeeping.db"
-master_file="Staff Chargeout Matrix.xlsx"
-drop_tables_if_exists(db_path)
-master_employees=load_master_employees(db_path,master_file)
-project_files=[]
-summary_files=[]
-for year_folder in os.listdir(input_directory):
-    if not year_folder.isdigit():
-        continue
-    year=int(year_folder)
-    if year<min_year or year>max_year:
-        continue
-    year_path=os.path.join(input_directory,year_folder)
+def find_cleaned_files(input_directory,year,kind):
+    # kind is "Projects" or "Summaries"
+    files=[]
+    year_path=os.path.join(input_directory,str(year))
     if not os.path.isdir(year_path):
-        continue
-    for month_folder in os.listdir(year_path):
-        projects_folder=os.path.join(year_path,month_folder,"Projects")
-        if os.path.isdir(projects_folder):
-            for file in glob.glob(os.path.join(projects_folder,"*.csv")):
-                if "~$" in os.path.basename(file).lower() or "unknown" in os.path.basename(file).lower():
-                    continue
-                project_files.append(file)
+        return files
     for month_folder in os.listdir(year_path):
-        summaries_folder=os.path.join(year_path,month_folder,"Summaries")
-        if os.path.isdir(summaries_folder):
-            for file in glob.glob(os.path.join(summaries_folder,"*.csv")):
+        folder=os.path.join(year_path,month_folder,kind)
+        if os.path.isdir(folder):
+            for file in glob.glob(os.path.join(folder,"*.csv")):
                 if "~$" in os.path.basename(file).lower() or "unknown" in os.path.basename(file).lower():
                     continue
-                summary_files.append(file)
-print(f"Total project files found: {len(project_files)}")
-print(f"Total summary files found: {len(summary_files)}")
-for file in project_files:
-    load_projects_csv_to_db(file,db_path,master_employees)
-for file in summary_files:
-    load_summary_csv_to_db(file,db_path,master_employees)
-print("Processing complete.")
+                files.append(file)
+    # fixed order so "last one wins" on a shared key is the same every run
+    return sorted(files)
+
+def parse_year_args(argv):
+    # validate and parse command line arguments
+    if len(argv)<3:
+        print("Usage: python scriptname.py <start_year> <end_year> [--rebuild] [--parquet]")
+        sys.exit(1)
+    try:
+        min_year=int(argv[1])
+        max_year=int(argv[2])
+    except ValueError:
+        print("Error: Start and end year must be integers.")
+        sys.exit(1)
+
+    if not (2003<=min_year<=2025) or not (2003<=max_year<=2025):
+        print("Error: Years must be between 2003 and 2024.")
+        sys.exit(1)
+
+    if min_year>max_year:
+        print("Error: Start year must be less than or equal to end year.")
+        sys.exit(1)
+    return min_year,max_year
+
+# main processing loop
+def main():
+    # configure logging
+    logging.basicConfig(filename='missing_projects.log',level=logging.WARNING,format='%(asctime)s - %(levelname)s - %(message)s',filemode='a')
+    # by default the years given are upserted in place and everything else is left alone,
+    # --rebuild drops the tables first like the original full reload
+    rebuild="--rebuild" in sys.argv
+    min_year,max_year=parse_year_args([a for a in sys.argv if not a.startswith("--")])
+    input_directory="Cleaned_Timekeeping"
+    db_path="timekeeping.db"
+    master_file="Staff Chargeout Matrix.xlsx"
+    if rebuild:
+        drop_tables_if_exists(db_path)
+    master_employees=load_master_employees(db_path,master_file)
+    conn=sqlite3.connect(db_path)
+    create_entry_tables(conn)
+    valid_projects=load_project_numbers(conn)
+    matcher=EmployeeMatcher(master_employees,conn)
+    total_project_files=0
+    total_summary_files=0
+    touched_months=set() # months written or cleared, their years are the snapshot partitions to rewrite
+    records=[] # per csv stage timings for the run report
+    rollup_seconds={}
+    run_start=perf_counter()
+    for year in range(min_year,max_year+1):
+        project_files=find_cleaned_files(input_directory,year,"Projects")
+        summary_files=find_cleaned_files(input_directory,year,"Summaries")
+        if not project_files and not summary_files:
+            continue
+        print(f"[{year}] project files: {len(project_files)}, summary files: {len(summary_files)}")
+        # one transaction per year, rolled back if anything in the year fails
+        # the monthly rollups for the months written are refreshed in the same transaction
+        months=set()
+        with conn:
+            # files loaded from this year folder before that arent there any more take their rows with them
+            for source in sorted(loaded_sources(conn,os.path.join(input_directory,str(year),""))-set(project_files)-set(summary_files)):
+                months.update(clear_reloaded(conn,source))
+            for file in project_files:
+                timer=StageTimer()
+                rows=load_projects_csv_to_db(file,conn,matcher,valid_projects,months,timer)
+                records.append(file_record(os.path.relpath(file,input_directory).replace(os.sep,"/"),year,timer.seconds,os.path.getsize(file),rows,LOAD_STAGES))
+            for file in summary_files:
+                timer=StageTimer()
+                rows=load_summary_csv_to_db(file,conn,matcher,months,timer)
+                records.append(file_record(os.path.relpath(file,input_directory).replace(os.sep,"/"),year,timer.seconds,os.path.getsize(file),rows,LOAD_STAGES))
+            start=perf_counter()
+            refresh_rollups(conn,months)
+            rollup_seconds[str(year)]=round(perf_counter()-start,3)
+        touched_months.update(months)
+        total_project_files+=len(project_files)
+        total_summary_files+=len(summary_files)
+    rejected=conn.execute("SELECT COUNT(*),COUNT(DISTINCT project_no) FROM rejected_rows").fetchone()
+    if rejected[0]:
+        logging.warning(f"{rejected[0]} project rows ({rejected[1]} distinct project numbers) rejected, see the rejected_rows table.")
+    conn.close()
+    # parquet snapshot for the dashboard (export_parquet.py), the years of the months written or all of it
+    # after a rebuild. not the folder years, a folder can hold sheets of another year (e.g. December 2003 in 2004)
+    refresh_snapshot(db_path,None if rebuild else {int(m[:4]) for m in touched_months},force="--parquet" in sys.argv)
+    print(f"Total project files found: {total_project_files}")
+    print(f"Rejected project rows: {rejected[0]}")
+    print(f"Total summary files found: {total_summary_files}")
+    # per csv timings, p50/p95/p99 per year and the slowest csvs as json/csv next to the cleaning summaries
+    run_seconds=perf_counter()-run_start
+    for line in report_lines(records,LOAD_STAGES):
+        print(line)
+    timestamp=datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_paths=write_run_report("Processing_Summaries",f"load_summary_{timestamp}",records,LOAD_STAGES,
+        {"script":"load_test.py","timestamp":timestamp,"wall_seconds":round(run_seconds,3),"years":[min_year,max_year],
+        "rebuild":rebuild,"project_files":total_project_files,"summary_files":total_summary_files,"rollup_seconds":rollup_seconds})
+    print(f"Run report saved to {', '.join(report_paths)}")
+    print("Processing complete.")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,145 @@
+import re
+import sqlite3
+import logging
+import argparse
+from datetime import datetime
+
+from clean_test import clean_workbook,write_cleaned_csvs,find_timesheet_files,setup_logging,error_logger
+from load_test import (drop_tables_if_exists,load_master_employees,create_entry_tables,load_project_numbers,
+    match_employee,build_project_rows,build_summary_rows,insert_project_rows,insert_summary_rows,clear_reloaded,with_source)
+from employee_matching import EmployeeMatcher
+from rollups import refresh_rollups,entry_months
+from export_parquet import refresh_snapshot
+
+# streaming mode: Timekeeping workbooks -> timekeeping.db without going through Cleaned_Timekeeping
+# the employee name and month come straight from the sheet cells instead of being
+# round tripped through a csv filename and parse_filename
+# csvs can still be written for auditing with --csv
+# usage: python pipeline.py <start_year> <end_year> [--csv] [--rebuild] [--batch-size N]
+
+MONTH_NAMES=[datetime(1900,m,1).strftime("%B") for m in range(1,13)]
+
+def normalize_month_year(month_year):
+    # sheet cells look like "March 2004", "March, 2004", "May2004", "Sept 2004", "03/2004" or a date cell
+    # returns "<Month> <Year>" (what the loaders parse) or the original text if it cant be read
+    m=re.match(r'^(\d{4})-(\d{2})-\d{2}',month_year)
+    if m:
+        return datetime(int(m.group(1)),int(m.group(2)),1).strftime("%B %Y")
+    parts=re.findall(r'[A-Za-z]+|\d+',month_year)
+    if len(parts)<2:
+        return month_year
+    month,year=parts[-2],parts[-1]
+    if month.isdigit():
+        if 1<=int(month)<=12:
+            month=MONTH_NAMES[int(month)-1]
+    elif len(month)>=3:
+        # first three letters are unique per month and survive the usual typos (Janaury, Sepember)
+        matches=[name for name in MONTH_NAMES if name.lower().startswith(month[:3].lower())]
+        if len(matches)==1:
+            month=matches[0]
+    return f"{month} {year}"
+
+def cleaned_timesheets(files,input_directory,csv_output=None):
+    # generator over cleaned workbooks: (file,employee_name,month_year,project_data,summary_data)
+    # files that fail to clean are logged to error_log.txt like clean_test and skipped
+    for file in files:
+        try:
+            employee_name,month_year,project_data,summary_data,metrics=clean_workbook(file)
+            if csv_output:
+                write_cleaned_csvs(file,input_directory,csv_output,employee_name,month_year,project_data,summary_data)
+        except Exception as e:
+            error_logger.error(f"Error processing {file}: {e}")
+            print(f"Error processing {file}: {e}")
+            continue
+        yield file,employee_name,month_year,project_data,summary_data
+
+def main():
+    parser=argparse.ArgumentParser(description="Clean timesheets and load them straight into timekeeping.db")
+    parser.add_argument("start_year",type=int)
+    parser.add_argument("end_year",type=int)
+    parser.add_argument("--csv",action="store_true",help="also write the Cleaned_Timekeeping csvs")
+    parser.add_argument("--rebuild",action="store_true",help="drop the entry tables first instead of upserting the years in place")
+    parser.add_argument("--batch-size",type=int,default=50000,help="entries per executemany/commit")
+    parser.add_argument("--parquet",action="store_true",help="write the parquet snapshot even if there isn't one yet (export_parquet.py)")
+    args=parser.parse_args()
+    if args.start_year>args.end_year:
+        parser.error("start year must be less than or equal to end year")
+
+    setup_logging()
+    logging.basicConfig(filename='missing_projects.log',level=logging.WARNING,format='%(asctime)s - %(levelname)s - %(message)s',filemode='a')
+    input_directory="Timekeeping"
+    db_path="timekeeping.db"
+    master_file="Staff Chargeout Matrix.xlsx"
+
+    if args.rebuild:
+        drop_tables_if_exists(db_path)
+    master_employees=load_master_employees(db_path,master_file)
+    conn=sqlite3.connect(db_path)
+    create_entry_tables(conn)
+    valid_projects=load_project_numbers(conn)
+    matcher=EmployeeMatcher(master_employees,conn)
+
+    files=find_timesheet_files(input_directory,args.start_year,args.end_year)
+    print(f"Total files found: {len(files)}")
+
+    time_rows=[]
+    rejects=[]
+    summary_rows=[]
+    reloaded=[] # workbooks of the batch, what they loaded last time is cleared before the upserts
+    totals={"files":0,"skipped":0,"time_entries":0,"non_billable_entries":0,"rejected":0}
+    months=set() # months written, their rollups are refreshed once after the last batch
+
+    def flush():
+        with conn:
+            for file in reloaded:
+                months.update(clear_reloaded(conn,file))
+            insert_project_rows(conn,time_rows,rejects)
+            insert_summary_rows(conn,summary_rows)
+        months.update(entry_months(time_rows,3)|entry_months(summary_rows,2))
+        totals["time_entries"]+=len(time_rows)
+        totals["non_billable_entries"]+=len(summary_rows)
+        totals["rejected"]+=len(rejects)
+        time_rows.clear()
+        reloaded.clear()
+        rejects.clear()
+        summary_rows.clear()
+
+    csv_output="Cleaned_Timekeeping" if args.csv else None
+    for file,employee_name,month_year,project_data,summary_data in cleaned_timesheets(files,input_directory,csv_output):
+        totals["files"]+=1
+        # same rule as load_test skipping *unknown* csvs
+        if "unknown" in f"{employee_name} {month_year}".lower():
+            totals["skipped"]+=1
+            continue
+        month_year=normalize_month_year(month_year)
+        employee_id=match_employee(employee_name,file,matcher)
+        if employee_id is None:
+            totals["skipped"]+=1
+            continue
+        reloaded.append(file)
+        rows,file_rejects=build_project_rows(project_data.reset_index(drop=True),employee_id,month_year,valid_projects,file)
+        time_rows.extend(with_source(rows,file))
+        rejects.extend(file_rejects)
+        if "non-billable" in summary_data.columns:
+            summary_rows.extend(with_source(build_summary_rows(summary_data,employee_id,month_year),file))
+        print(f"[Loaded] {file}: {employee_name}, {month_year}, {len(rows)} billable entries")
+        if len(time_rows)+len(summary_rows)>=args.batch_size:
+            flush()
+    flush()
+    with conn:
+        refresh_rollups(conn,months)
+    if totals["rejected"]:
+        logging.warning(f"{totals['rejected']} project rows rejected, see the rejected_rows table.")
+    conn.close()
+    # parquet snapshot for the dashboard, the years of the months written (not the folder years) or all of it after a rebuild
+    refresh_snapshot(db_path,None if args.rebuild else {int(m[:4]) for m in months},force=args.parquet)
+
+    print("\nPipeline Summary:")
+    print(f"Workbooks cleaned: {totals['files']}")
+    print(f"Workbooks skipped (unknown/unmatched employee): {totals['skipped']}")
+    print(f"Time entries upserted: {totals['time_entries']}")
+    print(f"Non-billable entries upserted: {totals['non_billable_entries']}")
+    print(f"Rejected project rows: {totals['rejected']}")
+
+if __name__=="__main__":
+    main()
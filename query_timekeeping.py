@@ -57,10 +57,11 @@ def query_top_employees(conn):
 
 def query_hours_by_employee_and_month(conn):
     query="""
-    SELECT E.name,strftime('%Y-%m',T.date) AS month,SUM(T.hours_worked) as billable_hours
-    FROM time_entries T
-    JOIN employees E ON T.employee_id=E.employee_id
-    GROUP BY E.name,month
+    SELECT E.name,R.month,SUM(R.billable_hours) as billable_hours
+    FROM monthly_employee_hours R
+    JOIN employees E ON R.employee_id=E.employee_id
+    WHERE R.billable_hours IS NOT NULL
+    GROUP BY E.name,R.month
     ORDER BY month,billable_hours DESC
     """
     df=pd.read_sql_query(query,conn)
@@ -92,8 +93,8 @@ def query_billable_vs_nonbillable_by_employee(conn):
 
 def query_top_projects_by_month(conn):
     query="""
-    SELECT strftime('%Y-%m',date) as month,project_no,SUM(hours_worked) as total_hours
-    FROM time_entries
+    SELECT month,project_no,SUM(hours) as total_hours
+    FROM monthly_project_hours
     GROUP BY month,project_no
     ORDER BY total_hours DESC
     LIMIT 10
@@ -141,6 +142,18 @@ def test(conn):
     print("\n=== Test ===")
     print(df)
 
+def query_rejected_projects(conn):
+    # project rows the loader skipped, grouped so unknown project numbers stand out
+    query="""
+    SELECT project_no,reason,COUNT(*) as rejected_rows,COUNT(DISTINCT source_file) as files,MIN(project_name) as example_name
+    FROM rejected_rows
+    GROUP BY project_no,reason
+    ORDER BY rejected_rows DESC
+    """
+    df=pd.read_sql_query(query,conn)
+    print("\n=== Rejected Project Rows ===")
+    print(df)
+
 def query_common_work_codes(conn):
     query="""
     SELECT work_code,COUNT(*) as frequency,SUM(hours_worked) as total_hours
@@ -154,12 +167,8 @@ def query_common_work_codes(conn):
 
 def query_company_monthly_trend(conn):
     query="""
-    SELECT strftime('%Y-%m',date) as month,SUM(hours_worked) as total_hours
-    FROM (
-        SELECT date,hours_worked FROM time_entries
-        UNION ALL
-        SELECT date,hours_worked FROM non_billable_entries
-    )
+    SELECT month,SUM(IFNULL(billable_hours,0)+IFNULL(non_billable_hours,0)) as total_hours
+    FROM monthly_employee_hours
     GROUP BY month
     ORDER BY month
     """
@@ -209,13 +218,13 @@ def query_weekend_entries(conn):
 
 def query_project_costs(conn):
     query = """
-    SELECT T.project_no,
+    SELECT R.project_no,
            P.project_name,
-           SUM(T.hours_worked * E.billable_rate) AS total_project_cost
-    FROM time_entries T
-    JOIN employees E ON T.employee_id = E.employee_id
-    JOIN projects P ON T.project_no = P.project_no
-    GROUP BY T.project_no, P.project_name
+           SUM(R.hours * E.billable_rate) AS total_project_cost
+    FROM monthly_project_hours R
+    JOIN employees E ON R.employee_id = E.employee_id
+    JOIN projects P ON R.project_no = P.project_no
+    GROUP BY R.project_no, P.project_name
     ORDER BY total_project_cost DESC
     """
     df = pd.read_sql_query(query, conn)
@@ -223,6 +232,27 @@ def query_project_costs(conn):
     print(df)
 
 
+def query_project_forecasts(conn):
+    # written by the dashboard's forecasting batch job: python -m analysis.forecasting --portfolio
+    exists=conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='project_forecasts'").fetchone()
+    if exists is None:
+        print("\n=== Project Forecasts ===\nno project_forecasts table yet")
+        return
+    query = """
+    SELECT F.project_no,
+           P.project_name,
+           F.month,
+           F.forecast_expenditure,
+           F.model
+    FROM project_forecasts F
+    LEFT JOIN projects P ON F.project_no = P.project_no
+    ORDER BY F.project_no, F.month
+    """
+    df = pd.read_sql_query(query, conn)
+    print("\n=== Project Forecasts (Expenditure by Project and Month) ===")
+    print(df)
+
+
 def main():
     db_path="timekeeping.db" # database path
     conn=sqlite3.connect(db_path)
@@ -237,6 +267,7 @@ def main():
     query_financial_data(conn)
     query_weekend_entries(conn)
     query_project_costs(conn)
+    query_project_forecasts(conn)
     query="""
     SELECT employee_id,billable_rate,position FROM employees
     """
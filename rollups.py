@@ -0,0 +1,109 @@
+import sys
+import sqlite3
+
+# monthly rollups of time_entries/non_billable_entries, so the dashboard and reports
+# read a few thousand employee-month/project-month rows instead of grouping every entry
+# monthly_employee_hours: billable/non-billable hours per employee per month,
+#     a column is NULL when the employee has no entries of that kind in the month
+# monthly_project_hours: billable hours per project per month per employee,
+#     cost is left to the reader (join employees) so a billable_rate change never leaves it stale
+# the loaders refresh only the months they wrote to, `python rollups.py` rebuilds everything
+
+def create_rollup_tables(conn):
+    cur=conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_employee_hours (
+        employee_id INTEGER,
+        month TEXT,
+        billable_hours REAL,
+        non_billable_hours REAL,
+        PRIMARY KEY (employee_id,month)
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_project_hours (
+        project_no TEXT,
+        month TEXT,
+        employee_id INTEGER,
+        hours REAL,
+        PRIMARY KEY (project_no,month,employee_id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_employee_hours_month ON monthly_employee_hours(month)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_project_hours_month ON monthly_project_hours(month)")
+    # a refresh of a few months reads only their date range of the entry tables
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_date ON time_entries(date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_non_billable_entries_date ON non_billable_entries(date)")
+    conn.commit()
+
+def drop_rollup_tables(conn):
+    conn.execute("DROP TABLE IF EXISTS monthly_employee_hours")
+    conn.execute("DROP TABLE IF EXISTS monthly_project_hours")
+    conn.commit()
+
+def month_range(month):
+    # 'YYYY-MM' -> (first day,first day of the next month) as iso dates, for date>=? AND date<?
+    year,mon=int(month[:4]),int(month[5:7])
+    return f"{month}-01",f"{year+mon//12:04d}-{mon%12+1:02d}-01"
+
+def refresh_rollups(conn,months=None):
+    # recompute the given 'YYYY-MM' months from the entry tables (all months if None)
+    # no commit here, the loaders run this inside the same transaction as the entries
+    if months is None:
+        def entries(table,cols):
+            return f"SELECT {cols},strftime('%Y-%m',date) AS month FROM {table}"
+        conn.execute("DELETE FROM monthly_employee_hours")
+        conn.execute("DELETE FROM monthly_project_hours")
+    else:
+        months=sorted(set(months))
+        if not months:
+            return
+        conn.execute("DROP TABLE IF EXISTS temp.rollup_months")
+        conn.execute("CREATE TEMP TABLE rollup_months (month TEXT PRIMARY KEY,month_start TEXT,month_end TEXT)")
+        conn.executemany("INSERT INTO temp.rollup_months VALUES (?,?,?)",[(m,*month_range(m)) for m in months])
+        # one date range per month, driven from rollup_months so the date indexes are used
+        # (strftime on the date column would scan the whole table every refresh)
+        def entries(table,cols):
+            return f"""SELECT {cols},r.month AS month FROM temp.rollup_months r
+                CROSS JOIN {table} e ON e.date>=r.month_start AND e.date<r.month_end"""
+        conn.execute("DELETE FROM monthly_employee_hours WHERE month IN (SELECT month FROM temp.rollup_months)")
+        conn.execute("DELETE FROM monthly_project_hours WHERE month IN (SELECT month FROM temp.rollup_months)")
+    conn.execute(f"""
+    INSERT INTO monthly_employee_hours(employee_id,month,billable_hours,non_billable_hours)
+    SELECT employee_id,month,SUM(billable),SUM(non_billable)
+    FROM (
+        {entries("time_entries","employee_id,hours_worked AS billable,NULL AS non_billable")}
+        UNION ALL
+        {entries("non_billable_entries","employee_id,NULL AS billable,hours_worked AS non_billable")}
+    )
+    WHERE month IS NOT NULL
+    GROUP BY employee_id,month
+    """)
+    conn.execute(f"""
+    INSERT INTO monthly_project_hours(project_no,month,employee_id,hours)
+    SELECT project_no,month,employee_id,SUM(hours_worked)
+    FROM ({entries("time_entries","project_no,employee_id,hours_worked")})
+    WHERE month IS NOT NULL
+    GROUP BY project_no,month,employee_id
+    """)
+    if months is not None:
+        conn.execute("DROP TABLE temp.rollup_months")
+
+def entry_months(rows,date_index):
+    # 'YYYY-MM' of every row about to be upserted, dates are iso strings
+    return {row[date_index][:7] for row in rows}
+
+def main():
+    db_path=sys.argv[1] if len(sys.argv)>1 else "timekeeping.db"
+    conn=sqlite3.connect(db_path)
+    create_rollup_tables(conn)
+    with conn:
+        refresh_rollups(conn)
+    employee_rows=conn.execute("SELECT COUNT(*) FROM monthly_employee_hours").fetchone()[0]
+    project_rows=conn.execute("SELECT COUNT(*) FROM monthly_project_hours").fetchone()[0]
+    conn.close()
+    print(f"monthly_employee_hours: {employee_rows} rows")
+    print(f"monthly_project_hours: {project_rows} rows")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import csv
+import json
+import numpy as np
+from time import perf_counter
+
+# machine readable run reports for clean_test.py and load_test.py, written to Processing_Summaries
+# next to the text summary: <name>.csv has one row per file (seconds in each stage, bytes read,
+# rows emitted), <name>.json has the run totals, p50/p95/p99 of every stage per year folder and the
+# slowest files. the stages are the script's own (read/header/parse/clean/write for the cleaning,
+# match/read/build/insert for the loading), so two runs of the same script can be diffed directly
+
+SLOWEST=20
+PERCENTILES=(50,95,99)
+
+class StageTimer:
+    # per file stage clock, lap(stage) charges the time since the last lap (or start) to stage
+    def __init__(self):
+        self.seconds={}
+        self.last=perf_counter()
+
+    def lap(self,stage):
+        now=perf_counter()
+        self.seconds[stage]=self.seconds.get(stage,0.0)+now-self.last
+        self.last=now
+
+def file_record(file,year,timings,bytes_read,rows,stages):
+    # one row of the report, stages missing from timings (e.g. a file with nothing to write) count as 0
+    record={"file":file,"year":str(year),"bytes_read":int(bytes_read),"rows":int(rows)}
+    for stage in stages:
+        record[stage]=round(timings.get(stage,0.0),6)
+    record["total"]=round(sum(record[stage] for stage in stages),6)
+    return record
+
+def stage_percentiles(records,stages):
+    # {stage:{"sum","p50","p95","p99"}} over records, "total" included
+    seconds={}
+    for stage in list(stages)+["total"]:
+        values=np.array([r[stage] for r in records],dtype=float)
+        entry={"sum":round(float(values.sum()),3)}
+        for p,value in zip(PERCENTILES,np.percentile(values,PERCENTILES) if len(values) else [0.0]*len(PERCENTILES)):
+            entry[f"p{p}"]=round(float(value),6)
+        seconds[stage]=entry
+    return seconds
+
+def build_report(records,stages,run):
+    by_year={}
+    for record in records:
+        by_year.setdefault(record["year"],[]).append(record)
+    def totals(rows):
+        return {"files":len(rows),
+            "bytes_read":sum(r["bytes_read"] for r in rows),
+            "rows":sum(r["rows"] for r in rows),
+            "seconds":stage_percentiles(rows,stages)}
+    return {"run":run,
+        "stages":list(stages),
+        "totals":totals(records),
+        "years":{year:totals(rows) for year,rows in sorted(by_year.items())},
+        "slowest":sorted(records,key=lambda r:-r["total"])[:SLOWEST]}
+
+def write_run_report(folder,name,records,stages,run):
+    # writes folder/name.json and folder/name.csv, returns their paths
+    os.makedirs(folder,exist_ok=True)
+    json_path=os.path.join(folder,f"{name}.json")
+    csv_path=os.path.join(folder,f"{name}.csv")
+    with open(json_path,"w") as f:
+        json.dump(build_report(records,stages,run),f,indent=1)
+    with open(csv_path,"w",newline="") as f:
+        writer=csv.DictWriter(f,fieldnames=["file","year","bytes_read","rows"]+list(stages)+["total"])
+        writer.writeheader()
+        writer.writerows(records)
+    return json_path,csv_path
+
+def report_lines(records,stages):
+    # the per stage totals and percentiles over the whole run, for the text summary
+    if not records:
+        return []
+    lines=["Per file seconds (sum, p50/p95/p99):"]
+    for stage,entry in stage_percentiles(records,stages).items():
+        lines.append(f"  {stage}: {entry['sum']:.1f}s, {entry['p50']*1000:.0f}/{entry['p95']*1000:.0f}/{entry['p99']*1000:.0f} ms")
+    return lines
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# run from the repo root: python small_tasks/benchmark_burnout.py [rows]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..","Dashboard")))
+from analysis.burnout import compute_daily_summary,compute_employee_totals,compute_monthly_hours,score_burnout
+
+# times the old row by row burnout functions against the vectorized ones on a synthetic
+# time_entries table, and checks both give the same scores
+rows=int(sys.argv[1]) if len(sys.argv)>1 else 3000000
+baselines=[150.0,160.0,170.0]
+
+# the functions as they were, .apply(lambda) per row and regrouping df_time for every baseline
+def old_compute_daily_summary(df):
+    df_daily=df.groupby(['employee_id','name','date']).agg({'hours_worked':'sum'}).reset_index()
+    df_daily['overtime']=df_daily['hours_worked'].apply(lambda x:max(0,x-8))
+    df_daily['weekday']=df_daily['date'].dt.dayofweek
+    df_daily['is_weekend']=df_daily['weekday']>=5
+    return df_daily
+
+def old_compute_monthly_excess(df,baseline=7.5*5*4):
+    df_monthly=df.copy()
+    df_monthly['month']=df_monthly['date'].dt.to_period("M").astype(str)
+    monthly_hours=df_monthly.groupby(['employee_id','name','month'])['hours_worked'].sum().reset_index()
+    monthly_hours['excess']=monthly_hours['hours_worked'].apply(lambda x:max(0,x-baseline))
+    avg_excess=monthly_hours.groupby(['employee_id','name'])['excess'].mean().reset_index()
+    avg_excess=avg_excess.rename(columns={'excess':'avg_monthly_excess'})
+    return avg_excess
+
+def old_compute_burnout_metrics(df_daily,df_time,baseline=7.5*5*4):
+    agg_metrics=df_daily.groupby(['employee_id','name']).agg(
+        total_days=('date','nunique'),
+        total_hours=('hours_worked','sum'),
+        total_overtime=('overtime','sum'),
+        weekend_days=('is_weekend','sum')
+    ).reset_index()
+    agg_metrics['avg_daily_hours']=agg_metrics['total_hours']/agg_metrics['total_days']
+    agg_metrics['avg_daily_overtime']=agg_metrics['total_overtime']/agg_metrics['total_days']
+    agg_metrics['weekend_frequency']=agg_metrics['weekend_days']/agg_metrics['total_days']
+    avg_excess=old_compute_monthly_excess(df_time,baseline)
+    agg_metrics=agg_metrics.merge(avg_excess,on=["employee_id","name"],how="left")
+    agg_metrics['avg_monthly_excess']=agg_metrics['avg_monthly_excess'].fillna(0)
+    agg_metrics['burnout_score']=(
+         agg_metrics['avg_daily_overtime']+
+         (agg_metrics['weekend_frequency']*2)+
+         (agg_metrics['avg_monthly_excess']/50)+
+         (agg_metrics['total_days']/10000)
+    )
+    mean=agg_metrics["burnout_score"].mean()
+    std=agg_metrics["burnout_score"].std()
+    agg_metrics["z_burnout"]=(agg_metrics["burnout_score"]-mean)/std
+    agg_metrics["burnout_plus"]=(agg_metrics["z_burnout"]*15+100).round(1)
+    return agg_metrics
+
+def synthetic_time_entries(n,employees=120,seed=353):
+    # a few entries per employee per day (several projects), half hour hours, 2004-2025
+    rng=np.random.default_rng(seed)
+    days=pd.date_range("2004-01-01","2025-12-31",freq="D").to_numpy()
+    employee_id=rng.integers(1,employees+1,n)
+    return pd.DataFrame({
+        'employee_id':employee_id,
+        'name':pd.Series(employee_id).map(lambda e:f"Employee {e}").to_numpy(),
+        'date':days[rng.integers(0,len(days),n)],
+        'hours_worked':rng.integers(1,17,n)/2,
+    })
+
+def timed(label,func):
+    start=time.perf_counter()
+    result=func()
+    elapsed=time.perf_counter()-start
+    print(f"{label:<45}{elapsed:>8.2f}s")
+    return result,elapsed
+
+print(f"Synthetic time_entries: {rows:,} rows")
+df_time=synthetic_time_entries(rows)
+
+print("\nFull computation (first load):")
+def old_first():
+    df_daily=old_compute_daily_summary(df_time)
+    return df_daily,old_compute_burnout_metrics(df_daily,df_time,baselines[0])
+(old_daily,old_result),old_full=timed("old",old_first)
+def new_first():
+    df_daily=compute_daily_summary(df_time)
+    totals,monthly_hours=compute_employee_totals(df_daily),compute_monthly_hours(df_daily)
+    return totals,monthly_hours,score_burnout(totals,monthly_hours,baselines[0])
+(totals,monthly_hours,new_result),new_full=timed("new",new_first)
+
+print("\nBaseline change (old regroups df_time, new rescores the cached totals):")
+old_results,old_rescore=timed(f"old x{len(baselines)}",lambda:[old_compute_burnout_metrics(old_daily,df_time,b) for b in baselines])
+new_results,new_rescore=timed(f"new x{len(baselines)}",lambda:[score_burnout(totals,monthly_hours,b) for b in baselines])
+
+columns=['employee_id','name','total_days','total_hours','total_overtime','weekend_days','avg_monthly_excess','burnout_score','burnout_plus']
+mismatches=0
+for old,new in zip([old_result]+old_results,[new_result]+new_results):
+    try:
+        pd.testing.assert_frame_equal(old[columns].reset_index(drop=True),new[columns].reset_index(drop=True),check_dtype=False)
+    except AssertionError as e:
+        mismatches+=1
+        print(e)
+
+print("\nBurnout benchmark summary:")
+print(f"First load speedup: {old_full/new_full:.1f}x")
+print(f"Baseline change speedup: {old_rescore/new_rescore:.1f}x")
+print(f"Result mismatches: {mismatches}")
+sys.exit(1 if mismatches else 0)
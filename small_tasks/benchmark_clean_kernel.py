@@ -0,0 +1,146 @@
+import os
+import re
+import sys
+import time
+import random
+import filecmp
+import tempfile
+import pandas as pd
+
+# run from the repo root: python small_tasks/benchmark_clean_kernel.py [sample_size]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
+import clean_test
+from clean_test import (parse_hours,parse_hours_block,count_numeric_cells,drop_if_both_empty,
+    read_raw_sheet,frame_from_raw,process_file,find_timesheet_files)
+
+# times the cleaning stages of clean_test (header detection, hours parsing, dropping rows with
+# no project) cell by cell the way they used to run against the vectorized kernel, on the raw
+# grids of a sample of timesheets read up front, checks each stage gives the same result, then
+# runs process_file over the sample and compares the csvs with the existing Cleaned_Timekeeping.
+# a csv that differs is cleaned again with the per cell stages, if that differs too it isnt the
+# kernel (e.g. two timesheets in a folder writing the same csv) and is counted separately
+input_directory="Timekeeping"
+cleaned_directory="Cleaned_Timekeeping"
+sample_size=int(sys.argv[1]) if len(sys.argv)>1 else 200
+
+# the per cell versions, as they were in clean_test
+def old_header_count(row):
+    return sum(1 for cell in row if re.match(r'^\d+$',str(cell).strip()))
+
+def old_parse(df,hour_cols):
+    df=df.copy()
+    for c in hour_cols:
+        df[c]=df[c].apply(parse_hours)
+    return df
+
+def old_parse_block(block):
+    return block.apply(lambda col:col.apply(parse_hours)).to_numpy(dtype=float)
+
+def new_parse(df,hour_cols):
+    df=df.copy()
+    df[hour_cols]=parse_hours_block(df[hour_cols])
+    return df
+
+def old_drop_if_both_empty(df_in):
+    if df_in.empty:
+        return df_in
+    def is_invalid(val):
+        if pd.isnull(val):
+            return True
+        return str(val).strip() in ["","0","0.0"]
+    mask=~(df_in["PROJECT NO"].apply(is_invalid)&df_in["PROJECT NAME"].apply(is_invalid))
+    return df_in[mask].copy()
+
+def table_frame(df_raw):
+    # the timecard table as clean_workbook names it, before parsing
+    header_row=3 if df_raw.shape[0]>3 and count_numeric_cells(df_raw.iloc[3])>=5 else 4
+    df=frame_from_raw(df_raw,header_row).iloc[:,:36]
+    expected_cols=["PROJECT NO","PROJECT NAME","WORK CODE"]+[str(i) for i in range(1,32)]+["TOTAL","DESCRIPTION / COMMENTS"]
+    df.columns=expected_cols[:df.shape[1]]
+    return df
+
+def timed(func,items):
+    start=time.perf_counter()
+    results=[func(*item) for item in items]
+    return results,time.perf_counter()-start
+
+all_files=find_timesheet_files(input_directory)
+random.seed(353)
+sample=random.sample(all_files,min(sample_size,len(all_files)))
+
+grids=[]
+for file in sample:
+    try:
+        grids.append(read_raw_sheet(file))
+    except Exception as e:
+        print(f"skipping {file}: {e}")
+header_rows=[(g.iloc[3],) for g in grids if g.shape[0]>3]
+tables=[table_frame(g) for g in grids]
+parse_items=[(t,[c for c in t.columns if c.isdigit()]+(["TOTAL"] if "TOTAL" in t.columns else [])) for t in tables]
+keyed=[(t,) for t in tables if {"PROJECT NO","PROJECT NAME"}<=set(t.columns)]
+cells=sum(t.shape[0]*len(cols) for t,cols in parse_items)
+
+stages=[]
+mismatches=[]
+def compare_stage(name,old_func,new_func,items,check):
+    old,old_time=timed(old_func,items)
+    new,new_time=timed(new_func,items)
+    bad=sum(1 for a,b in zip(old,new) if not check(a,b))
+    stages.append((name,len(items),old_time,new_time,bad))
+    if bad:
+        mismatches.append(f"{name}: {bad} frames differ")
+
+def same_frame(a,b):
+    try:
+        pd.testing.assert_frame_equal(a,b,check_dtype=False,check_exact=True)
+        return True
+    except AssertionError:
+        return False
+
+compare_stage("header detection",old_header_count,count_numeric_cells,header_rows,lambda a,b:a==b)
+compare_stage("hours parsing",old_parse,new_parse,parse_items,same_frame)
+compare_stage("drop rows with no project",old_drop_if_both_empty,drop_if_both_empty,keyed,same_frame)
+
+def differing_outputs(file,out_base):
+    # outputs of file that arent byte for byte the csv in the corpus
+    outputs=process_file(file,input_directory,out_base)["outputs"]
+    return outputs,[rel for rel in outputs if not os.path.exists(os.path.join(cleaned_directory,rel))
+        or not filecmp.cmp(os.path.join(out_base,rel),os.path.join(cleaned_directory,rel),shallow=False)]
+
+def per_cell_outputs(file,out_base):
+    kernel=(clean_test.parse_hours_block,clean_test.count_numeric_cells,clean_test.drop_if_both_empty)
+    clean_test.parse_hours_block,clean_test.count_numeric_cells,clean_test.drop_if_both_empty=old_parse_block,old_header_count,old_drop_if_both_empty
+    try:
+        return differing_outputs(file,out_base)[1]
+    finally:
+        clean_test.parse_hours_block,clean_test.count_numeric_cells,clean_test.drop_if_both_empty=kernel
+
+# whole files against the corpus the old code wrote
+compared=0
+differed_before=[]
+with tempfile.TemporaryDirectory() as tmp:
+    for file in sample:
+        try:
+            outputs,differing=differing_outputs(file,os.path.join(tmp,"new"))
+        except Exception:
+            continue # errored before too, nothing was written for it
+        compared+=len(outputs)
+        if differing:
+            before=per_cell_outputs(file,os.path.join(tmp,"old"))
+            for rel in differing:
+                if rel in before:
+                    differed_before.append(rel)
+                else:
+                    mismatches.append(f"differs: {rel}")
+
+print("\nCleaning kernel benchmark:")
+print(f"Files sampled: {len(sample)}, hour cells: {cells:,}")
+print(f"{'stage':<28}{'frames':>8}{'per cell':>12}{'vectorized':>12}{'speedup':>9}{'diff':>6}")
+for name,n,old_time,new_time,bad in stages:
+    print(f"{name:<28}{n:>8}{old_time:>11.3f}s{new_time:>11.3f}s{old_time/new_time:>8.1f}x{bad:>6}")
+print(f"Output csvs compared with {cleaned_directory}: {compared}")
+print(f"Differing with the per cell stages too (not the kernel): {len(differed_before)}")
+print(f"Mismatches: {len(mismatches)}")
+for m in mismatches:
+    print("  ",m)
+sys.exit(1 if mismatches else 0)
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# run from the repo root: python small_tasks/benchmark_parquet.py [rows]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
+from export_parquet import export_snapshot,snapshot_dir
+from rollups import create_rollup_tables,refresh_rollups
+
+# times reading time_entries the way the analysis loaders did (pd.read_sql + pd.to_datetime)
+# against the parquet snapshot (all years, and one year), on a synthetic db, and checks they agree
+rows=int(sys.argv[1]) if len(sys.argv)>1 else 3000000
+
+def synthetic_db(path,n,employees=120,seed=353):
+    rng=np.random.default_rng(seed)
+    days=pd.date_range("2004-01-01","2025-12-31",freq="D").strftime("%Y-%m-%d").to_numpy()
+    df=pd.DataFrame({
+        'employee_id':rng.integers(1,employees+1,n),
+        'project_no':np.char.add("P",rng.integers(1000,3000,n).astype(str)),
+        'work_code':rng.choice(["BP","DP","CD","CA","WD"],n),
+        'date':days[rng.integers(0,len(days),n)],
+        'hours_worked':rng.integers(1,17,n)/2,
+    })
+    conn=sqlite3.connect(path)
+    conn.execute("""CREATE TABLE time_entries (entry_id INTEGER PRIMARY KEY AUTOINCREMENT,employee_id INTEGER,
+        project_no TEXT,work_code TEXT,date DATE,hours_worked DECIMAL)""")
+    conn.execute("CREATE TABLE non_billable_entries (entry_id INTEGER PRIMARY KEY AUTOINCREMENT,employee_id INTEGER,category TEXT,date DATE,hours_worked DECIMAL)")
+    conn.executemany("INSERT INTO time_entries(employee_id,project_no,work_code,date,hours_worked) VALUES (?,?,?,?,?)",
+        df.itertuples(index=False,name=None))
+    create_rollup_tables(conn)
+    with conn:
+        refresh_rollups(conn)
+    conn.commit()
+    conn.close()
+
+def timed(label,func):
+    start=time.perf_counter()
+    result=func()
+    elapsed=time.perf_counter()-start
+    print(f"{label:<45}{elapsed:>8.2f}s")
+    return result,elapsed
+
+def read_sqlite(db_path,year=None):
+    conn=sqlite3.connect(db_path)
+    sql="SELECT employee_id,project_no,work_code,date,hours_worked FROM time_entries"
+    params=()
+    if year is not None:
+        sql+=" WHERE CAST(substr(date,1,4) AS INTEGER)=?"
+        params=(year,)
+    df=pd.read_sql_query(sql,conn,params=params)
+    conn.close()
+    df['date']=pd.to_datetime(df['date'])
+    return df
+
+def read_parquet(db_path,year=None):
+    # same call as utils.data.read_snapshot
+    filters=[("year","in",[year])] if year is not None else None
+    table=pq.read_table(os.path.join(snapshot_dir(db_path),"time_entries"),columns=["employee_id","project_no","work_code","date","hours_worked"],
+        filters=filters,memory_map=True,partitioning="hive")
+    return table.to_pandas(date_as_object=False,split_blocks=True,self_destruct=True)
+
+workdir=tempfile.mkdtemp()
+try:
+    db_path=os.path.join(workdir,"timekeeping.db")
+    print(f"Synthetic time_entries: {rows:,} rows")
+    synthetic_db(db_path,rows)
+    _,export_time=timed("export snapshot",lambda:export_snapshot(db_path))
+
+    print("\nAll years:")
+    old,old_all=timed("sqlite read_sql + to_datetime",lambda:read_sqlite(db_path))
+    new,new_all=timed("parquet snapshot",lambda:read_parquet(db_path))
+    print("\nOne year (2015):")
+    old_year,old_one=timed("sqlite read_sql + to_datetime",lambda:read_sqlite(db_path,2015))
+    new_year,new_one=timed("parquet snapshot",lambda:read_parquet(db_path,2015))
+
+    mismatches=0
+    for a,b in [(old,new),(old_year,new_year)]:
+        a=a.sort_values(list(a.columns),ignore_index=True)
+        b=b.astype({'project_no':object,'work_code':object,'hours_worked':'float64','date':'datetime64[ns]'}).sort_values(list(a.columns),ignore_index=True)
+        try:
+            pd.testing.assert_frame_equal(a,b,check_dtype=False)
+        except AssertionError as e:
+            mismatches+=1
+            print(e)
+
+    print("\nParquet benchmark summary:")
+    print(f"Memory: sqlite frame {old.memory_usage(deep=True).sum()/2**20:.0f} MiB, snapshot frame {new.memory_usage(deep=True).sum()/2**20:.0f} MiB")
+    print(f"All years speedup: {old_all/new_all:.1f}x")
+    print(f"One year speedup: {old_one/new_one:.1f}x")
+    print(f"Result mismatches: {mismatches}")
+finally:
+    shutil.rmtree(workdir)
+sys.exit(1 if mismatches else 0)
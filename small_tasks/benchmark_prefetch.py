@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import random
+import filecmp
+import tempfile
+
+# run from the repo root: python small_tasks/benchmark_prefetch.py [sample_size] [latency_ms]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
+import clean_test
+from clean_test import run_serial,run_pipeline,pipeline_stages,find_timesheet_files
+
+# cleans a sample of timesheets with the one at a time loop (run_serial) and the prefetch pipeline
+# (run_pipeline), with latency_ms added to every workbook read to stand in for the network share,
+# and checks both write the same csvs
+input_directory="Timekeeping"
+sample_size=int(sys.argv[1]) if len(sys.argv)>1 else 200
+latency=(float(sys.argv[2]) if len(sys.argv)>2 else 20)/1000
+
+all_files=find_timesheet_files(input_directory)
+random.seed(353)
+sample=random.sample(all_files,min(sample_size,len(all_files)))
+
+# a sleep releases the gil like waiting on the network does (it isnt in the read stage's busy time)
+read_raw_sheet=clean_test.read_raw_sheet
+read_bytes=clean_test.read_bytes
+def slow_read_raw_sheet(file_path,*args,**kwargs):
+    time.sleep(latency)
+    return read_raw_sheet(file_path,*args,**kwargs)
+def slow_read_bytes(file_path,stats):
+    time.sleep(latency)
+    return read_bytes(file_path,stats)
+
+def list_outputs(base):
+    found=set()
+    for root,dirs,files in os.walk(base):
+        for name in files:
+            found.add(os.path.relpath(os.path.join(root,name),base))
+    return found
+
+mismatches=[]
+with tempfile.TemporaryDirectory() as tmp:
+    serial_base=os.path.join(tmp,"serial")
+    pipeline_base=os.path.join(tmp,"pipeline")
+
+    clean_test.read_raw_sheet=slow_read_raw_sheet
+    start=time.perf_counter()
+    serial_results=list(run_serial(sample,input_directory,serial_base,{}))
+    serial_time=time.perf_counter()-start
+    clean_test.read_raw_sheet=read_raw_sheet
+
+    clean_test.read_bytes=slow_read_bytes
+    stages=pipeline_stages()
+    start=time.perf_counter()
+    pipeline_results=list(run_pipeline(sample,input_directory,pipeline_base,{},stages))
+    pipeline_time=time.perf_counter()-start
+    clean_test.read_bytes=read_bytes
+
+    # same files, same order, same errors
+    if [(f,e is None) for f,m,e in serial_results]!=[(f,e is None) for f,m,e in pipeline_results]:
+        mismatches.append("results differ in order or errors")
+    serial_files=list_outputs(serial_base)
+    pipeline_files=list_outputs(pipeline_base)
+    for rel in sorted(serial_files^pipeline_files):
+        mismatches.append(f"only in {'serial' if rel in serial_files else 'pipeline'}: {rel}")
+    for rel in sorted(serial_files&pipeline_files):
+        if not filecmp.cmp(os.path.join(serial_base,rel),os.path.join(pipeline_base,rel),shallow=False):
+            mismatches.append(f"differs: {rel}")
+
+print("\nPrefetch pipeline benchmark:")
+print(f"Files sampled: {len(sample)}, added read latency: {latency*1000:.0f} ms")
+print(f"One at a time: {serial_time:.1f}s ({len(sample)/serial_time:.1f} files/s)")
+print(f"Pipeline: {pipeline_time:.1f}s ({len(sample)/pipeline_time:.1f} files/s), {serial_time/pipeline_time:.2f}x")
+for stage in stages.values():
+    print("  ",stage.summary())
+print(f"Output csvs compared: {len(serial_files&pipeline_files)}")
+print(f"Mismatches: {len(mismatches)}")
+for m in mismatches:
+    print("  ",m)
+sys.exit(1 if mismatches else 0)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import random
+import filecmp
+import resource
+import tempfile
+import functools
+import statistics
+import multiprocessing
+import pandas as pd
+
+# run from the repo root: python small_tasks/benchmark_readers.py [files_per_year]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
+import clean_test
+from clean_test import read_raw_sheet,process_file,find_timesheet_files,READ_COLS
+
+# compares the capped readers (openpyxl read only, xlrd on_demand) with the old full read_excel:
+# per file parse time and peak RSS for a sample of every year folder, each year and reader in a
+# fresh process so the RSS of one doesnt carry into the other. then checks the grids agree on the
+# first READ_COLS columns and process_file writes the same csvs with either reader
+input_directory="Timekeeping"
+per_year=int(sys.argv[1]) if len(sys.argv)>1 else 10
+READERS=("pandas","capped")
+
+def rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024 # kB on linux
+
+def time_reader(files,reader):
+    # runs in its own process, returns per file seconds, RSS before the first file and the peak
+    start_rss=rss_mib()
+    times=[]
+    for file in files:
+        start=time.perf_counter()
+        try:
+            read_raw_sheet(file,reader=reader)
+        except Exception:
+            continue
+        times.append(time.perf_counter()-start)
+    return times,start_rss,rss_mib()
+
+def comparable(df):
+    # the grid as the cleaning sees it: READ_COLS columns, no trailing empty rows
+    df=df.reindex(columns=range(READ_COLS))
+    filled=df.notna().any(axis=1).to_numpy()
+    last=filled.nonzero()[0].max()+1 if filled.any() else 0
+    return df.iloc[:last]
+
+def main():
+    # the per year runs are spawned processes, which import this file, so the work is under main
+    all_files=find_timesheet_files(input_directory)
+    by_year={}
+    for file in all_files:
+        by_year.setdefault(os.path.relpath(file,input_directory).split(os.sep)[0],[]).append(file)
+    random.seed(353)
+    samples={year:random.sample(files,min(per_year,len(files))) for year,files in sorted(by_year.items())}
+
+    results={}
+    context=multiprocessing.get_context("spawn")
+    for year,files in samples.items():
+        for reader in READERS:
+            with context.Pool(1) as pool:
+                results[year,reader]=pool.apply(time_reader,(files,reader))
+
+    mismatches=[]
+    grids=0
+    compared=0
+    with tempfile.TemporaryDirectory() as tmp:
+        for year,files in samples.items():
+            for file in files:
+                try:
+                    old=read_raw_sheet(file,reader="pandas")
+                except Exception:
+                    continue
+                new=read_raw_sheet(file)
+                grids+=1
+                try:
+                    pd.testing.assert_frame_equal(comparable(new),comparable(old),check_dtype=False,check_exact=True)
+                except AssertionError:
+                    mismatches.append(f"grid differs: {file}")
+                outputs={}
+                for reader in READERS:
+                    clean_test.read_raw_sheet=functools.partial(read_raw_sheet,reader=reader)
+                    try:
+                        outputs[reader]=process_file(file,input_directory,os.path.join(tmp,reader))["outputs"]
+                    except Exception as e:
+                        outputs[reader]=f"error: {e}"
+                    finally:
+                        clean_test.read_raw_sheet=read_raw_sheet
+                if outputs["pandas"]!=outputs["capped"]:
+                    mismatches.append(f"outputs differ: {file}")
+                    continue
+                for rel in outputs["capped"] if isinstance(outputs["capped"],list) else []:
+                    compared+=1
+                    if not filecmp.cmp(os.path.join(tmp,"pandas",rel),os.path.join(tmp,"capped",rel),shallow=False):
+                        mismatches.append(f"csv differs: {rel}")
+
+    print("\nReader benchmark (median ms per file, peak RSS MiB):")
+    print(f"{'year':<6}{'files':>6}{'pandas':>10}{'capped':>10}{'speedup':>9}{'pandas RSS':>12}{'capped RSS':>12}")
+    totals={reader:[] for reader in READERS}
+    for year,files in samples.items():
+        row={}
+        for reader in READERS:
+            times,start_rss,peak_rss=results[year,reader]
+            totals[reader]+=times
+            row[reader]=(statistics.median(times)*1000 if times else float("nan"),peak_rss)
+        print(f"{year:<6}{len(files):>6}{row['pandas'][0]:>10.1f}{row['capped'][0]:>10.1f}{row['pandas'][0]/row['capped'][0]:>8.1f}x"
+            f"{row['pandas'][1]:>12.0f}{row['capped'][1]:>12.0f}")
+    print(f"Total read time: pandas {sum(totals['pandas']):.1f}s, capped {sum(totals['capped']):.1f}s "
+        f"({sum(totals['pandas'])/sum(totals['capped']):.1f}x)")
+    print(f"Peak RSS over all years: pandas {max(results[k][2] for k in results if k[1]=='pandas'):.0f} MiB, "
+        f"capped {max(results[k][2] for k in results if k[1]=='capped'):.0f} MiB "
+        f"(fresh process after imports: {min(results[k][1] for k in results):.0f} MiB)")
+    print(f"Grids compared: {grids}, output csvs compared: {compared}")
+    print(f"Mismatches: {len(mismatches)}")
+    for m in mismatches:
+        print("  ",m)
+    return 1 if mismatches else 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import os
+import sys
+import random
+import filecmp
+import tempfile
+
+# run from the repo root: python small_tasks/compare_single_parse.py [sample_size]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
+from clean_test import process_file,find_timesheet_files
+
+# runs the old 3-read path (uncapped read_excel) and the single-parse path (capped reader) over a sample of timesheets
+# and checks the cleaned csvs come out byte for byte the same
+input_directory="Timekeeping"
+sample_size=int(sys.argv[1]) if len(sys.argv)>1 else 200
+
+all_files=find_timesheet_files(input_directory)
+random.seed(353)
+sample=random.sample(all_files,min(sample_size,len(all_files)))
+
+def list_outputs(base):
+    found=set()
+    for root,dirs,files in os.walk(base):
+        for name in files:
+            found.add(os.path.relpath(os.path.join(root,name),base))
+    return found
+
+mismatches=[]
+errors_both=0
+with tempfile.TemporaryDirectory() as tmp:
+    old_base=os.path.join(tmp,"old")
+    new_base=os.path.join(tmp,"new")
+    for file in sample:
+        results=[]
+        for out_base,single in ((old_base,False),(new_base,True)):
+            try:
+                process_file(file,input_directory,out_base,single_parse=single)
+                results.append("ok")
+            except Exception as e:
+                results.append(f"error: {e}")
+        if results[0]!=results[1]:
+            mismatches.append(f"{file}: old {results[0]} | new {results[1]}")
+        elif results[0]!="ok":
+            errors_both+=1
+
+    old_files=list_outputs(old_base)
+    new_files=list_outputs(new_base)
+    for rel in sorted(old_files^new_files):
+        mismatches.append(f"only in {'old' if rel in old_files else 'new'}: {rel}")
+    for rel in sorted(old_files&new_files):
+        if not filecmp.cmp(os.path.join(old_base,rel),os.path.join(new_base,rel),shallow=False):
+            mismatches.append(f"differs: {rel}")
+
+print("\nSingle parse comparison:")
+print(f"Files sampled: {len(sample)}")
+print(f"Files that errored in both paths: {errors_both}")
+print(f"Output csvs compared: {len(old_files&new_files)}")
+print(f"Mismatches: {len(mismatches)}")
+for m in mismatches:
+    print("  ",m)
+sys.exit(1 if mismatches else 0)
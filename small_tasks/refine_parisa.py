@@ -1,11 +1,22 @@
+import os
+import sys
 import sqlite3
 import pandas as pd
 
-conn=sqlite3.connect('timekeeping.db')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
+from employee_matching import create_alias_table,add_alias
+from load_test import NATURAL_KEYS
+from rollups import refresh_rollups
+from export_parquet import refresh_snapshot
+
+db_path='timekeeping.db'
+conn=sqlite3.connect(db_path)
+# created up front, create_alias_table commits and the merge below is one transaction
+create_alias_table(conn)
 cur=conn.cursor()
 
-paria=pd.read_sql_query("SELECT employee_id FROM employees WHERE name LIKE '%Paria Moghaddam%';",conn)
-parisa=pd.read_sql_query("SELECT employee_id FROM employees WHERE name LIKE '%Parisa Moghaddam%';",conn)
+paria=pd.read_sql_query("SELECT employee_id,name FROM employees WHERE name LIKE '%Paria Moghaddam%';",conn)
+parisa=pd.read_sql_query("SELECT employee_id,name FROM employees WHERE name LIKE '%Parisa Moghaddam%';",conn)
 
 if paria.empty or parisa.empty:
     raise ValueError("Could not find both Paria and Parisa in employees table.")
@@ -15,11 +26,31 @@ parisa_id=int(parisa.employee_id.iloc[0])
 print(f"Paria ID:{paria_id}")
 print(f"Parisa ID:{parisa_id}")
 
-cur.execute("UPDATE time_entries SET employee_id=? WHERE employee_id=?;",(paria_id,parisa_id))
-cur.execute("UPDATE non_billable_entries SET employee_id=? WHERE employee_id=?;",(paria_id,parisa_id))
+# months with Parisa's hours, their rollups still carry her id until refreshed
+months={row[0] for table in NATURAL_KEYS
+    for row in cur.execute(f"SELECT DISTINCT substr(date,1,7) FROM {table} WHERE employee_id=? AND date IS NOT NULL",(parisa_id,))}
+
+# the natural keys are unique, so a day Paria already has a row for (same project/work code or category)
+# is added into Paria's row and Parisa's copy deleted, then the rest are re-pointed
+for table,(index_name,key_cols) in NATURAL_KEYS.items():
+    rest=[c for c in key_cols if c!="employee_id"]
+    same_key=" AND ".join(f"p.{c}=s.{c}" for c in rest)
+    collides=f"EXISTS (SELECT 1 FROM {table} p WHERE p.employee_id=? AND {same_key})"
+    cur.execute(f"""INSERT INTO {table}({','.join(key_cols)},hours_worked)
+        SELECT ?,{','.join(rest)},hours_worked FROM {table} s WHERE s.employee_id=? AND {collides}
+        ON CONFLICT({','.join(key_cols)}) DO UPDATE SET hours_worked=hours_worked+excluded.hours_worked""",(paria_id,parisa_id,paria_id))
+    cur.execute(f"DELETE FROM {table} WHERE employee_id=? AND entry_id IN (SELECT s.entry_id FROM {table} s WHERE s.employee_id=? AND {collides})",
+        (parisa_id,parisa_id,paria_id))
+    print(f"{table}: {cur.rowcount} rows added into Paria's")
+    cur.execute(f"UPDATE {table} SET employee_id=? WHERE employee_id=?;",(paria_id,parisa_id))
 cur.execute("DELETE FROM employees WHERE employee_id=?;",(parisa_id,))
+# remember the merge so later loads resolve Parisa straight to Paria
+add_alias(conn,parisa.name.iloc[0],paria.name.iloc[0])
+refresh_rollups(conn,months)
 
 conn.commit()
 conn.close()
+# parquet snapshot (if there is one) for the years touched
+refresh_snapshot(db_path,{int(m[:4]) for m in months})
 
 print("Merged Parisa into Paria and removed duplicate record.")